@@ -5,13 +5,22 @@ import plotly.graph_objects as go
 from datetime import datetime, timedelta
 from database import (
     init_db, get_all_users, get_user_by_name, 
-    get_all_tasks, create_task, get_user_tasks, 
+    get_all_tasks, iter_tasks, create_task, get_user_tasks, 
     apply_for_task, get_task_applications,
     accept_application, complete_task,
-    submit_review, get_reviews_for_user, check_review_status
+    submit_review, get_reviews_for_user, check_review_statuses,
+    get_platform_stats, get_recommendations,
+    new_idempotency_key, get_idempotent_result, start_idempotency_sweeper
 )
 from matching_engine import MatchingEngine
 from ai_service import AIService
+from config import Config
+import availability
+import matching_config
+import query_profiler
+import recommendation_worker
+import semantic
+import tracing
 
 # 頁面配置
 st.set_page_config(
@@ -141,12 +150,52 @@ st.markdown("""
 # 初始化資料庫
 init_db()
 
+# 推薦清單背景更新（RECOMMENDATION_WORKER=1 時啟用，整個伺服器行程只啟動一次）
+@st.cache_resource
+def start_recommendation_worker():
+    return recommendation_worker.start_background_worker()
+
+if Config.RECOMMENDATION_WORKER:
+    start_recommendation_worker()
+
+# 監看媒合設定檔（MATCHING_CONFIG_PATH），存檔後不必重啟即可套用新權重
+@st.cache_resource
+def start_matching_config_watcher():
+    return matching_config.start_watcher()
+
+start_matching_config_watcher()
+
+# 定期清除過期的冪等鍵（IDEMPOTENCY_TTL）
+@st.cache_resource
+def start_idempotency_key_sweeper():
+    return start_idempotency_sweeper()
+
+start_idempotency_key_sweeper()
+
+# 開放中任務的語意向量索引（SEMANTIC_MATCHING=1 時即時推薦先以最近鄰取候選，定期重建）
+@st.cache_resource(ttl=Config.SEMANTIC_INDEX_TTL)
+def load_semantic_index():
+    return semantic.VectorIndex.from_database()
+
 # 初始化 Session State
 if 'current_user' not in st.session_state:
     st.session_state.current_user = None
 if 'page' not in st.session_state:
     st.session_state.page = 'home'
 
+# 離開頁面後再回來是新的送出：換新冪等鍵（同一頁內 rerun、連點都沿用原本的鍵）
+if st.session_state.get('idempotency_page') != st.session_state.page:
+    st.session_state.idempotency_keys = {}
+    st.session_state.idempotency_page = st.session_state.page
+    st.session_state.published_task_id = None
+
+# SQL 查詢分析（SQL_PROFILING=1 時啟用，每次 rerun 統計一次）
+if Config.SQL_PROFILING:
+    query_profiler.start_request(st.session_state.page)
+
+# 頁面效能追蹤（TRACING=1 時啟用）
+tracing.start_page(st.session_state.page)
+
 # ========== 輔助函數 ==========
 def get_risk_badge(risk_level):
     """根據風險等級返回徽章 HTML"""
@@ -163,56 +212,51 @@ def show_notification(message, icon="🔔", duration=3):
     """顯示即時通知"""
     st.toast(f"{icon} {message}", icon=icon)
 
-def get_platform_stats():
-    """取得平台統計數據"""
-    users = get_all_users()
-    all_tasks = get_all_tasks()
-    
-    # 基本統計
-    total_users = len(users)
-    total_tasks = len(all_tasks)
-    completed_tasks = len([t for t in all_tasks if t['status'] == 'completed'])
-    open_tasks = len([t for t in all_tasks if t['status'] == 'open'])
-    in_progress_tasks = len([t for t in all_tasks if t['status'] == 'in_progress'])
-    
-    # 點數統計
-    total_points = sum(u['points'] for u in users)
-    points_in_tasks = sum(t['points_offered'] for t in all_tasks if t['status'] == 'open')
-    
-    # 任務分類統計
-    category_counts = {}
-    for task in all_tasks:
-        cat = task['category']
-        category_counts[cat] = category_counts.get(cat, 0) + 1
-    
-    # 校區統計
-    campus_counts = {}
-    for task in all_tasks:
-        campus = task['campus']
-        campus_counts[campus] = campus_counts.get(campus, 0) + 1
-    
-    # Top 3 活躍使用者
-    top_users = sorted(users, key=lambda x: x['completed_tasks'], reverse=True)[:3]
-    
-    return {
-        'total_users': total_users,
-        'total_tasks': total_tasks,
-        'completed_tasks': completed_tasks,
-        'open_tasks': open_tasks,
-        'in_progress_tasks': in_progress_tasks,
-        'total_points': total_points,
-        'points_in_tasks': points_in_tasks,
-        'category_counts': category_counts,
-        'campus_counts': campus_counts,
-        'top_users': top_users,
-        'completion_rate': (completed_tasks / total_tasks * 100) if total_tasks > 0 else 0
-    }
+def get_idempotency_key(action, payload=None):
+    """同一次送出在 rerun、連點時沿用同一個冪等鍵；內容（payload）改變才換新鍵"""
+    keys = st.session_state.setdefault('idempotency_keys', {})
+    fingerprint = repr(payload)
+    if action not in keys or keys[action][0] != fingerprint:
+        keys[action] = (fingerprint, new_idempotency_key())
+    return keys[action][1]
+
+def reset_idempotency_key(action):
+    """使用者明確要送出新的請求（例如「再發布一筆」）：下一次送出換新鍵"""
+    st.session_state.setdefault('idempotency_keys', {}).pop(action, None)
+
+def submit_idempotent(action, operation, write, payload=None):
+    """
+    以冪等鍵執行寫入；成功後保留鍵，之後的連點、rerun 都回傳第一次的結果
+    
+    鍵在內容改變、離開頁面或呼叫 reset_idempotency_key 時才更換，
+    第一次送出的 rerun 結束後才處理到的第二下點擊也不會重複寫入。
+    
+    Args:
+        action: 按鈕動作名稱（同一個動作共用冪等鍵）
+        operation: database 的操作名稱（create_task, apply_for_task, submit_review）
+        write: 接收冪等鍵並執行寫入的函數
+        payload: 送出的內容，改變時換新鍵
+    
+    Returns:
+        tuple: (結果, 是否為先前請求的結果)
+    """
+    key = get_idempotency_key(action, payload)
+    replayed, result = get_idempotent_result(operation, key)
+    if not replayed:
+        result = write(key)
+    return result, replayed
+
+def show_replay_notice():
+    """重送的請求：告知使用者沿用了第一次的結果"""
+    show_notification("這次送出與先前的請求相同，未重複處理", "ℹ️")
+    st.info("ℹ️ 先前的送出已完成，這次沿用第一次的結果，沒有重複處理")
 
 # ========== 側邊欄 ==========
 with st.sidebar:
     st.markdown("### 👤 使用者登入")
     
-    users = get_all_users()
+    with tracing.span('data_fetch'):
+        users = get_all_users()
     user_names = [f"{u['name']} ({u['department']})" for u in users]
     
     selected_user_display = st.selectbox(
@@ -224,7 +268,8 @@ with st.sidebar:
     
     # 解析選擇的使用者
     selected_user_name = selected_user_display.split(' (')[0]
-    st.session_state.current_user = get_user_by_name(selected_user_name)
+    with tracing.span('data_fetch'):
+        st.session_state.current_user = get_user_by_name(selected_user_name)
     
     if st.session_state.current_user:
         st.success(f"✅ 已登入為：{st.session_state.current_user['name']}")
@@ -257,6 +302,9 @@ with st.sidebar:
             skills_html = " ".join([f"<span style='background:#e0e7ff;color:#4338ca;padding:0.25rem 0.5rem;border-radius:0.25rem;margin:0.25rem;display:inline-block;font-size:0.875rem'>{skill}</span>" 
                                    for skill in st.session_state.current_user['skills']])
             st.markdown(skills_html, unsafe_allow_html=True)
+        
+        if st.session_state.current_user.get('availability'):
+            st.markdown(f"**有空時段**: {availability.describe(st.session_state.current_user['availability'])}")
     
     st.markdown("---")
     st.markdown("### 🧭 導航")
@@ -311,7 +359,8 @@ if st.session_state.page == 'home':
         )
     
     # 取得任務
-    tasks = get_all_tasks(status='open')
+    with tracing.span('data_fetch'):
+        tasks = get_all_tasks(status='open')
     
     # 篩選
     if search_query:
@@ -341,6 +390,8 @@ if st.session_state.page == 'home':
                     st.markdown(f"### {task['title']}")
                     st.markdown(badge_html, unsafe_allow_html=True)
                     st.markdown(f"**描述**: {task['description']}")
+                    if task.get('start_time'):
+                        st.markdown(f"🕒 **時間**: {task['start_time']} ~ {task['end_time'] or ''}")
                     
                     col_a, col_b, col_c = st.columns(3)
                     with col_a:
@@ -354,8 +405,13 @@ if st.session_state.page == 'home':
                     st.markdown(f"### 💰 {task['points_offered']} 點")
                     if st.button(f"申請任務", key=f"apply_{task['id']}", use_container_width=True):
                         if st.session_state.current_user:
-                            result = apply_for_task(task['id'], st.session_state.current_user['id'])
-                            if result:
+                            result, replayed = submit_idempotent(
+                                f"apply_{task['id']}_{st.session_state.current_user['id']}", 'apply_for_task',
+                                lambda key: apply_for_task(task['id'], st.session_state.current_user['id'], idempotency_key=key)
+                            )
+                            if replayed:
+                                show_replay_notice()
+                            elif result:
                                 show_notification(f"申請成功！已向 {task.get('publisher_name')} 發送通知", "✅")
                                 st.success("✅ 申請成功！")
                                 st.rerun()
@@ -400,6 +456,16 @@ elif st.session_state.page == 'publish':
                 points_offered = st.number_input("提供點數 *", min_value=10, max_value=500, value=50, step=10)
                 is_urgent = st.checkbox("急件標記 🔥")
             
+            # 任務時間（選填，用於比對幫助者的有空時段）
+            has_schedule = st.checkbox("指定任務時間 🕒")
+            col_d, col_e, col_f = st.columns(3)
+            with col_d:
+                task_date = st.date_input("日期", value=datetime.now().date())
+            with col_e:
+                task_start = st.time_input("開始", value=datetime.strptime('18:00', '%H:%M').time())
+            with col_f:
+                task_end = st.time_input("結束", value=datetime.strptime('20:00', '%H:%M').time())
+            
             # 檢查點數是否足夠
             if points_offered > st.session_state.current_user['points']:
                 st.error(f"❌ 點數不足！您只有 {st.session_state.current_user['points']} 點")
@@ -418,7 +484,8 @@ elif st.session_state.page == 'publish':
             
             if ai_optimize and description:
                 with st.spinner("AI 正在優化您的任務描述..."):
-                    optimized = AIService.optimize_task_description(description)
+                    with tracing.span('ai_call'):
+                        optimized = AIService.optimize_task_description(description)
                     if optimized['success']:
                         show_notification("AI 描述優化完成！", "🤖")
                         st.success("✅ AI 優化建議：")
@@ -433,10 +500,13 @@ elif st.session_state.page == 'publish':
                     st.error("❌ 任務描述至少需要 10 個字")
                 elif points_offered > st.session_state.current_user['points']:
                     st.error("❌ 點數不足，無法發布任務")
+                elif has_schedule and task_end <= task_start:
+                    st.error("❌ 結束時間需晚於開始時間")
                 else:
                     # AI 風險審查
                     with st.spinner("🛡️ 正在進行 AI 安全審查..."):
-                        risk_check = AIService.risk_assessment(description, category)
+                        with tracing.span('ai_call'):
+                            risk_check = AIService.risk_assessment(description, category)
                         
                         if risk_check['success']:
                             risk_data = risk_check['data']
@@ -465,11 +535,23 @@ elif st.session_state.page == 'publish':
                                     'campus': campus,
                                     'points_offered': points_offered,
                                     'is_urgent': is_urgent,
-                                    'publisher_id': st.session_state.current_user['id']
+                                    'publisher_id': st.session_state.current_user['id'],
+                                    'start_time': datetime.combine(task_date, task_start) if has_schedule else None,
+                                    'end_time': datetime.combine(task_date, task_end) if has_schedule else None
                                 }
                                 
-                                task_id = create_task(task_data)
-                                if task_id:
+                                with tracing.span('data_write'):
+                                    task_id, replayed = submit_idempotent(
+                                        'create_task', 'create_task',
+                                        lambda key: create_task(task_data, idempotency_key=key), task_data
+                                    )
+                                if replayed:
+                                    st.session_state.published_task_id = task_id
+                                    show_notification("這份任務先前已發布，未重複扣點", "ℹ️")
+                                    st.info(f"ℹ️ 這份任務已經發布過（任務 #{task_id}），這次沒有重複發布，也沒有重複扣點。"
+                                            "如果要再發布一筆相同的任務，請按下方「再發布一筆」")
+                                elif task_id:
+                                    st.session_state.published_task_id = task_id
                                     show_notification(f"任務發布成功！已扣除 {points_offered} 點", "🎉")
                                     st.success("✅ 任務發布成功！")
                                     st.info(f"💰 已扣除 {points_offered} 點 | 🛡️ 交易安全保護已啟用")
@@ -480,6 +562,13 @@ elif st.session_state.page == 'publish':
                                 else:
                                     show_notification("任務發布失敗", "❌")
                                     st.error("❌ 發布失敗，請稍後再試")
+        
+        # 發布後沿用同一個冪等鍵，重複送出不會再扣點；要再發布相同內容時換新鍵
+        if st.session_state.get('published_task_id'):
+            if st.button("➕ 再發布一筆", use_container_width=True):
+                reset_idempotency_key('create_task')
+                st.session_state.published_task_id = None
+                st.rerun()
 
 # 我的任務頁面（簡化版，包含通知）
 elif st.session_state.page == 'my_tasks':
@@ -491,7 +580,13 @@ elif st.session_state.page == 'my_tasks':
         tab1, tab2 = st.tabs(["📤 我發布的", "📥 我接的"])
         
         with tab1:
-            my_published = get_user_tasks(st.session_state.current_user['id'], task_type='published')
+            with tracing.span('data_fetch'):
+                my_published = get_user_tasks(st.session_state.current_user['id'], task_type='published')
+                # 一次取得所有已完成任務的評價狀態
+                published_review_statuses = check_review_statuses(
+                    [t['id'] for t in my_published if t['status'] == 'completed'],
+                    st.session_state.current_user['id']
+                )
             
             if my_published:
                 for task in my_published:
@@ -522,7 +617,8 @@ elif st.session_state.page == 'my_tasks':
                         
                         # 顯示申請者
                         if task['status'] == 'open':
-                            applications = get_task_applications(task['id'])
+                            with tracing.span('data_fetch'):
+                                applications = get_task_applications(task['id'])
                             if applications:
                                 st.markdown(f"**📝 申請者 ({len(applications)} 人)**:")
                                 for app in applications:
@@ -556,7 +652,7 @@ elif st.session_state.page == 'my_tasks':
                         
                         # 評價功能
                         if task['status'] == 'completed':
-                            review_status = check_review_status(task['id'], st.session_state.current_user['id'])
+                            review_status = published_review_statuses[task['id']]
                             if review_status['can_review'] and not review_status['has_reviewed']:
                                 st.markdown("---")
                                 st.markdown("### ⭐ 評價幫助者")
@@ -564,14 +660,20 @@ elif st.session_state.page == 'my_tasks':
                                 comment = st.text_area("評價內容（選填）", placeholder="分享您的合作體驗...", key=f"comment_pub_{task['id']}")
                                 
                                 if st.button(f"提交評價", key=f"submit_review_pub_{task['id']}", use_container_width=True):
-                                    result = submit_review(
-                                        task['id'],
-                                        st.session_state.current_user['id'],
-                                        review_status['reviewee_id'],
-                                        rating,
-                                        comment
+                                    result, replayed = submit_idempotent(
+                                        f"review_{task['id']}_{st.session_state.current_user['id']}", 'submit_review',
+                                        lambda key: submit_review(
+                                            task['id'],
+                                            st.session_state.current_user['id'],
+                                            review_status['reviewee_id'],
+                                            rating,
+                                            comment,
+                                            idempotency_key=key
+                                        )
                                     )
-                                    if result:
+                                    if replayed:
+                                        show_replay_notice()
+                                    elif result:
                                         show_notification("評價提交成功！", "⭐")
                                         st.success("✅ 評價提交成功！")
                                         st.rerun()
@@ -581,7 +683,14 @@ elif st.session_state.page == 'my_tasks':
                 st.info("您還沒有發布任何任務")
         
         with tab2:
-            my_applied = get_user_tasks(st.session_state.current_user['id'], task_type='applied')
+            with tracing.span('data_fetch'):
+                my_applied = get_user_tasks(st.session_state.current_user['id'], task_type='applied')
+                # 一次取得所有已完成任務的評價狀態
+                applied_review_statuses = check_review_statuses(
+                    [t['id'] for t in my_applied
+                     if t['status'] == 'completed' and t.get('application_status') == 'accepted'],
+                    st.session_state.current_user['id']
+                )
             
             if my_applied:
                 for task in my_applied:
@@ -614,7 +723,7 @@ elif st.session_state.page == 'my_tasks':
                         
                         # 評價功能
                         if task['status'] == 'completed' and task.get('application_status') == 'accepted':
-                            review_status = check_review_status(task['id'], st.session_state.current_user['id'])
+                            review_status = applied_review_statuses[task['id']]
                             if review_status['can_review'] and not review_status['has_reviewed']:
                                 st.markdown("---")
                                 st.markdown("### ⭐ 評價發布者")
@@ -622,14 +731,20 @@ elif st.session_state.page == 'my_tasks':
                                 comment = st.text_area("評價內容（選填）", placeholder="分享您的合作體驗...", key=f"comment_app_{task['id']}")
                                 
                                 if st.button(f"提交評價", key=f"submit_review_app_{task['id']}", use_container_width=True):
-                                    result = submit_review(
-                                        task['id'],
-                                        st.session_state.current_user['id'],
-                                        review_status['reviewee_id'],
-                                        rating,
-                                        comment
+                                    result, replayed = submit_idempotent(
+                                        f"review_{task['id']}_{st.session_state.current_user['id']}", 'submit_review',
+                                        lambda key: submit_review(
+                                            task['id'],
+                                            st.session_state.current_user['id'],
+                                            review_status['reviewee_id'],
+                                            rating,
+                                            comment,
+                                            idempotency_key=key
+                                        )
                                     )
-                                    if result:
+                                    if replayed:
+                                        show_replay_notice()
+                                    elif result:
                                         show_notification("評價提交成功！", "⭐")
                                         st.success("✅ 評價提交成功！")
                                         st.rerun()
@@ -648,37 +763,47 @@ elif st.session_state.page == 'ai_recommend':
         st.markdown(f"### 為 **{st.session_state.current_user['name']}** 🛡️ 推薦的任務")
         st.info("🛡️ **安全保障**：所有推薦任務已通過多重安全審查")
         
-        all_tasks = get_all_tasks(status='open')
+        with tracing.span('data_fetch'):
+            recommendations = get_recommendations(st.session_state.current_user['id'], limit=5)
         
-        if all_tasks:
+        if recommendations:
+            # 背景工作已預先計算好清單
+            computed_at = min((rec['computed_at'] for rec in recommendations if rec['computed_at']), default=None)
+            if computed_at:
+                st.caption(f"⚡ 推薦清單更新於 {computed_at.strftime('%Y-%m-%d %H:%M')} (UTC)")
+            else:
+                st.caption("⚡ 推薦清單已預先計算")
+        else:
+            # 尚未有預先計算的清單（或清單已過期）時即時計算（串流讀取開放中任務，邊讀邊計分，只保留前 5 名）
             with st.spinner("🛡️ AI 正在計算最佳媒合並進行安全檢查..."):
-                matcher = MatchingEngine()
-                recommendations = []
-                
-                for task in all_tasks:
-                    score_data = matcher.calculate_match_score(st.session_state.current_user, task)
-                    recommendations.append({'task': task, 'score': score_data['total_score'], 'scores': score_data})
-                
-                recommendations.sort(key=lambda x: x['score'], reverse=True)
-                
-                st.markdown("### 🏆 Top 5 推薦任務")
+                with tracing.span('matching'):
+                    open_tasks = iter_tasks(status='open')
+                    index = load_semantic_index() if Config.SEMANTIC_MATCHING else None
+                    top = MatchingEngine().get_top_recommendations(
+                        st.session_state.current_user, open_tasks, top_n=5, candidate_index=index
+                    )
+                    recommendations = [{'task': rec['task'], 'score': rec['score'], 'scores': rec['details']} for rec in top]
+        
+        if recommendations:
+            st.markdown("### 🏆 Top 5 推薦任務")
+            
+            for i, rec in enumerate(recommendations[:5], 1):
+                task = rec['task']
+                score = rec['score']
+                scores = rec['scores']
                 
-                for i, rec in enumerate(recommendations[:5], 1):
-                    task = rec['task']
-                    score = rec['score']
-                    scores = rec['scores']
+                with st.expander(f"#{i} {task['title']} - 媒合度 {score:.0%} 🛡️"):
+                    col1, col2 = st.columns([2, 1])
                     
-                    with st.expander(f"#{i} {task['title']} - 媒合度 {score:.0%} 🛡️"):
-                        col1, col2 = st.columns([2, 1])
-                        
-                        with col1:
-                            st.markdown(f"**{task['title']}**")
-                            st.markdown(f"{task['description']}")
-                            st.markdown(f"📍 {task['location']} | {task['campus']}")
-                            st.markdown(f"💰 {task['points_offered']} 點")
-                            st.success("🛡️ **安全任務**：已通過 AI 風險審查")
-                        
-                        with col2:
+                    with col1:
+                        st.markdown(f"**{task['title']}**")
+                        st.markdown(f"{task['description']}")
+                        st.markdown(f"📍 {task['location']} | {task['campus']}")
+                        st.markdown(f"💰 {task['points_offered']} 點")
+                        st.success("🛡️ **安全任務**：已通過 AI 風險審查")
+                    
+                    with col2:
+                        with tracing.span('plotly_build'):
                             fig = go.Figure(data=[go.Pie(
                                 labels=['技能匹配', '時間相符', '評價信任', '地點相符'],
                                 values=[
@@ -692,27 +817,32 @@ elif st.session_state.page == 'ai_recommend':
                             )])
                             
                             fig.update_layout(title=f"總分: {score:.0%}", height=250, margin=dict(l=0, r=0, t=40, b=0), showlegend=False)
-                            st.plotly_chart(fig, use_container_width=True)
-                        
-                        st.markdown("**🎯 推薦理由**:")
-                        reasons = []
-                        if scores['skill_score'] > 0.7:
-                            reasons.append(f"✅ 技能高度匹配 ({scores['skill_score']:.0%})")
-                        if scores['location_score'] == 1.0:
-                            reasons.append(f"✅ 地點完全相符 (同校區)")
-                        if scores['rating_score'] > 0.8:
-                            reasons.append(f"✅ 發布者信譽優良 ({scores['rating_score']:.0%})")
-                        
-                        for reason in reasons:
-                            st.markdown(reason)
-                        
-                        if st.button(f"申請這個任務", key=f"rec_apply_{task['id']}", use_container_width=True):
-                            result = apply_for_task(task['id'], st.session_state.current_user['id'])
-                            if result:
-                                show_notification("申請成功！交易保護已啟動", "🛡️")
-                                st.success("✅ 申請成功！")
-                                st.info("🛡️ 交易保護已啟動")
-                                st.rerun()
+                        st.plotly_chart(fig, use_container_width=True, key=f"rec_chart_{task['id']}")
+                    
+                    st.markdown("**🎯 推薦理由**:")
+                    reasons = []
+                    if scores['skill_score'] > 0.7:
+                        reasons.append(f"✅ 技能高度匹配 ({scores['skill_score']:.0%})")
+                    if scores['location_score'] == 1.0:
+                        reasons.append(f"✅ 地點完全相符 (同校區)")
+                    if scores['rating_score'] > 0.8:
+                        reasons.append(f"✅ 發布者信譽優良 ({scores['rating_score']:.0%})")
+                    
+                    for reason in reasons:
+                        st.markdown(reason)
+                    
+                    if st.button(f"申請這個任務", key=f"rec_apply_{task['id']}", use_container_width=True):
+                        result, replayed = submit_idempotent(
+                            f"apply_{task['id']}_{st.session_state.current_user['id']}", 'apply_for_task',
+                            lambda key: apply_for_task(task['id'], st.session_state.current_user['id'], idempotency_key=key)
+                        )
+                        if replayed:
+                            show_replay_notice()
+                        elif result:
+                            show_notification("申請成功！交易保護已啟動", "🛡️")
+                            st.success("✅ 申請成功！")
+                            st.info("🛡️ 交易保護已啟動")
+                            st.rerun()
         else:
             st.info("目前沒有可推薦的任務")
 
@@ -733,7 +863,8 @@ elif st.session_state.page == 'reviews':
         
         st.markdown("---")
         
-        reviews = get_reviews_for_user(st.session_state.current_user['id'])
+        with tracing.span('data_fetch'):
+            reviews = get_reviews_for_user(st.session_state.current_user['id'])
         
         if reviews:
             st.markdown(f"### 收到的評價 ({len(reviews)} 則)")
@@ -763,7 +894,8 @@ elif st.session_state.page == 'statistics':
     st.markdown("## 📊 平台統計儀表板")
     st.info("🛡️ 展示 Campus Help 的運營數據與活躍度")
     
-    stats = get_platform_stats()
+    with tracing.span('data_fetch'):
+        stats = get_platform_stats()
     
     # 第一行：核心統計
     st.markdown("### 📈 核心數據")
@@ -821,19 +953,20 @@ elif st.session_state.page == 'statistics':
             '數量': [stats['open_tasks'], stats['in_progress_tasks'], stats['completed_tasks']]
         })
         
-        fig1 = px.pie(
-            status_data, 
-            values='數量', 
-            names='狀態',
-            color='狀態',
-            color_discrete_map={'開放中':'#3b82f6', '進行中':'#f59e0b', '已完成':'#10b981'},
-            hole=0.4
-        )
-        fig1.update_layout(
-            height=300,
-            margin=dict(l=20, r=20, t=40, b=20),
-            font=dict(size=14)
-        )
+        with tracing.span('plotly_build'):
+            fig1 = px.pie(
+                status_data, 
+                values='數量', 
+                names='狀態',
+                color='狀態',
+                color_discrete_map={'開放中':'#3b82f6', '進行中':'#f59e0b', '已完成':'#10b981'},
+                hole=0.4
+            )
+            fig1.update_layout(
+                height=300,
+                margin=dict(l=20, r=20, t=40, b=20),
+                font=dict(size=14)
+            )
         st.plotly_chart(fig1, use_container_width=True)
     
     with col2:
@@ -844,19 +977,20 @@ elif st.session_state.page == 'statistics':
                 columns=['分類', '數量']
             )
             
-            fig2 = px.bar(
-                category_data,
-                x='分類',
-                y='數量',
-                color='數量',
-                color_continuous_scale='Purples'
-            )
-            fig2.update_layout(
-                height=300,
-                margin=dict(l=20, r=20, t=40, b=20),
-                showlegend=False,
-                font=dict(size=12)
-            )
+            with tracing.span('plotly_build'):
+                fig2 = px.bar(
+                    category_data,
+                    x='分類',
+                    y='數量',
+                    color='數量',
+                    color_continuous_scale='Purples'
+                )
+                fig2.update_layout(
+                    height=300,
+                    margin=dict(l=20, r=20, t=40, b=20),
+                    showlegend=False,
+                    font=dict(size=12)
+                )
             st.plotly_chart(fig2, use_container_width=True)
         else:
             st.info("暫無分類數據")
@@ -874,23 +1008,24 @@ elif st.session_state.page == 'statistics':
                 columns=['校區', '任務數']
             )
             
-            fig3 = px.bar(
-                campus_data,
-                x='校區',
-                y='任務數',
-                color='校區',
-                color_discrete_map={
-                    '外雙溪校區': '#9333ea',
-                    '城中校區': '#3b82f6',
-                    '線上': '#10b981'
-                }
-            )
-            fig3.update_layout(
-                height=300,
-                margin=dict(l=20, r=20, t=40, b=20),
-                showlegend=False,
-                font=dict(size=12)
-            )
+            with tracing.span('plotly_build'):
+                fig3 = px.bar(
+                    campus_data,
+                    x='校區',
+                    y='任務數',
+                    color='校區',
+                    color_discrete_map={
+                        '外雙溪校區': '#9333ea',
+                        '城中校區': '#3b82f6',
+                        '線上': '#10b981'
+                    }
+                )
+                fig3.update_layout(
+                    height=300,
+                    margin=dict(l=20, r=20, t=40, b=20),
+                    showlegend=False,
+                    font=dict(size=12)
+                )
             st.plotly_chart(fig3, use_container_width=True)
         else:
             st.info("暫無校區數據")
@@ -922,18 +1057,19 @@ elif st.session_state.page == 'statistics':
         '累計任務數': range(10, 10 + len(dates) * 3, 3)
     })
     
-    fig4 = px.line(
-        task_trend,
-        x='日期',
-        y='累計任務數',
-        markers=True,
-        color_discrete_sequence=['#9333ea']
-    )
-    fig4.update_layout(
-        height=300,
-        margin=dict(l=20, r=20, t=40, b=20),
-        font=dict(size=12)
-    )
+    with tracing.span('plotly_build'):
+        fig4 = px.line(
+            task_trend,
+            x='日期',
+            y='累計任務數',
+            markers=True,
+            color_discrete_sequence=['#9333ea']
+        )
+        fig4.update_layout(
+            height=300,
+            margin=dict(l=20, r=20, t=40, b=20),
+            font=dict(size=12)
+        )
     st.plotly_chart(fig4, use_container_width=True)
     
     # 底部資訊
@@ -941,6 +1077,30 @@ elif st.session_state.page == 'statistics':
     st.success("🛡️ **數據安全**：所有統計數據已加密存儲，僅供平台管理使用")
     st.info("💡 **提示**：定期查看平台統計，了解校園互助的活躍度與趨勢")
 
+# SQL 查詢分析面板
+if Config.SQL_PROFILING:
+    sql_profile = query_profiler.end_request()
+    if sql_profile:
+        with st.sidebar:
+            st.markdown("---")
+            with st.expander("🐞 SQL 查詢分析"):
+                col1, col2 = st.columns(2)
+                with col1:
+                    st.metric("查詢數", sql_profile['statement_count'])
+                with col2:
+                    st.metric("DB 耗時", f"{sql_profile['db_time_ms']:.0f} ms")
+                
+                if sql_profile['repeated']:
+                    st.warning(f"⚠️ {len(sql_profile['repeated'])} 條 SQL 重複執行，可能是 N+1 查詢")
+                    st.dataframe(pd.DataFrame(sql_profile['repeated']), use_container_width=True, hide_index=True)
+                
+                if sql_profile['duplicates']:
+                    st.markdown(f"**完全相同的查詢**: {len(sql_profile['duplicates'])} 組")
+                
+                st.markdown("**最慢查詢**:")
+                for item in sql_profile['slowest']:
+                    st.code(f"-- {item['duration_ms']} ms\n{item['statement']}\n-- {item['parameters']}", language='sql')
+
 # 底部資訊
 st.markdown("---")
 st.markdown(
@@ -951,4 +1111,7 @@ st.markdown(
     "有空幫一下，校園時間銀行"
     "</div>",
     unsafe_allow_html=True
-)
\ No newline at end of file
+)
+
+# 結束頁面追蹤（記錄總耗時並輸出 p50/p95/p99）
+tracing.end_page()
@@ -0,0 +1,162 @@
+"""
+時段媒合 - Campus Help
+使用者每週有空的時段以位元圖表示（一週 168 個一小時時段，第 i 位元 = 週 i // 24 的第 i % 24 點），
+任務的時間以區間 (起始時段, 時段數) 表示，時間分數 = 任務時段中使用者有空的比例
+
+- 單筆比對：把位元圖接成兩週長，右移到任務起點後取 popcount，跨週末（週日晚上 → 週一）也不用特別處理
+- 批次比對：使用者位元圖做前綴和，每個任務的重疊數 = cum[起點 + 長度] - cum[起點]，
+  對所有任務一次向量化計算，不必逐一比較區間
+
+使用方式:
+    mask = mask_from_windows([(0, 18, 22), (2, 18, 22)])   # 週一、週三 18:00-22:00
+    start, length = task_interval(task_start, task_end)
+    overlap(mask, start, length)                           # 重疊的時段數
+"""
+from datetime import datetime
+from functools import lru_cache
+
+import numpy as np
+
+SLOTS_PER_DAY = 24
+WEEK_SLOTS = 7 * SLOTS_PER_DAY
+MASK_BYTES = (WEEK_SLOTS + 7) // 8
+
+WEEKDAYS = ['週一', '週二', '週三', '週四', '週五', '週六', '週日']
+
+# 任務時段完全沒有交集時的分數（與技能無重疊的 0.3 一致），有交集時依比例加分到 1.0
+NO_OVERLAP_SCORE = 0.3
+# 未設定時間的急件：使用者不一定馬上有空
+URGENT_SCORE = 0.8
+
+_TIME_FORMAT = '%Y-%m-%d %H:%M'
+
+
+# ========== 編碼 ==========
+
+def mask_from_windows(windows):
+    """
+    每週時段 → 位元圖
+
+    Args:
+        windows: [(星期 0-6, 開始小時, 結束小時)]，結束小時不含，例如 (0, 18, 22) 為週一 18:00-22:00
+
+    Returns:
+        int: 位元圖
+    """
+    mask = 0
+    for day, start_hour, end_hour in windows:
+        for hour in range(max(0, start_hour), min(SLOTS_PER_DAY, end_hour)):
+            mask |= 1 << (day * SLOTS_PER_DAY + hour)
+    return mask
+
+
+def windows_from_mask(mask):
+    """位元圖 → 每週時段（相鄰時段合併）"""
+    windows = []
+    for day in range(7):
+        hour = 0
+        while hour < SLOTS_PER_DAY:
+            if mask >> (day * SLOTS_PER_DAY + hour) & 1:
+                start = hour
+                while hour < SLOTS_PER_DAY and mask >> (day * SLOTS_PER_DAY + hour) & 1:
+                    hour += 1
+                windows.append((day, start, hour))
+            else:
+                hour += 1
+    return windows
+
+
+def describe(mask):
+    """位元圖 → 顯示文字，例如「週一 18-22、週三 18-22」"""
+    return '、'.join(f"{WEEKDAYS[day]} {start}-{end}" for day, start, end in windows_from_mask(mask))
+
+
+def to_bytes(mask):
+    return None if mask is None else mask.to_bytes(MASK_BYTES, 'little')
+
+
+def from_bytes(blob):
+    return None if blob is None else int.from_bytes(blob, 'little')
+
+
+@lru_cache(maxsize=4096)
+def task_interval(start_time, end_time=None):
+    """
+    任務時間 → 每週時段區間
+
+    Args:
+        start_time: 開始時間（datetime 或 'YYYY-MM-DD HH:MM'；None 表示未設定）
+        end_time: 結束時間（None 時視為一小時）
+
+    Returns:
+        tuple: (起始時段 0-167, 時段數)；未設定時間為 (0, 0)，超過一週以一週計
+    """
+    if start_time is None:
+        return 0, 0
+    if isinstance(start_time, str):
+        start_time = datetime.strptime(start_time, _TIME_FORMAT)
+    if isinstance(end_time, str):
+        end_time = datetime.strptime(end_time, _TIME_FORMAT)
+
+    start_slot = start_time.weekday() * SLOTS_PER_DAY + start_time.hour
+    if end_time is None or end_time <= start_time:
+        return start_slot, 1
+    # 從開始的整點起算，結束時間不足一小時也算一個時段
+    seconds = (end_time - start_time.replace(minute=0, second=0, microsecond=0)).total_seconds()
+    return start_slot, min(WEEK_SLOTS, max(1, -int(-seconds // 3600)))
+
+
+# ========== 單筆比對 ==========
+
+def overlap(mask, start_slot, length):
+    """任務區間中使用者有空的時段數"""
+    doubled = mask | (mask << WEEK_SLOTS)
+    return bin((doubled >> start_slot) & ((1 << length) - 1)).count('1')
+
+
+def time_score(mask, start_slot, length, is_urgent=False, no_overlap_score=NO_OVERLAP_SCORE, urgent_score=URGENT_SCORE):
+    """
+    時間分數
+
+    邏輯：
+    - 任務未設定時間，或使用者未設定有空時段：急件 0.8，否則 1.0
+    - 兩者皆有：0.3 + 0.7 × 任務時段中使用者有空的比例
+    （0.3 與 0.8 可由參數調整，見 Config.MATCHING_THRESHOLDS）
+    """
+    if length == 0 or mask is None:
+        return urgent_score if is_urgent else 1.0
+    return no_overlap_score + (1 - no_overlap_score) * (overlap(mask, start_slot, length) / length)
+
+
+# ========== 批次比對 ==========
+
+def mask_array(mask):
+    """位元圖 → 固定長度的 uint8 陣列（FeatureStore 儲存格式）"""
+    return np.frombuffer(to_bytes(mask or 0), dtype=np.uint8)
+
+
+def time_scores(packed, starts, lengths, urgent, no_overlap_score=NO_OVERLAP_SCORE, urgent_score=URGENT_SCORE):
+    """
+    對所有任務向量化計算時間分數（與 time_score 結果相同）
+
+    Args:
+        packed: 使用者位元圖的 uint8 陣列（mask_array）；None 表示未設定
+        starts: 任務起始時段陣列
+        lengths: 任務時段數陣列（0 表示未設定時間）
+        urgent: 任務急件旗標陣列
+
+    Returns:
+        np.ndarray: 時間分數
+    """
+    fallback = np.where(urgent, urgent_score, 1.0)
+    if packed is None:
+        return fallback
+
+    bits = np.unpackbits(np.asarray(packed, dtype=np.uint8), bitorder='little')[:WEEK_SLOTS]
+    cumulative = np.concatenate(([0], np.cumsum(np.tile(bits, 2), dtype=np.int64)))
+    starts = np.asarray(starts, dtype=np.int64)
+    lengths = np.asarray(lengths, dtype=np.int64)
+    overlaps = cumulative[starts + lengths] - cumulative[starts]
+
+    coverage = overlaps / np.maximum(lengths, 1)
+    return np.where(lengths == 0, fallback, no_overlap_score + (1 - no_overlap_score) * coverage)
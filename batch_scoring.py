@@ -0,0 +1,335 @@
+"""
+批次媒合 - Campus Help
+夜間「你可能會喜歡的任務」摘要：為每一組 (使用者, 開放任務) 計算媒合分數，
+每位使用者的 Top K 寫入 recommendations 資料表
+
+做法：
+- 使用者與任務特徵取自 FeatureStore（技能位元遮罩、校區代碼、急件旗標等陣列），
+  放在 shared memory（或以 mmap 載入 FeatureStore 存檔），各 worker 唯讀共用
+- 使用者分片交給 process pool，每位使用者對所有任務向量化計分
+  （與 MatchingEngine.calculate_match_score 結果相同）
+- 分片算完即回傳 Top K，主行程邊收邊寫入
+
+使用方式:
+    python batch_scoring.py                        # 使用所有 CPU 核心
+    python batch_scoring.py --workers 4 --top-k 10
+    python batch_scoring.py --features features/   # worker 以 mmap 載入特徵存檔
+    python batch_scoring.py --scaling 1,2,4,8      # 量測不同核心數的吞吐量（不寫入）
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime
+from multiprocessing import Pool, shared_memory
+
+import numpy as np
+
+import availability
+import database
+from config import Config
+from matching_engine import MatchingEngine
+from feature_store import FeatureStore
+from recommendation_worker import load_open_tasks, write_lists, mark_fresh
+
+# worker 行程內的共用資料（由 _init_worker 設定）
+_worker_state = {}
+
+
+# ========== 計分 ==========
+
+def _popcount(values):
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(values)
+    bytes_view = values.reshape(-1, 1).view(np.uint8)
+    return np.unpackbits(bytes_view, axis=1).sum(axis=1)
+
+
+def score_user(user_features, tasks, config, top_k):
+    """
+    對所有任務向量化計分，取 Top K
+
+    Args:
+        user_features: (使用者 ID, 技能遮罩, 校區代碼, 願意跨校區, 評價分數, 語意向量或 None,
+                        有空時段位元圖或 None)
+        tasks: FeatureStore 的任務欄位 dict
+        config: MatchingConfig（權重與門檻）
+        top_k: 回傳數量
+
+    Returns:
+        list: [(總分, 任務 ID, 分數明細)]，同分時建立時間較新的任務在前
+    """
+    user_id, skill_mask, campus, willing_cross, rating_score, embedding, available = user_features
+    weights = config.weights
+    thresholds = config.thresholds
+
+    # 技能：無法推斷需求 0.5、無重疊 0.3、每個重疊技能 +0.2（上限 1.0）
+    overlap = _popcount(tasks['skill_mask'] & np.uint64(skill_mask))
+    skill_scores = np.where(
+        tasks['skill_mask'] == 0, thresholds['skill_unknown'],
+        np.where(overlap == 0, thresholds['skill_no_overlap'],
+                 np.minimum(1.0, thresholds['skill_base'] + overlap * thresholds['skill_per_match']))
+    )
+    time_scores = availability.time_scores(
+        available, tasks['time_start'], tasks['time_slots'], tasks['urgent'],
+        thresholds['time_no_overlap'], thresholds['time_urgent']
+    )
+    location_scores = np.where(
+        tasks['online'] | (tasks['campus'] == campus), 1.0,
+        thresholds['location_cross_willing'] if willing_cross else thresholds['location_cross_unwilling']
+    )
+
+    totals = (
+        skill_scores * weights['skill'] +
+        time_scores * weights['time'] +
+        rating_score * weights['rating'] +
+        location_scores * weights['location']
+    )
+    # 語意相似度（選用）：加入後依權重總和重新歸一化
+    semantic_scores = None
+    if weights.get('semantic'):
+        semantic_scores = np.clip(tasks['embedding'] @ embedding, 0.0, 1.0).astype(np.float64)
+        totals = (totals + semantic_scores * weights['semantic']) / config.weight_sum
+    # 不推薦自己發布的任務與已移除的任務
+    totals = np.where(~tasks['active'] | (tasks['publisher_id'] == user_id), -np.inf, totals)
+
+    count = min(top_k, int(np.count_nonzero(totals != -np.inf)))
+    if count == 0:
+        return []
+
+    # 先用 partition 找出第 K 高的分數，再只排序候選者（保留所有同分者以維持順序）
+    threshold = np.partition(totals, len(totals) - count)[len(totals) - count]
+    candidates = np.flatnonzero(totals >= threshold)
+    order = candidates[np.lexsort((candidates, -tasks['created_at'][candidates], -totals[candidates]))][:count]
+
+    results = []
+    for i in order:
+        skill_score, time_score, location_score = float(skill_scores[i]), float(time_scores[i]), float(location_scores[i])
+        total_score = float(totals[i])
+        details = {
+            'total_score': total_score,
+            'skill_score': skill_score,
+            'time_score': time_score,
+            'rating_score': rating_score,
+            'location_score': location_score,
+            'breakdown': {
+                '技能匹配': f"{skill_score:.0%}",
+                '時間相符': f"{time_score:.0%}",
+                '評價信任': f"{rating_score:.0%}",
+                '地點相符': f"{location_score:.0%}"
+            },
+            'config_version': config.version
+        }
+        if semantic_scores is not None:
+            details['semantic_score'] = float(semantic_scores[i])
+            details['breakdown']['語意相似'] = f"{semantic_scores[i]:.0%}"
+        results.append((total_score, int(tasks['task_id'][i]), details))
+    return results
+
+
+# ========== Shared memory ==========
+
+def _share_arrays(arrays):
+    """把特徵陣列複製到 shared memory，回傳 (shared memory 物件, 給 worker 的描述)"""
+    blocks = []
+    spec = {}
+    for name, array in arrays.items():
+        block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[:] = array
+        blocks.append(block)
+        spec[name] = (block.name, array.shape, array.dtype.str)
+    return blocks, spec
+
+
+def _init_worker(spec, config, top_k):
+    """
+    worker 行程初始化：取得唯讀的特徵陣列
+
+    Args:
+        spec: shared memory 描述 dict，或 FeatureStore 存檔目錄（以 mmap 載入）
+    """
+    blocks = []
+    if isinstance(spec, str):
+        store = FeatureStore.load(spec, mmap_mode='r')
+        tasks = store.tasks.columns()
+        users = store.users.columns()
+        users['rating_score'] = store.rating_scores(config)
+    else:
+        arrays = {}
+        for name, (block_name, shape, dtype) in spec.items():
+            block = shared_memory.SharedMemory(name=block_name)
+            blocks.append(block)
+            arrays[name] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+        tasks = {name[len('task.'):]: array for name, array in arrays.items() if name.startswith('task.')}
+        users = {name[len('user.'):]: array for name, array in arrays.items() if name.startswith('user.')}
+    _worker_state.update({'blocks': blocks, 'tasks': tasks, 'users': users, 'config': config, 'top_k': top_k})
+
+
+def _score_shard(rows):
+    """worker：計算一個使用者分片（rows 為使用者陣列的列號）"""
+    tasks = _worker_state['tasks']
+    users = _worker_state['users']
+    lists = {}
+    for row in rows:
+        user = (
+            int(users['user_id'][row]),
+            int(users['skill_mask'][row]),
+            int(users['campus'][row]),
+            bool(users['willing_cross'][row]),
+            float(users['rating_score'][row]),
+            users['embedding'][row] if 'embedding' in users else None,
+            users['availability'][row] if users['has_availability'][row] else None
+        )
+        lists[user[0]] = score_user(user, tasks, _worker_state['config'], _worker_state['top_k'])
+    return lists, len(rows) * int(np.count_nonzero(tasks['active']))
+
+
+# ========== 批次執行 ==========
+
+def run_batch(workers=None, top_k=None, shard_size=256, write=True, features=None):
+    """
+    為所有活躍使用者計算 Top K 推薦
+
+    Args:
+        workers: process 數（預設為 CPU 核心數）
+        top_k: 每位使用者保留的推薦數
+        shard_size: 每個分片的使用者數
+        write: 是否寫入 recommendations 資料表
+        features: FeatureStore 存檔目錄（None 表示從資料庫建立並放入 shared memory）
+
+    Returns:
+        dict: 使用者數、任務數、計分組數、耗時與吞吐量
+    """
+    workers = workers or os.cpu_count() or 1
+    top_k = top_k or Config.RECOMMENDATION_TOP_K
+    started_at = datetime.utcnow()
+    start = time.perf_counter()
+
+    if features:
+        store = FeatureStore.load(features, mmap_mode='r')
+    else:
+        store = FeatureStore.from_database()
+    # 技能遮罩與權重使用同一版本的媒合設定
+    config = store.config
+    user_rows = np.flatnonzero(store.users.column('active'))
+    shards = [user_rows[i:i + shard_size] for i in range(0, len(user_rows), shard_size)]
+
+    blocks = []
+    if features:
+        spec = features
+    else:
+        arrays = {f"task.{name}": array for name, array in store.tasks.columns().items()}
+        arrays.update({f"user.{name}": array for name, array in store.users.columns().items()})
+        arrays['user.rating_score'] = store.rating_scores(config)
+        blocks, spec = _share_arrays(arrays)
+
+    session = database.Session()
+    pairs = 0
+    try:
+        known_user_ids = {user_id for (user_id,) in session.query(database.RecommendationState.user_id)}
+        scoring_start = time.perf_counter()
+        with Pool(processes=workers, initializer=_init_worker,
+                  initargs=(spec, config, top_k)) as pool:
+            # 分片完成就寫入，不必等全部算完
+            for lists, shard_pairs in pool.imap_unordered(_score_shard, shards):
+                pairs += shard_pairs
+                if write:
+                    write_lists(session, lists)
+                    mark_fresh(session, list(lists), known_user_ids, started_at, config.version)
+                    session.commit()
+        scoring_elapsed = time.perf_counter() - scoring_start
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+    elapsed = time.perf_counter() - start
+    return {
+        'workers': workers,
+        'users': len(user_rows),
+        'tasks': len(store.tasks),
+        'pairs': pairs,
+        'feature_bytes': store.nbytes(),
+        'config_version': config.version,
+        'elapsed_seconds': round(elapsed, 3),
+        'scoring_seconds': round(scoring_elapsed, 3),
+        'pairs_per_second': round(pairs / scoring_elapsed) if scoring_elapsed > 0 else 0
+    }
+
+
+def measure_serial_baseline(sample_users=50):
+    """以 MatchingEngine 逐筆計分的吞吐量（取部分使用者估算）"""
+    matcher = MatchingEngine()
+    session = database.Session()
+    try:
+        tasks = [task for task, _ in load_open_tasks(session)]
+    finally:
+        session.close()
+    users = database.get_all_users()[:sample_users]
+
+    start = time.perf_counter()
+    for user in users:
+        for task in tasks:
+            matcher.calculate_match_score(user, task)
+    elapsed = time.perf_counter() - start
+    return round(len(users) * len(tasks) / elapsed) if elapsed > 0 else 0
+
+
+def measure_scaling(worker_counts, top_k=None, features=None):
+    """
+    量測不同 process 數的吞吐量（不寫入資料表）
+
+    Returns:
+        list: 每個 process 數的 run_batch 結果，附上相對於第一筆的加速比
+    """
+    results = []
+    for workers in worker_counts:
+        stats = run_batch(workers=workers, top_k=top_k, write=False, features=features)
+        stats['speedup'] = round(stats['pairs_per_second'] / results[0]['pairs_per_second'], 2) \
+            if results and results[0]['pairs_per_second'] else 1.0
+        results.append(stats)
+    return results
+
+
+def main():
+    """命令列入口"""
+    parser = argparse.ArgumentParser(description='Campus Help 批次媒合（夜間推薦摘要）')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='process 數')
+    parser.add_argument('--top-k', type=int, default=Config.RECOMMENDATION_TOP_K, help='每位使用者的推薦數')
+    parser.add_argument('--features', help='FeatureStore 存檔目錄（worker 以 mmap 載入）')
+    parser.add_argument('--scaling', help='量測吞吐量的 process 數列表，例如 1,2,4,8（不寫入）')
+    parser.add_argument('--database-url', help='目標資料庫（預設使用 DATABASE_URL）')
+    args = parser.parse_args()
+
+    if args.database_url:
+        database.configure_database(args.database_url)
+    database.init_db()
+
+    print("=" * 50)
+    print("  Campus Help 批次媒合")
+    print("=" * 50)
+    print(f"   資料庫: {database.engine.url}")
+    print(f"   CPU 核心: {os.cpu_count()}")
+
+    if args.scaling:
+        worker_counts = [int(n) for n in args.scaling.split(',') if n.strip()]
+        print(f"\n   逐筆計分（MatchingEngine）: {measure_serial_baseline()} 組/秒")
+        print(f"\n   {'process':>8} {'秒':>8} {'組/秒':>12} {'加速比':>6}")
+        for stats in measure_scaling(worker_counts, top_k=args.top_k, features=args.features):
+            print(f"   {stats['workers']:>8} {stats['scoring_seconds']:>8.2f} "
+                  f"{stats['pairs_per_second']:>12} {stats['speedup']:>6.2f}")
+        return 0
+
+    stats = run_batch(workers=args.workers, top_k=args.top_k, features=args.features)
+    print("\n✅ 批次媒合完成")
+    print(f"   - 使用者: {stats['users']} 位 × 開放任務: {stats['tasks']} 個 = {stats['pairs']} 組")
+    print(f"   ⏱️  耗時: {stats['elapsed_seconds']} 秒（{stats['workers']} 個 process，{stats['pairs_per_second']} 組/秒）")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,456 @@
+"""
+效能測試腳本 - Campus Help
+
+三種模式：
+- suite: 在不同資料量下量測資料層與媒合引擎的延遲，輸出 JSON，
+         並與儲存的基準比較，變慢超過容許值即回傳失敗
+         （基準與機器相關不納入版本控制，先在同一台機器以 --save-baseline 建立）
+- concurrency: 模擬多個瀏覽器 Session 同時申請、發布任務，量測吞吐量與鎖定錯誤
+- semantic: 語意媒合的向量化、暴力搜尋 / IVF 搜尋延遲與召回率，以及開關語意分數的媒合延遲
+
+使用方式:
+    python benchmark.py                                   # 跑 suite 與 concurrency
+    python benchmark.py suite --sizes 1000,10000 --output bench_results.json
+    python benchmark.py suite --save-baseline             # 更新基準
+    python benchmark.py suite --require-baseline          # CI：沒有基準時回傳失敗
+    python benchmark.py concurrency --threads 16 --ops 200
+    SQLITE_JOURNAL_MODE=DELETE python benchmark.py concurrency   # 與預設 WAL 比較
+    python benchmark.py semantic --vectors 100000 --queries 200
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import database
+import semantic
+from config import Config
+from data_generator import generate_synthetic_data, SKILLS, TASK_TEMPLATES
+from matching_engine import MatchingEngine
+
+DEFAULT_BASELINE = 'benchmark_baseline.json'
+
+# 基準比較時忽略小於此值的差異（毫秒），避免雜訊造成誤判
+NOISE_FLOOR_MS = 1.0
+
+
+def setup_database(db_path):
+    """使用獨立的暫存資料庫，避免污染 campus_help.db"""
+    database.configure_database(f"sqlite:///{db_path}")
+    database.init_db()
+    return database
+
+
+# ========== 延遲測試 ==========
+
+def _time_calls(func, args_list):
+    """依序執行 func(*args)，回傳每次耗時（毫秒）"""
+    timings = []
+    for args in args_list:
+        start = time.perf_counter()
+        func(*args)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def _summarize(timings):
+    """整理延遲統計"""
+    ordered = sorted(timings)
+    return {
+        'runs': len(ordered),
+        'median_ms': round(statistics.median(ordered), 3),
+        'mean_ms': round(statistics.fmean(ordered), 3),
+        'min_ms': round(ordered[0], 3),
+        'max_ms': round(ordered[-1], 3)
+    }
+
+
+def _pick_fixtures(rng, repeat):
+    """從資料庫挑出各寫入操作可用的目標（每次重複用不同資料列）"""
+    session = database.Session()
+    try:
+        Task, TaskApplication, Review = database.Task, database.TaskApplication, database.Review
+
+        open_tasks = session.query(Task.id, Task.publisher_id).filter_by(status='open').limit(repeat * 20).all()
+        user_ids = [u for (u,) in session.query(database.User.id).limit(5000).all()]
+
+        # apply：開放中任務 + 尚未申請過的使用者
+        applied = set(session.query(TaskApplication.task_id, TaskApplication.applicant_id).filter(
+            TaskApplication.task_id.in_([t for t, _ in open_tasks])
+        ).all())
+        apply_args = []
+        for task_id, publisher_id in rng.sample(open_tasks, len(open_tasks)):
+            applicant_id = rng.choice(user_ids)
+            if applicant_id != publisher_id and (task_id, applicant_id) not in applied:
+                apply_args.append((task_id, applicant_id))
+                applied.add((task_id, applicant_id))
+            if len(apply_args) >= repeat:
+                break
+
+        # accept：開放中任務的一筆待審核申請（與 apply 的任務錯開）
+        apply_task_ids = {t for t, _ in apply_args}
+        pending = (
+            session.query(TaskApplication.task_id, TaskApplication.applicant_id, Task.publisher_id)
+            .join(Task, Task.id == TaskApplication.task_id)
+            .filter(Task.status == 'open', TaskApplication.status == 'pending')
+            .limit(repeat * 20)
+            .all()
+        )
+        accept_args, seen = [], set(apply_task_ids)
+        for task_id, applicant_id, publisher_id in pending:
+            if task_id not in seen:
+                accept_args.append((task_id, applicant_id, publisher_id))
+                seen.add(task_id)
+            if len(accept_args) >= repeat:
+                break
+
+        # complete：進行中任務
+        complete_args = [
+            (task_id, helper_id) for task_id, helper_id in
+            session.query(Task.id, Task.accepted_user_id).filter(Task.status == 'in_progress').limit(repeat).all()
+        ]
+
+        # review：已完成且發起者尚未評價的任務
+        reviewed = session.query(Review.task_id).filter(Review.reviewer_id == Task.publisher_id)
+        review_args = [
+            (task_id, publisher_id, helper_id, 5.0, '效能測試')
+            for task_id, publisher_id, helper_id in
+            session.query(Task.id, Task.publisher_id, Task.accepted_user_id)
+            .filter(Task.status == 'completed', ~Task.id.in_(reviewed.scalar_subquery()))
+            .limit(repeat)
+            .all()
+        ]
+
+        sample_user_ids = rng.sample(user_ids, min(repeat, len(user_ids)))
+        return apply_args, accept_args, complete_args, review_args, sample_user_ids
+    finally:
+        session.close()
+
+
+def bench_size(num_tasks, repeat, seed):
+    """在指定資料量下量測各操作延遲"""
+    num_users = max(10, num_tasks // 5)
+    print(f"\n🔍 資料量: {num_users} 位使用者 / {num_tasks} 個任務")
+
+    counts = generate_synthetic_data(num_users=num_users, num_tasks=num_tasks, seed=seed, clear=True)
+    print(f"   📦 合成資料: {counts['elapsed_seconds']} 秒")
+
+    rng = random.Random(seed)
+    apply_args, accept_args, complete_args, review_args, user_ids = _pick_fixtures(rng, repeat)
+    read_repeat = [()] * max(1, repeat // 2)
+
+    results = {}
+
+    def record(name, func, args_list):
+        if not args_list:
+            print(f"   ⚠️  {name}: 沒有可用的測試資料，略過")
+            return
+        results[name] = _summarize(_time_calls(func, args_list))
+        print(f"   ⏱️  {name:<28} 中位數 {results[name]['median_ms']:>10.2f} ms")
+
+    # 讀取
+    record('get_all_tasks', database.get_all_tasks, read_repeat)
+    record('get_all_tasks(open)', database.get_all_tasks, [('open',)] * len(read_repeat))
+    record('get_user_tasks(published)', database.get_user_tasks, [(u, 'published') for u in user_ids])
+    record('get_user_tasks(applied)', database.get_user_tasks, [(u, 'applied') for u in user_ids])
+    record('get_platform_stats', database.get_platform_stats, read_repeat)
+
+    # 媒合
+    matcher = MatchingEngine()
+    open_tasks = database.get_all_tasks(status='open')
+    users = [database.get_user_by_id(u) for u in user_ids]
+    record('get_top_recommendations', matcher.get_top_recommendations, [(u, open_tasks) for u in users])
+
+    # 寫入
+    record('apply_for_task', database.apply_for_task, apply_args)
+    record('accept_application', database.accept_application, accept_args)
+    record('complete_task', database.complete_task, complete_args)
+    record('submit_review', database.submit_review, review_args)
+
+    return results
+
+
+def compare_with_baseline(current, baseline, tolerance):
+    """
+    與基準比較
+
+    Returns:
+        list: 變慢超過容許值的項目 (資料量, 操作, 基準 ms, 目前 ms)
+    """
+    regressions = []
+    for size, ops in current['results'].items():
+        for name, stats in ops.items():
+            base = baseline.get('results', {}).get(size, {}).get(name)
+            if not base:
+                continue
+            limit = base['median_ms'] * (1 + tolerance)
+            if stats['median_ms'] > limit and stats['median_ms'] - base['median_ms'] > NOISE_FLOOR_MS:
+                regressions.append((size, name, base['median_ms'], stats['median_ms']))
+    return regressions
+
+
+def run_suite(args):
+    """跑完整延遲測試並與基準比較"""
+    sizes = [int(s) for s in args.sizes.split(',') if s]
+    report = {
+        'meta': {
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'repeat': args.repeat,
+            'seed': args.seed
+        },
+        'results': {}
+    }
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        setup_database(os.path.join(tmp_dir, 'benchmark_suite.db'))
+        for size in sizes:
+            report['results'][str(size)] = bench_size(size, args.repeat, args.seed)
+        database.configure_database()
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 結果已寫入 {args.output}")
+
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"💾 基準已更新 {args.baseline}")
+        return True
+
+    if not os.path.exists(args.baseline):
+        if args.require_baseline:
+            print(f"\n❌ 找不到基準 {args.baseline}（--require-baseline），先以 --save-baseline 建立")
+            return False
+        print(f"\n⚠️  找不到基準 {args.baseline}，略過效能退步比較（以 --save-baseline 建立）")
+        return True
+
+    with open(args.baseline, encoding='utf-8') as f:
+        baseline = json.load(f)
+
+    regressions = compare_with_baseline(report, baseline, args.tolerance)
+    if regressions:
+        print(f"\n❌ 效能退步（容許 {args.tolerance:.0%}）:")
+        for size, name, base_ms, cur_ms in regressions:
+            print(f"   - [{size}] {name}: {base_ms:.2f} ms → {cur_ms:.2f} ms")
+        return False
+
+    print(f"\n✅ 與基準相比沒有超過 {args.tolerance:.0%} 的退步")
+    return True
+
+
+# ========== 語意媒合測試 ==========
+
+def _synthetic_task_texts(rng, count):
+    """以任務範本加上隨機技能詞產生不重複的任務文字"""
+    templates = [(category, title, description) for category, rows in TASK_TEMPLATES.items()
+                 for title, description, _ in rows]
+    texts = []
+    for i in range(count):
+        category, title, description = rng.choice(templates)
+        extra = ' '.join(rng.sample(SKILLS, 2))
+        texts.append(semantic.task_text(f"{title}（{extra}）#{i}", description, category))
+    return texts
+
+
+def bench_semantic(num_vectors, queries, k, nprobe, seed):
+    """量測語意媒合各階段延遲"""
+    print(f"\n🔍 語意媒合: {num_vectors} 個任務向量 × {queries} 次查詢（維度 {semantic.DIM}）")
+    rng = random.Random(seed)
+    results = {}
+
+    # 向量化（清空快取，量測寫入時的實際成本）
+    texts = _synthetic_task_texts(rng, num_vectors)
+    semantic._embed_cached.cache_clear()
+    start = time.perf_counter()
+    vectors = [semantic.embed_text(text) for text in texts]
+    elapsed = time.perf_counter() - start
+    results['embed_text'] = {'per_text_us': round(elapsed / num_vectors * 1e6, 2)}
+    print(f"   ⏱️  {'embed_text':<28} 每筆 {results['embed_text']['per_text_us']:>10.2f} µs")
+
+    ids = list(range(1, num_vectors + 1))
+    start = time.perf_counter()
+    brute = semantic.VectorIndex(ids, vectors, n_lists=0)
+    ivf = semantic.VectorIndex(ids, vectors, n_lists=max(2, int(num_vectors ** 0.5)), seed=seed)
+    results['ivf_build_seconds'] = round(time.perf_counter() - start, 3)
+    print(f"   ⏱️  {'IVF 建立（' + str(ivf.n_lists) + ' 群）':<28} {results['ivf_build_seconds']:>10.2f} 秒")
+
+    query_vectors = [(semantic.user_vector(rng.sample(SKILLS, rng.randint(1, 3))),) for _ in range(queries)]
+    results['search_brute'] = _summarize(_time_calls(lambda q: brute.search(q, k), query_vectors))
+    results['search_ivf'] = _summarize(_time_calls(lambda q: ivf.search(q, k, nprobe), query_vectors))
+
+    # 召回率：IVF 找到的前 k 筆中，有多少也在暴力搜尋的前 k 筆
+    hits = sum(
+        len({i for i, _ in brute.search(q, k)} & {i for i, _ in ivf.search(q, k, nprobe)})
+        for (q,) in query_vectors
+    )
+    results['search_ivf']['recall'] = round(hits / (queries * k), 4)
+    for name in ('search_brute', 'search_ivf'):
+        print(f"   ⏱️  {name:<28} 中位數 {results[name]['median_ms']:>10.3f} ms")
+    print(f"   🎯 IVF recall@{k}（nprobe={nprobe or Config.SEMANTIC_NPROBE}）: {results['search_ivf']['recall']:.2%}")
+
+    # 單筆媒合：語意分數開 / 關
+    user = {'id': 0, 'skills': ['攝影', '設計'], 'campus': '三峽校區', 'willing_cross_campus': True,
+            'avg_rating': 4.5, 'trust_score': 0.9, 'completed_tasks': 5}
+    tasks = [{'id': i, 'publisher_id': -1, 'title': text, 'description': '', 'category': '',
+              'campus': '三峽校區', 'is_urgent': False} for i, text in enumerate(texts[:1000])]
+    for name, weight in (('match_score(keyword)', 0.0), ('match_score(semantic)', Config.SEMANTIC_WEIGHT)):
+        matcher = MatchingEngine()
+        matcher.WEIGHTS = dict(matcher.WEIGHTS, semantic=weight)
+        results[name] = _summarize(_time_calls(matcher.calculate_match_score, [(user, task) for task in tasks]))
+        print(f"   ⏱️  {name:<28} 中位數 {results[name]['median_ms']:>10.3f} ms")
+
+    return results
+
+
+def run_semantic(args):
+    """跑語意媒合測試（不需要資料庫）"""
+    results = bench_semantic(args.vectors, args.queries, args.k, args.nprobe, args.seed)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 結果已寫入 {args.output}")
+    return True
+
+
+# ========== 並行測試 ==========
+
+def bench_concurrency(database, threads, ops):
+    """平行執行申請者與發起者的寫入操作"""
+    print(f"\n🔍 並行測試: {threads} 個執行緒 × {ops} 次操作")
+
+    users = database.get_all_users()
+    # 讓發起者有足夠點數連續發布任務
+    session = database.Session()
+    session.query(database.User).update({database.User.points: 10 ** 9})
+    session.commit()
+    session.close()
+
+    open_tasks = database.get_all_tasks(status='open')
+
+    def publisher_worker(worker_id):
+        publisher = users[worker_id % len(users)]
+        ok = 0
+        for i in range(ops):
+            task_id = database.create_task({
+                'publisher_id': publisher['id'],
+                'title': f"壓測任務 {worker_id}-{i}",
+                'description': '並行壓力測試用任務',
+                'category': '日常支援',
+                'location': '圖書館',
+                'campus': publisher['campus'],
+                'points_offered': 10
+            })
+            if task_id:
+                ok += 1
+        return ok
+
+    def applicant_worker(worker_id):
+        applicant = users[worker_id % len(users)]
+        ok = 0
+        for i in range(ops):
+            # 讀寫交錯：先讀任務列表，再申請
+            database.get_all_tasks(status='open')
+            task = open_tasks[i % len(open_tasks)]
+            if database.apply_for_task(task['id'], applicant['id']):
+                ok += 1
+        return ok
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        publishers = [pool.submit(publisher_worker, w) for w in range(threads // 2 or 1)]
+        applicants = [pool.submit(applicant_worker, w) for w in range(threads - threads // 2)]
+        published = sum(f.result() for f in publishers)
+        applied = sum(f.result() for f in applicants)
+    elapsed = time.perf_counter() - start
+
+    expected_publish = len(publishers) * ops
+    total_ops = (len(publishers) + len(applicants)) * ops
+
+    print(f"   ✅ 發布成功: {published}/{expected_publish}")
+    print(f"   ✅ 申請成功: {applied}（重複申請會被拒絕，屬正常）")
+    print(f"   ⏱️  總耗時: {elapsed:.2f} 秒 | 吞吐量: {total_ops / elapsed:.0f} ops/s")
+
+    return published == expected_publish
+
+
+def run_concurrency(args):
+    """跑並行寫入測試"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        setup_database(os.path.join(tmp_dir, 'benchmark.db'))
+        database.seed_test_data()
+        print(f"   資料庫: {database.engine.url}")
+        with database.engine.connect() as conn:
+            mode = conn.exec_driver_sql("PRAGMA journal_mode").scalar()
+        print(f"   journal_mode: {mode}")
+
+        passed = bench_concurrency(database, args.threads, args.ops)
+        database.configure_database()
+
+    if passed:
+        print("\n🎉 並行測試通過，沒有發生 database is locked")
+    else:
+        print("\n⚠️  部分寫入失敗，請檢查上方錯誤訊息")
+    return passed
+
+
+def main():
+    """主測試函數"""
+    parser = argparse.ArgumentParser(description='Campus Help 效能測試')
+    subparsers = parser.add_subparsers(dest='mode')
+
+    suite = subparsers.add_parser('suite', help='各資料量下的延遲測試')
+    suite.add_argument('--sizes', default='1000,10000', help='任務數量，逗號分隔')
+    suite.add_argument('--repeat', type=int, default=10, help='每個操作的重複次數')
+    suite.add_argument('--seed', type=int, default=42, help='合成資料亂數種子')
+    suite.add_argument('--output', default='bench_results.json', help='結果 JSON 路徑')
+    suite.add_argument('--baseline', default=DEFAULT_BASELINE, help='基準 JSON 路徑')
+    suite.add_argument('--tolerance', type=float, default=0.5, help='容許的變慢比例（單次執行雜訊約 ±30%%）')
+    suite.add_argument('--save-baseline', action='store_true', help='以本次結果作為新基準')
+    suite.add_argument('--require-baseline', action='store_true', help='找不到基準時回傳失敗（不略過比較）')
+
+    concurrency = subparsers.add_parser('concurrency', help='並行寫入測試')
+    concurrency.add_argument('--threads', type=int, default=8, help='並行執行緒數')
+    concurrency.add_argument('--ops', type=int, default=20, help='每個執行緒的操作次數')
+
+    semantic_parser = subparsers.add_parser('semantic', help='語意媒合延遲測試')
+    semantic_parser.add_argument('--vectors', type=int, default=50000, help='任務向量數')
+    semantic_parser.add_argument('--queries', type=int, default=100, help='查詢次數')
+    semantic_parser.add_argument('--k', type=int, default=10, help='每次查詢回傳筆數')
+    semantic_parser.add_argument('--nprobe', type=int, default=None, help='IVF 搜尋的群數（預設 SEMANTIC_NPROBE）')
+    semantic_parser.add_argument('--seed', type=int, default=42, help='亂數種子')
+    semantic_parser.add_argument('--output', default=None, help='結果 JSON 路徑')
+
+    args = parser.parse_args()
+
+    print("=" * 50)
+    print("  Campus Help 效能測試")
+    print("=" * 50)
+
+    if args.mode is None:
+        # 未指定模式：suite 與 concurrency 用預設值各跑一次（semantic 需另外指定）
+        args = parser.parse_args(['suite'])
+        passed = run_suite(args)
+        args = parser.parse_args(['concurrency'])
+        passed = run_concurrency(args) and passed
+    elif args.mode == 'suite':
+        passed = run_suite(args)
+    elif args.mode == 'semantic':
+        passed = run_semantic(args)
+    else:
+        passed = run_concurrency(args)
+
+    return 0 if passed else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
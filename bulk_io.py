@@ -0,0 +1,414 @@
+"""
+批次匯出 / 匯入 - Campus Help
+學期報表匯出任務、使用者與評價；社團一次上傳大量任務
+
+- 匯出：串流讀取（每批 fetchmany），寫成 CSV 或 Parquet（pyarrow，欄位型別固定），記憶體只保留一批
+- 匯入（任務）：逐列驗證，與 create_task 相同扣除發起者點數並寫入帳本，每批一個交易；
+  點數不足或驗證失敗的列會被略過並回報列號與原因，不影響其他列
+
+使用方式:
+    python bulk_io.py export tasks tasks.csv
+    python bulk_io.py export reviews reviews.parquet
+    python bulk_io.py import tasks club_tasks.csv
+"""
+import argparse
+import csv
+import io
+import os
+import sys
+import time
+from datetime import datetime
+
+from sqlalchemy import Boolean, DateTime, Float, Integer, BigInteger, bindparam, func, insert, literal, select, update
+
+import database
+from config import Config
+
+# 匯出欄位（語意向量、位元圖等內部二進位欄位不匯出）
+EXPORT_COLUMNS = {
+    'tasks': ('id', 'publisher_id', 'accepted_user_id', 'title', 'description', 'category', 'location', 'campus',
+              'points_offered', 'is_urgent', 'status', 'created_at', 'updated_at', 'completed_at',
+              'start_time', 'end_time'),
+    'users': ('id', 'email', 'name', 'department', 'grade', 'campus', 'skills', 'points', 'avg_rating',
+              'completed_tasks', 'trust_score', 'willing_cross_campus', 'status', 'created_at'),
+    'reviews': ('id', 'task_id', 'reviewer_id', 'reviewee_id', 'rating', 'comment', 'created_at')
+}
+
+# 匯入任務的欄位（其餘欄位由資料庫預設值填入）
+TASK_IMPORT_REQUIRED = ('publisher_id', 'title', 'category', 'location', 'campus', 'points_offered')
+TASK_IMPORT_OPTIONAL = ('description', 'is_urgent', 'start_time', 'end_time')
+
+_TRUE_VALUES = {'1', 'true', 'yes', 'y', '是'}
+
+
+def _format_of(path, file_format=None):
+    file_format = (file_format or os.path.splitext(path)[1].lstrip('.')).lower()
+    if file_format not in ('csv', 'parquet'):
+        raise ValueError(f"不支援的檔案格式: {file_format}（僅支援 csv / parquet）")
+    return file_format
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("Parquet 需要 pyarrow（pip install pyarrow）")
+    return pyarrow, pyarrow.parquet
+
+
+# ========== 匯出 ==========
+
+def _arrow_schema(pa, columns):
+    """由 SQLAlchemy 欄位型別決定 Parquet 欄位型別（每批型別一致，全為 NULL 的批次也不會推斷錯誤）"""
+    fields = []
+    for column in columns:
+        if isinstance(column.type, (Integer, BigInteger)):
+            arrow_type = pa.int64()
+        elif isinstance(column.type, Float):
+            arrow_type = pa.float64()
+        elif isinstance(column.type, Boolean):
+            arrow_type = pa.bool_()
+        elif isinstance(column.type, DateTime):
+            arrow_type = pa.timestamp('us')
+        else:
+            arrow_type = pa.string()
+        fields.append(pa.field(column.name, arrow_type))
+    return pa.schema(fields)
+
+
+def export_table(name, path, file_format=None, chunk_size=None):
+    """
+    串流匯出資料表
+
+    Args:
+        name: 'tasks'、'users' 或 'reviews'
+        path: 輸出檔路徑
+        file_format: 'csv' 或 'parquet'（預設依副檔名）
+        chunk_size: 每批讀取筆數（預設 Config.DB_STREAM_CHUNK_SIZE × 10）
+
+    Returns:
+        dict: {'rows', 'elapsed_seconds', 'rows_per_second'}
+    """
+    if name not in EXPORT_COLUMNS:
+        raise ValueError(f"不支援匯出的資料表: {name}")
+    file_format = _format_of(path, file_format)
+    chunk_size = chunk_size or Config.DB_STREAM_CHUNK_SIZE * 10
+
+    table = database.Base.metadata.tables[name]
+    columns = [table.c[column] for column in EXPORT_COLUMNS[name]]
+    statement = select(*columns).order_by(table.c.id)
+
+    rows = 0
+    start = time.perf_counter()
+    with database.engine.connect() as conn:
+        # 直接取驅動程式回傳的值，不經 ORM 型別轉換（SQLite 的時間本來就是 ISO 字串，省下逐欄解析）；
+        # PostgreSQL 以伺服器端游標串流
+        sql = str(statement.compile(dialect=conn.dialect))
+        result = conn.execution_options(stream_results=True).exec_driver_sql(sql)
+
+        if file_format == 'csv':
+            # utf-8-sig：Excel 開啟中文不會亂碼；每批先寫入記憶體緩衝再一次寫檔
+            with open(path, 'w', newline='', encoding='utf-8-sig') as f:
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+                writer.writerow(EXPORT_COLUMNS[name])
+                for chunk in result.partitions(chunk_size):
+                    writer.writerows(chunk)
+                    f.write(buffer.getvalue())
+                    buffer.seek(0)
+                    buffer.truncate()
+                    rows += len(chunk)
+                f.write(buffer.getvalue())
+        else:
+            pa, pq = _require_pyarrow()
+            schema = _arrow_schema(pa, columns)
+            with pq.ParquetWriter(path, schema) as writer:
+                for chunk in result.partitions(chunk_size):
+                    arrays = [pa.array(values).cast(field.type) for values, field in zip(zip(*chunk), schema)]
+                    writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+                    rows += len(chunk)
+                if rows == 0:
+                    writer.write_table(schema.empty_table())
+
+    elapsed = time.perf_counter() - start
+    return {'rows': rows, 'elapsed_seconds': round(elapsed, 3),
+            'rows_per_second': round(rows / elapsed) if elapsed > 0 else 0}
+
+
+# ========== 匯入 ==========
+
+def _read_rows(path, file_format, chunk_size):
+    """逐批讀取檔案，每列為 dict"""
+    if file_format == 'csv':
+        with open(path, newline='', encoding='utf-8-sig') as f:
+            batch = []
+            for row in csv.DictReader(f):
+                batch.append(row)
+                if len(batch) >= chunk_size:
+                    yield batch
+                    batch = []
+            if batch:
+                yield batch
+    else:
+        _, pq = _require_pyarrow()
+        for record_batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+            yield record_batch.to_pylist()
+
+
+def _parse_time(value):
+    if value is None or isinstance(value, datetime):
+        return value
+    value = str(value).strip()
+    if not value:
+        return None
+    try:
+        # YYYY-MM-DD HH:MM[:SS[.ffffff]]，日期與時間間可用空白或 T（匯出的 CSV 可直接匯回）
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"時間格式錯誤: {value}（請使用 YYYY-MM-DD HH:MM）")
+
+
+def validate_task_row(row):
+    """
+    驗證並轉換一列任務資料（規則與發布任務頁面相同）
+
+    Args:
+        row: 檔案中的一列（CSV 皆為字串，Parquet 為原生型別）
+
+    Returns:
+        dict: 可寫入 tasks 資料表的欄位
+
+    Raises:
+        ValueError: 資料不合法（訊息為原因）
+    """
+    missing = [name for name in TASK_IMPORT_REQUIRED if row.get(name) in (None, '')]
+    if missing:
+        raise ValueError(f"缺少欄位: {', '.join(missing)}")
+
+    try:
+        publisher_id = int(row['publisher_id'])
+        points = int(row['points_offered'])
+    except (TypeError, ValueError):
+        raise ValueError("publisher_id 與 points_offered 必須是整數")
+
+    title = str(row['title']).strip()
+    if not title or len(title) > 200:
+        raise ValueError("標題不可空白且不可超過 200 字")
+    if row['category'] not in Config.CATEGORIES:
+        raise ValueError(f"未知的分類: {row['category']}")
+    if row['campus'] not in Config.CAMPUSES:
+        raise ValueError(f"未知的校區: {row['campus']}")
+    if not Config.POINTS_MIN <= points <= Config.POINTS_MAX:
+        raise ValueError(f"點數必須介於 {Config.POINTS_MIN} 到 {Config.POINTS_MAX}")
+
+    start_time = _parse_time(row.get('start_time'))
+    end_time = _parse_time(row.get('end_time'))
+    if end_time and not start_time:
+        raise ValueError("設定結束時間時必須有開始時間")
+    if start_time and end_time and end_time <= start_time:
+        raise ValueError("結束時間必須晚於開始時間")
+
+    is_urgent = row.get('is_urgent')
+    if not isinstance(is_urgent, bool):
+        is_urgent = str(is_urgent or '').strip().lower() in _TRUE_VALUES
+
+    return {
+        'publisher_id': publisher_id,
+        'title': title,
+        'description': str(row.get('description') or '').strip(),
+        'category': row['category'],
+        'location': str(row['location']).strip(),
+        'campus': row['campus'],
+        'points_offered': points,
+        'is_urgent': is_urgent,
+        'start_time': start_time,
+        'end_time': end_time
+    }
+
+
+def _reserve_ids(conn, table, count):
+    """
+    預留一段 ID（明確指定 ID 才能以 executemany 寫入，帳本不必逐筆回查）
+
+    PostgreSQL 由序列取號；SQLite 在此之前已因扣點取得寫入鎖，其他連線不會同時新增
+    """
+    if conn.dialect.name == 'postgresql':
+        return conn.exec_driver_sql(
+            f"SELECT nextval(pg_get_serial_sequence('{table.name}', 'id')) FROM generate_series(1, {int(count)})"
+        ).scalars().all()
+    first_id = (conn.execute(select(func.max(table.c.id))).scalar() or 0) + 1
+    return list(range(first_id, first_id + count))
+
+
+def _import_task_batch(conn, tables, rows, first_row_number, rejected):
+    """
+    在目前的交易中寫入一批任務
+
+    發起者點數依檔案順序扣除，扣到不足時該列被拒絕（與逐筆呼叫 create_task 的結果相同）
+
+    Returns:
+        int: 寫入筆數
+    """
+    users, tasks, ledger = tables['users'], tables['tasks'], tables['point_ledger']
+
+    valid = []
+    for offset, row in enumerate(rows):
+        try:
+            valid.append((first_row_number + offset, validate_task_row(row)))
+        except ValueError as e:
+            rejected.append((first_row_number + offset, str(e)))
+
+    publisher_ids = {task['publisher_id'] for _, task in valid}
+    if not publisher_ids:
+        return 0
+    balance_query = (
+        select(users.c.id, users.c.points)
+        .where(users.c.id.in_(publisher_ids), users.c.status == 'active')
+        .order_by(users.c.id)  # 依 ID 順序鎖定，與 database._lock_users 相同
+    )
+    if conn.dialect.name == 'postgresql':
+        balance_query = balance_query.with_for_update()
+    balances = dict(conn.execute(balance_query).all())
+
+    accepted = []
+    spent = {}
+    for row_number, task in valid:
+        publisher_id = task['publisher_id']
+        if publisher_id not in balances:
+            rejected.append((row_number, f"發起者不存在: {publisher_id}"))
+        elif balances[publisher_id] - spent.get(publisher_id, 0) < task['points_offered']:
+            rejected.append((row_number, "點數不足"))
+        else:
+            spent[publisher_id] = spent.get(publisher_id, 0) + task['points_offered']
+            accepted.append(task)
+    if not accepted:
+        return 0
+
+    # 扣點：同一個發起者合併成一次 UPDATE，餘額條件與 _adjust_points 相同
+    deduct = (
+        update(users)
+        .where(users.c.id == bindparam('publisher'), users.c.points >= bindparam('amount'))
+        .values(points=users.c.points - bindparam('amount'), version=users.c.version + 1)
+    )
+    deductions = [{'publisher': publisher_id, 'amount': amount} for publisher_id, amount in sorted(spent.items())]
+    if conn.dialect.supports_sane_multi_rowcount:
+        updated = conn.execute(deduct, deductions).rowcount
+    else:
+        updated = sum(conn.execute(deduct, deduction).rowcount for deduction in deductions)
+    if updated != len(deductions):
+        raise RuntimeError("讀取餘額後點數已被其他交易變更")
+
+    now = datetime.utcnow()
+    task_ids = _reserve_ids(conn, tasks, len(accepted))
+    conn.execute(insert(tasks), [dict(task, id=task_id, created_at=now, updated_at=now)
+                                 for task_id, task in zip(task_ids, accepted)])
+
+    # 每個任務一筆扣點帳本，直接由剛寫入的任務產生
+    if task_ids[-1] - task_ids[0] + 1 == len(task_ids):
+        written = tasks.c.id.between(task_ids[0], task_ids[-1])
+    else:
+        written = tasks.c.id.in_(task_ids)
+    conn.execute(
+        insert(ledger).from_select(
+            ['user_id', 'task_id', 'amount', 'reason', 'created_at'],
+            select(tasks.c.publisher_id, tasks.c.id, -tasks.c.points_offered, literal('task_publish'), literal(now))
+            .where(written)
+        )
+    )
+    database.append_outbox_events(conn, [
+        database.outbox_event_row('task_created', task_id, {
+            'publisher_id': task['publisher_id'], 'category': task['category'], 'campus': task['campus'],
+            'points_offered': task['points_offered'], 'is_urgent': bool(task.get('is_urgent'))
+        }, now)
+        for task_id, task in zip(task_ids, accepted)
+    ])
+    return len(accepted)
+
+
+def import_tasks(path, file_format=None, batch_size=5000):
+    """
+    批次匯入任務
+
+    Args:
+        path: CSV 或 Parquet 檔（欄位見 TASK_IMPORT_REQUIRED / TASK_IMPORT_OPTIONAL）
+        file_format: 'csv' 或 'parquet'（預設依副檔名）
+        batch_size: 每個交易寫入的列數
+
+    Returns:
+        dict: {'rows', 'imported', 'rejected': [(列號, 原因)], 'elapsed_seconds', 'rows_per_second'}
+              列號從 1 起算，不含標題列
+    """
+    file_format = _format_of(path, file_format)
+    database.init_db()
+    tables = {name: database.Base.metadata.tables[name] for name in ('users', 'tasks', 'point_ledger')}
+
+    rows = imported = 0
+    rejected = []
+    start = time.perf_counter()
+    for batch in _read_rows(path, file_format, batch_size):
+        try:
+            with database.engine.begin() as conn:
+                imported += _import_task_batch(conn, tables, batch, rows + 1, rejected)
+        except Exception as e:
+            # 整批回滾：這批尚未記錄為拒絕的列都標示為失敗
+            recorded = {row_number for row_number, _ in rejected}
+            rejected.extend((row_number, f"寫入失敗: {e}") for row_number in range(rows + 1, rows + len(batch) + 1)
+                            if row_number not in recorded)
+        rows += len(batch)
+    rejected.sort()
+
+    # Core insert 不會觸發 ORM 事件，語意向量在寫完後一次補上
+    if Config.SEMANTIC_MATCHING and imported:
+        database.backfill_embeddings()
+
+    elapsed = time.perf_counter() - start
+    return {'rows': rows, 'imported': imported, 'rejected': rejected, 'elapsed_seconds': round(elapsed, 3),
+            'rows_per_second': round(rows / elapsed) if elapsed > 0 else 0}
+
+
+def main():
+    """命令列入口"""
+    parser = argparse.ArgumentParser(description='Campus Help 批次匯出 / 匯入')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    export_parser = subparsers.add_parser('export', help='匯出資料表')
+    export_parser.add_argument('table', choices=sorted(EXPORT_COLUMNS))
+    export_parser.add_argument('path', help='輸出檔（.csv 或 .parquet）')
+
+    import_parser = subparsers.add_parser('import', help='匯入任務')
+    import_parser.add_argument('table', choices=['tasks'])
+    import_parser.add_argument('path', help='輸入檔（.csv 或 .parquet）')
+    import_parser.add_argument('--batch-size', type=int, default=5000, help='每個交易寫入的列數')
+
+    for sub in (export_parser, import_parser):
+        sub.add_argument('--format', choices=['csv', 'parquet'], help='檔案格式（預設依副檔名）')
+        sub.add_argument('--database-url', help='資料庫（預設使用 DATABASE_URL）')
+    args = parser.parse_args()
+
+    if args.database_url:
+        database.configure_database(args.database_url)
+
+    try:
+        if args.command == 'export':
+            stats = export_table(args.table, args.path, args.format)
+            print(f"✅ 已匯出 {stats['rows']} 筆 {args.table} → {args.path}"
+                  f"（{stats['elapsed_seconds']} 秒，{stats['rows_per_second']} 筆/秒）")
+            return 0
+
+        stats = import_tasks(args.path, args.format, batch_size=args.batch_size)
+    except (ImportError, ValueError, OSError) as e:
+        print(f"❌ {e}")
+        return 1
+
+    print(f"✅ 已匯入 {stats['imported']}/{stats['rows']} 個任務"
+          f"（{stats['elapsed_seconds']} 秒，{stats['rows_per_second']} 筆/秒）")
+    for row_number, reason in stats['rejected'][:20]:
+        print(f"   ⚠️  第 {row_number} 列: {reason}")
+    if len(stats['rejected']) > 20:
+        print(f"   ... 另有 {len(stats['rejected']) - 20} 列未匯入")
+    return 0 if not stats['rejected'] else 2
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -19,6 +19,52 @@ class Config:
     # 資料庫
     DATABASE_URL = os.getenv('DATABASE_URL', 'sqlite:///campus_help.db')
     
+    # SQLite 連線調校（每個新連線都會套用）
+    SQLITE_JOURNAL_MODE = os.getenv('SQLITE_JOURNAL_MODE', 'WAL')        # WAL 讓讀取不被寫入阻擋
+    SQLITE_SYNCHRONOUS = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')       # WAL 下 NORMAL 已足夠安全
+    SQLITE_CACHE_SIZE = int(os.getenv('SQLITE_CACHE_SIZE', '-20000'))    # 負值代表 KiB（約 20MB）
+    SQLITE_MMAP_SIZE = int(os.getenv('SQLITE_MMAP_SIZE', '268435456'))   # 256MB
+    SQLITE_BUSY_TIMEOUT = int(os.getenv('SQLITE_BUSY_TIMEOUT', '5000'))  # 毫秒，遇鎖時等待而非立即失敗
+    
+    # 連線池（PostgreSQL 等伺服器型資料庫）
+    DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '10'))
+    DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '20'))
+    DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', '1800'))  # 秒
+    DB_STREAM_CHUNK_SIZE = int(os.getenv('DB_STREAM_CHUNK_SIZE', '1000'))  # iter_* 串流讀取每批筆數
+    DB_CONFLICT_RETRIES = int(os.getenv('DB_CONFLICT_RETRIES', '10'))       # 版本衝突時重試次數
+    DB_CONFLICT_BACKOFF = float(os.getenv('DB_CONFLICT_BACKOFF', '0.005'))  # 秒，第一次重試前的等待（之後倍增）
+    IDEMPOTENCY_TTL = int(os.getenv('IDEMPOTENCY_TTL', '86400'))                    # 秒，冪等鍵保留時間
+    IDEMPOTENCY_SWEEP_INTERVAL = int(os.getenv('IDEMPOTENCY_SWEEP_INTERVAL', '600'))  # 秒，清除過期冪等鍵的間隔
+    OUTBOX_BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', '500'))            # 事件讀取每批筆數
+    OUTBOX_POLL_INTERVAL = float(os.getenv('OUTBOX_POLL_INTERVAL', '1'))       # 秒，沒有新事件時的輪詢間隔
+    
+    # SQL 查詢分析（除錯用，預設關閉）
+    SQL_PROFILING = os.getenv('SQL_PROFILING', '0') == '1'
+    SQL_PROFILING_SLOW_LIMIT = int(os.getenv('SQL_PROFILING_SLOW_LIMIT', '5'))            # 保留最慢查詢筆數
+    SQL_PROFILING_REPEAT_THRESHOLD = int(os.getenv('SQL_PROFILING_REPEAT_THRESHOLD', '5'))  # 重複幾次視為 N+1
+    
+    # 頁面效能追蹤（預設關閉）
+    TRACING = os.getenv('TRACING', '0') == '1'
+    TRACE_EXPORT_PATH = os.getenv('TRACE_EXPORT_PATH', 'page_traces.prom')  # Prometheus 文字格式
+    TRACE_SAMPLE_LIMIT = int(os.getenv('TRACE_SAMPLE_LIMIT', '2000'))        # 每個階段保留的樣本數
+    TRACE_EXPORT_INTERVAL = float(os.getenv('TRACE_EXPORT_INTERVAL', '5'))   # 秒，輸出檔案的最短間隔
+    
+    # 推薦清單背景更新
+    RECOMMENDATION_WORKER = os.getenv('RECOMMENDATION_WORKER', '0') == '1'               # 由 app 啟動背景執行緒
+    RECOMMENDATION_TOP_K = int(os.getenv('RECOMMENDATION_TOP_K', '5'))
+    RECOMMENDATION_REFRESH_INTERVAL = int(os.getenv('RECOMMENDATION_REFRESH_INTERVAL', '30'))  # 秒
+    RECOMMENDATION_CLOCK_SKEW = int(os.getenv('RECOMMENDATION_CLOCK_SKEW', '60'))        # 新任務重疊掃描的秒數
+    RECOMMENDATION_MAX_AGE = int(os.getenv('RECOMMENDATION_MAX_AGE', '900'))             # 秒，超過就改為即時計分
+    
+    # 語意媒合（選用，預設關閉；開啟後寫入任務 / 使用者時會計算向量）
+    SEMANTIC_MATCHING = os.getenv('SEMANTIC_MATCHING', '0') == '1'
+    SEMANTIC_WEIGHT = float(os.getenv('SEMANTIC_WEIGHT', '0.2'))                 # 語意分數在媒合總分中的權重
+    SEMANTIC_DIM = int(os.getenv('SEMANTIC_DIM', '256'))                         # 向量維度
+    SEMANTIC_ANN_THRESHOLD = int(os.getenv('SEMANTIC_ANN_THRESHOLD', '20000'))  # 超過此筆數改用 IVF 索引
+    SEMANTIC_NPROBE = int(os.getenv('SEMANTIC_NPROBE', '8'))                     # IVF 搜尋的群數
+    SEMANTIC_CANDIDATES = int(os.getenv('SEMANTIC_CANDIDATES', '2000'))          # 即時推薦以向量索引先取的候選數
+    SEMANTIC_INDEX_TTL = int(os.getenv('SEMANTIC_INDEX_TTL', '300'))             # 秒，app 快取的向量索引重建間隔
+    
     # Gemini API
     GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
     
@@ -43,12 +89,73 @@ class Config:
     POINTS_MAX = 500
     POINTS_DEFAULT = 50
     
+    # 媒合設定（由 matching_config 編譯使用；MATCHING_CONFIG_PATH 的 JSON 檔可覆寫以下任一項，存檔後自動重新載入）
+    MATCHING_CONFIG_PATH = os.getenv('MATCHING_CONFIG_PATH', 'matching_config.json')
+    MATCHING_CONFIG_POLL_INTERVAL = float(os.getenv('MATCHING_CONFIG_POLL_INTERVAL', '2'))  # 秒
+    
     # 媒合權重
     MATCHING_WEIGHTS = {
-        'skill': 0.4,
-        'time': 0.2,
-        'rating': 0.2,
-        'location': 0.2
+        'skill': 0.4,      # 技能匹配度
+        'time': 0.2,       # 時間重疊度
+        'rating': 0.2,     # 評價信任值
+        'location': 0.2,   # 地點相符度
+        'semantic': SEMANTIC_WEIGHT if SEMANTIC_MATCHING else 0.0  # 語意相似度（選用）
+    }
+    
+    # 技能關鍵字：任務標題或描述含關鍵字時推斷需要該技能
+    MATCHING_SKILL_KEYWORDS = {
+        '搬運': ['搬', '搬運', '行李', '家具'],
+        '修理電腦': ['電腦', '修理', '維修', '重灌'],
+        '攝影': ['攝影', '拍照', '相機', '照片'],
+        '設計': ['設計', 'photoshop', 'ps', '美編', '排版'],
+        '教學': ['教', '解題', '輔導', '家教'],
+        '程式設計': ['程式', 'python', 'coding', '寫程式'],
+        '翻譯': ['翻譯', '英文', '日文'],
+        '跑腿': ['代購', '買', '送']
+    }
+    
+    # 各分類的通用技能
+    MATCHING_CATEGORY_SKILLS = {
+        '日常支援': ['搬運', '跑腿'],
+        '學習互助': ['教學'],
+        '校園協助': ['攝影', '活動協助'],
+        '技能交換': ['設計', '程式設計']
+    }
+    
+    # 各項分數的門檻與係數
+    MATCHING_THRESHOLDS = {
+        'skill_unknown': 0.5,             # 無法推斷任務所需技能
+        'skill_no_overlap': 0.3,          # 技能無重疊（願意嘗試）
+        'skill_base': 0.5,                # 有重疊時的基礎分
+        'skill_per_match': 0.2,           # 每個重疊技能加分
+        'time_no_overlap': 0.3,           # 任務時段完全沒空
+        'time_urgent': 0.8,               # 未能比對時段的急件
+        'rating_avg_weight': 0.5,         # 評價信任值 = 平均評分、信任值、完成數的加權
+        'rating_trust_weight': 0.3,
+        'rating_completion_weight': 0.2,
+        'rating_full_completed': 20,      # 完成此數量的任務即為滿分
+        'location_cross_willing': 0.6,    # 跨校區但願意
+        'location_cross_unwilling': 0.2   # 跨校區且不願意
+    }
+    
+    # 技能詞彙：標準技能 → 同義詞（比對時不分大小寫）
+    # 順序即技能位元遮罩的位元位置，新增技能請加在最後
+    SKILL_SYNONYMS = {
+        '搬運': ['搬家', '搬東西'],
+        '修理電腦': ['電腦維修', '重灌電腦'],
+        '攝影': ['拍照', '照相'],
+        '設計': ['ps', 'photoshop', '平面設計', '美編'],
+        '教學': ['家教', '英文教學', '數學教學'],
+        '程式設計': ['程式', 'python', 'coding', '寫程式'],
+        '翻譯': [],
+        '跑腿': ['代購'],
+        '活動協助': ['活動支援'],
+        '影片剪輯': ['剪輯', '剪片'],
+        '組裝家具': [],
+        '簡報製作': ['簡報', 'ppt'],
+        '文書處理': ['word', 'excel'],
+        '資料分析': [],
+        '日文': []
     }
     
     # 安全關鍵字
@@ -0,0 +1,403 @@
+"""
+合成資料產生器 - Campus Help
+依設定產生大量使用者、任務、申請與評價，供容量規劃與效能重現使用
+
+特色：
+- 固定亂數種子，相同參數產生相同資料
+- 以 Core insert 批次寫入（executemany），不逐筆建立 ORM 物件
+- 分批產生，10^7 筆規模也只佔用固定記憶體
+
+使用方式:
+    python data_generator.py --users 10000 --tasks 50000
+    python data_generator.py --users 1000000 --tasks 10000000 --database-url sqlite:///load.db
+"""
+import argparse
+import json
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert, func, literal, select
+
+import database
+import availability
+import skill_vocabulary
+from config import Config
+
+
+# ========== 詞彙表 ==========
+
+DEPARTMENTS = [
+    '資訊管理學系', '企業管理學系', '英文學系', '數學系', '會計學系',
+    '經濟學系', '法律學系', '社會學系', '心理學系', '日本語文學系',
+    '物理學系', '化學系', '政治學系', '音樂學系', '中國文學系'
+]
+
+GRADES = ['大一', '大二', '大三', '大四', '碩一', '碩二']
+
+# 實體校區（線上只會出現在任務）
+USER_CAMPUSES = [c for c in Config.CAMPUSES if c != '線上']
+
+# 與媒合引擎的技能關鍵字對齊，推薦分數才有鑑別度
+SKILLS = [
+    '搬運', '修理電腦', '攝影', '設計', '教學', '程式設計', '翻譯', '跑腿',
+    '影片剪輯', '平面設計', 'Photoshop', '組裝家具', '英文教學', '簡報製作',
+    '文書處理', '數學教學', '資料分析', 'Python', '活動協助', '日文'
+]
+
+# 各分類的任務範本：(標題, 描述, 地點)
+TASK_TEMPLATES = {
+    '日常支援': [
+        ('幫忙搬宿舍行李', '需要幫忙搬幾個紙箱和行李箱，大約 20 分鐘。', '柚芳樓 → 楓雅樓'),
+        ('代購午餐', '課太多走不開，幫忙買便當，會多給跑腿費。', '商學院'),
+        ('幫忙修電腦', '電腦無法開機，需要懂電腦的人幫忙檢查維修。', '松勁樓'),
+        ('組裝書櫃', '新買的家具需要組裝，工具已準備好。', '宿舍'),
+    ],
+    '學習互助': [
+        ('教微積分解題', '期中考前想請教導數和積分的應用題，約 1 小時。', '圖書館'),
+        ('英文作文修改', '需要英文好的人幫忙修改作文文法。', '線上'),
+        ('Python 作業討論', '程式作業卡關，希望有人一起 debug。', '電腦教室'),
+        ('統計學家教', '想請人輔導統計學期末考範圍。', '第二教研大樓'),
+    ],
+    '校園協助': [
+        ('協助活動攝影', '系學會晚會需要攝影記錄約 2 小時。', '望星廣場'),
+        ('迎新活動人力', '需要活動協助人員引導新生。', '綜合大樓'),
+        ('社團博覽會佈置', '幫忙搬運器材和佈置攤位。', '操場'),
+    ],
+    '技能交換': [
+        ('海報設計', '社團活動需要一張宣傳海報，會用 Photoshop 尤佳。', '線上'),
+        ('網站程式設計', '想架一個簡單的社團網站，需要寫程式。', '線上'),
+        ('日文翻譯', '需要把一份日文文件翻譯成中文。', '線上'),
+    ],
+    '情境陪伴': [
+        ('陪同就醫', '需要有人陪同到醫院回診。', '校門口'),
+        ('讀書陪伴', '期末考週想找人一起在圖書館讀書。', '圖書館'),
+    ],
+}
+
+CATEGORIES = [c for c in Config.CATEGORIES if c in TASK_TEMPLATES]
+
+# 任務狀態分布
+TASK_STATUS_WEIGHTS = [('open', 0.40), ('in_progress', 0.15), ('completed', 0.40), ('cancelled', 0.05)]
+
+
+# ========== 產生器 ==========
+
+def _batched(rows, batch_size):
+    """將產生器切成固定大小的批次"""
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _bulk_insert(conn, table, rows, batch_size):
+    """以 executemany 批次寫入，回傳筆數"""
+    count = 0
+    for batch in _batched(rows, batch_size):
+        conn.execute(insert(table), batch)
+        count += len(batch)
+    return count
+
+
+def _next_id(conn, table):
+    """取得資料表下一個可用 ID（明確指定 ID，關聯欄位不必回查）"""
+    return (conn.execute(select(func.max(table.c.id))).scalar() or 0) + 1
+
+
+def _sync_sequences(conn, tables):
+    """PostgreSQL：明確寫入 ID 後，將序列推進到目前最大值"""
+    if conn.dialect.name != 'postgresql':
+        return
+    for table in tables:
+        conn.exec_driver_sql(
+            f"SELECT setval(pg_get_serial_sequence('{table.name}', 'id'), "
+            f"COALESCE((SELECT MAX(id) FROM {table.name}), 1))"
+        )
+
+
+def _random_availability(time_rng):
+    """每週有空時段：約七成使用者有設定，1-5 天、每天一段 2-6 小時"""
+    if time_rng.random() >= 0.7:
+        return None
+    windows = []
+    for day in time_rng.sample(range(7), time_rng.randint(1, 5)):
+        start = time_rng.randint(8, 20)
+        windows.append((day, start, start + time_rng.randint(2, 6)))
+    return availability.to_bytes(availability.mask_from_windows(windows))
+
+
+def _random_task_window(time_rng, created_at):
+    """任務時間：約一半的任務指定建立後兩週內的某個時段，長 1-3 小時"""
+    if time_rng.random() >= 0.5:
+        return None, None
+    start = (created_at + timedelta(days=time_rng.randint(0, 14))).replace(
+        hour=time_rng.randint(8, 21), minute=0, second=0, microsecond=0)
+    return start, start + timedelta(hours=time_rng.randint(1, 3))
+
+
+def _generate_users(rng, first_id, num_users, now, time_rng):
+    """產生使用者資料列"""
+    for user_id in range(first_id, first_id + num_users):
+        avg_rating = round(min(5.0, max(1.0, rng.gauss(4.4, 0.45))), 2)
+        completed = int(rng.expovariate(1 / 8))
+        # 與 update_user_rating 相同的信任值公式
+        trust_score = round((avg_rating / 5.0 * 0.7) + (min(1.0, completed / 50) * 0.3), 2)
+        department = rng.choice(DEPARTMENTS)
+        grade = rng.choice(GRADES)
+        campus = rng.choice(USER_CAMPUSES)
+        skills = rng.sample(SKILLS, rng.randint(1, 5))
+
+        yield {
+            'id': user_id,
+            'email': f"user{user_id}@synthetic.scu.edu.tw",
+            'name': f"測試使用者{user_id}",
+            'department': department,
+            'grade': grade,
+            'campus': campus,
+            'skills': json.dumps(skills, ensure_ascii=False),
+            'skill_mask': skill_vocabulary.skill_mask(skills),
+            'availability': _random_availability(time_rng),
+            'points': rng.randint(50, 600),
+            'avg_rating': avg_rating,
+            'completed_tasks': completed,
+            'trust_score': trust_score,
+            'willing_cross_campus': rng.random() < 0.35,
+            'status': 'active',
+            'created_at': now - timedelta(days=rng.randint(30, 720))
+        }
+
+
+def _pick_status(rng):
+    """依分布抽出任務狀態"""
+    r = rng.random()
+    for status, weight in TASK_STATUS_WEIGHTS:
+        if r < weight:
+            return status
+        r -= weight
+    return TASK_STATUS_WEIGHTS[-1][0]
+
+
+def _pick_other_user(rng, user_range, exclude_id):
+    """抽出一位不是 exclude_id 的使用者"""
+    first, last = user_range
+    while True:
+        user_id = rng.randint(first, last)
+        if user_id != exclude_id or first == last:
+            return user_id
+
+
+def _generate_tasks(rng, first_id, num_tasks, user_range, now, applications_per_task, review_rate,
+                    applications, reviews, time_rng):
+    """
+    產生任務資料列，同時把對應的申請與評價放進 applications / reviews 暫存
+
+    申請與評價依附於任務，放在同一個迴圈內產生，才能確保狀態一致
+    （例如進行中的任務一定有一筆 accepted 申請）。
+    """
+    for task_id in range(first_id, first_id + num_tasks):
+        category = rng.choice(CATEGORIES)
+        title, description, location = rng.choice(TASK_TEMPLATES[category])
+        publisher_id = rng.randint(*user_range)
+        status = _pick_status(rng)
+        created_at = now - timedelta(minutes=rng.randint(0, 180 * 24 * 60))
+        points_offered = rng.randrange(Config.POINTS_MIN, 200, 10)
+
+        accepted_user_id = None
+        completed_at = None
+
+        # 申請者（不含發起者）
+        num_applicants = min(int(rng.expovariate(1 / applications_per_task)) if applications_per_task else 0,
+                             user_range[1] - user_range[0])
+        if status in ('in_progress', 'completed'):
+            num_applicants = max(1, num_applicants)
+        applicant_ids = set()
+        while len(applicant_ids) < num_applicants:
+            applicant_ids.add(_pick_other_user(rng, user_range, publisher_id))
+        applicant_ids = sorted(applicant_ids)
+
+        if status in ('in_progress', 'completed') and applicant_ids:
+            accepted_user_id = rng.choice(applicant_ids)
+        if status == 'completed':
+            completed_at = created_at + timedelta(hours=rng.randint(1, 72))
+
+        for applicant_id in applicant_ids:
+            if accepted_user_id is None:
+                app_status = 'pending' if status == 'open' else 'rejected'
+            else:
+                app_status = 'accepted' if applicant_id == accepted_user_id else 'rejected'
+            applications.append({
+                'task_id': task_id,
+                'applicant_id': applicant_id,
+                'status': app_status,
+                'applied_at': created_at + timedelta(minutes=rng.randint(1, 600))
+            })
+
+        # 已完成任務：雙方依機率互評
+        if status == 'completed' and accepted_user_id:
+            for reviewer_id, reviewee_id in ((publisher_id, accepted_user_id), (accepted_user_id, publisher_id)):
+                if rng.random() < review_rate:
+                    reviews.append({
+                        'task_id': task_id,
+                        'reviewer_id': reviewer_id,
+                        'reviewee_id': reviewee_id,
+                        'rating': float(min(5, max(1, round(rng.gauss(4.5, 0.6) * 2) / 2))),
+                        'comment': rng.choice(['', '很準時，推薦！', '溝通順暢', '非常細心', '']),
+                        'created_at': completed_at + timedelta(hours=rng.randint(1, 48))
+                    })
+
+        start_time, end_time = _random_task_window(time_rng, created_at)
+
+        yield {
+            'id': task_id,
+            'publisher_id': publisher_id,
+            'accepted_user_id': accepted_user_id,
+            'title': title,
+            'description': description,
+            'category': category,
+            'location': location,
+            'campus': '線上' if location == '線上' else rng.choice(USER_CAMPUSES),
+            'points_offered': points_offered,
+            'is_urgent': rng.random() < 0.15,
+            'status': status,
+            'created_at': created_at,
+            'updated_at': completed_at or created_at,
+            'completed_at': completed_at,
+            'start_time': start_time,
+            'end_time': end_time
+        }
+
+
+def generate_synthetic_data(num_users=1000, num_tasks=5000, applications_per_task=3.0, review_rate=0.7,
+                            seed=42, batch_size=10000, clear=False):
+    """
+    產生合成資料並批次寫入目前的資料庫
+
+    Args:
+        num_users: 使用者數量
+        num_tasks: 任務數量
+        applications_per_task: 每個任務平均申請數
+        review_rate: 已完成任務中每一方留下評價的機率
+        seed: 亂數種子（相同參數 + 相同種子 = 相同資料）
+        batch_size: 每批寫入筆數
+        clear: 是否先清空現有資料
+
+    Returns:
+        dict: 各資料表寫入筆數與耗時
+    """
+    if num_users < 2:
+        raise ValueError("num_users 至少需要 2 位（任務需要發起者與幫助者）")
+
+    rng = random.Random(seed)
+    # 時段使用獨立的亂數序列，其他欄位維持與加入時段前相同
+    time_rng = random.Random(f"{seed}-availability")
+    now = datetime(2026, 1, 1)  # 固定基準時間，確保可重現
+
+    database.init_db()
+    tables = {model.__tablename__: model.__table__ for model in
+              (database.User, database.Task, database.TaskApplication, database.Review, database.PointLedger,
+               database.Recommendation, database.RecommendationState)}
+    counts = {}
+    start = time.perf_counter()
+
+    if clear:
+        with database.engine.begin() as conn:
+            database.clear_all_data(conn)
+
+    # 使用者（分批寫入）與期初點數帳本在同一個交易，不會只寫入一半
+    with database.engine.begin() as conn:
+        first_user_id = _next_id(conn, tables['users'])
+        counts['users'] = _bulk_insert(
+            conn, tables['users'], _generate_users(rng, first_user_id, num_users, now, time_rng), batch_size
+        )
+        # 期初點數寫入帳本，稽核才會一致
+        conn.execute(
+            insert(tables['point_ledger']).from_select(
+                ['user_id', 'amount', 'reason', 'created_at'],
+                select(tables['users'].c.id, tables['users'].c.points, literal('opening_balance'), literal(now))
+                .where(tables['users'].c.id >= first_user_id)
+            )
+        )
+    user_range = (first_user_id, first_user_id + num_users - 1)
+
+    # 任務 + 申請 + 評價，每批任務寫完就清出暫存
+    counts['tasks'] = counts['task_applications'] = counts['reviews'] = 0
+    with database.engine.connect() as conn:
+        first_task_id = _next_id(conn, tables['tasks'])
+
+    applications, reviews = [], []
+    task_rows = _generate_tasks(rng, first_task_id, num_tasks, user_range, now,
+                                applications_per_task, review_rate, applications, reviews, time_rng)
+    for batch in _batched(task_rows, batch_size):
+        with database.engine.begin() as conn:
+            conn.execute(insert(tables['tasks']), batch)
+            if applications:
+                conn.execute(insert(tables['task_applications']), applications)
+            if reviews:
+                conn.execute(insert(tables['reviews']), reviews)
+        counts['tasks'] += len(batch)
+        counts['task_applications'] += len(applications)
+        counts['reviews'] += len(reviews)
+        applications.clear()
+        reviews.clear()
+
+    with database.engine.begin() as conn:
+        _sync_sequences(conn, tables.values())
+
+    # Core insert 不會觸發 ORM 事件，語意向量在寫完後一次補上
+    if Config.SEMANTIC_MATCHING:
+        database.backfill_embeddings()
+
+    counts['elapsed_seconds'] = round(time.perf_counter() - start, 2)
+    return counts
+
+
+def main():
+    """命令列入口"""
+    parser = argparse.ArgumentParser(description='Campus Help 合成資料產生器')
+    parser.add_argument('--users', type=int, default=1000, help='使用者數量')
+    parser.add_argument('--tasks', type=int, default=5000, help='任務數量')
+    parser.add_argument('--applications-per-task', type=float, default=3.0, help='每個任務平均申請數')
+    parser.add_argument('--review-rate', type=float, default=0.7, help='完成任務的評價機率')
+    parser.add_argument('--seed', type=int, default=42, help='亂數種子')
+    parser.add_argument('--batch-size', type=int, default=10000, help='每批寫入筆數')
+    parser.add_argument('--database-url', help='目標資料庫（預設使用 DATABASE_URL）')
+    parser.add_argument('--clear', action='store_true', help='先清空現有資料')
+    args = parser.parse_args()
+
+    if args.database_url:
+        database.configure_database(args.database_url)
+
+    print("=" * 50)
+    print("  Campus Help 合成資料產生器")
+    print("=" * 50)
+    print(f"   資料庫: {database.engine.url}")
+    print(f"   種子: {args.seed}")
+
+    counts = generate_synthetic_data(
+        num_users=args.users,
+        num_tasks=args.tasks,
+        applications_per_task=args.applications_per_task,
+        review_rate=args.review_rate,
+        seed=args.seed,
+        batch_size=args.batch_size,
+        clear=args.clear
+    )
+
+    print("\n✅ 合成資料建立完成！")
+    print(f"   - 使用者: {counts['users']} 位")
+    print(f"   - 任務: {counts['tasks']} 個")
+    print(f"   - 申請: {counts['task_applications']} 筆")
+    print(f"   - 評價: {counts['reviews']} 則")
+    total_rows = counts['users'] + counts['tasks'] + counts['task_applications'] + counts['reviews']
+    print(f"   ⏱️  耗時: {counts['elapsed_seconds']} 秒（{total_rows / max(counts['elapsed_seconds'], 0.01):.0f} 筆/秒）")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,19 +1,100 @@
 """
 資料庫模組 - Campus Help (增強版)
-使用 SQLite + SQLAlchemy
+使用 SQLAlchemy（預設 SQLite，可透過 DATABASE_URL 切換為 PostgreSQL）
 新增：評價系統、任務狀態管理、點數轉換
 """
-from sqlalchemy import create_engine, Column, Integer, String, Float, Boolean, DateTime, Text, ForeignKey
+from sqlalchemy import create_engine, event, inspect, text, func, select, insert, update, delete, case, literal, bindparam, Column, Index, Integer, BigInteger, String, Float, Boolean, DateTime, Text, LargeBinary, ForeignKey
+from sqlalchemy.exc import DBAPIError
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship
-from datetime import datetime
+from sqlalchemy.orm import sessionmaker, relationship, aliased
+from sqlalchemy.orm.attributes import flag_modified
+from sqlalchemy.orm.exc import StaleDataError
+from datetime import datetime, timedelta
+import heapq
 import json
+import random
+import threading
+import time
+import uuid
+
+from config import Config
+import query_profiler
+import skill_vocabulary
+import semantic
+import availability
+import matching_config
+
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    """新連線建立時套用 SQLite PRAGMA 設定"""
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA busy_timeout = {int(Config.SQLITE_BUSY_TIMEOUT)}")
+    cursor.execute(f"PRAGMA journal_mode = {Config.SQLITE_JOURNAL_MODE}")
+    cursor.execute(f"PRAGMA synchronous = {Config.SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA cache_size = {int(Config.SQLITE_CACHE_SIZE)}")
+    cursor.execute(f"PRAGMA mmap_size = {int(Config.SQLITE_MMAP_SIZE)}")
+    cursor.close()
+
+
+def create_db_engine(database_url=None, echo=False):
+    """
+    建立資料庫引擎
+    
+    Args:
+        database_url: 資料庫連線字串（預設使用 Config.DATABASE_URL）
+        echo: 是否輸出 SQL
+    
+    Returns:
+        Engine: SQLAlchemy 引擎（SQLite 會自動套用 WAL 等 PRAGMA 設定，
+                其他資料庫使用連線池設定）
+    """
+    database_url = database_url or Config.DATABASE_URL
+    
+    if database_url.startswith('sqlite'):
+        db_engine = create_engine(database_url, echo=echo)
+        event.listen(db_engine, 'connect', _apply_sqlite_pragmas)
+    else:
+        db_engine = create_engine(
+            database_url,
+            echo=echo,
+            pool_size=Config.DB_POOL_SIZE,
+            max_overflow=Config.DB_MAX_OVERFLOW,
+            pool_recycle=Config.DB_POOL_RECYCLE,
+            pool_pre_ping=True
+        )
+    
+    if Config.SQL_PROFILING:
+        query_profiler.attach(db_engine)
+    
+    return db_engine
+
 
 # 建立引擎
-engine = create_engine('sqlite:///campus_help.db', echo=False)
+engine = create_db_engine()
 Base = declarative_base()
 Session = sessionmaker(bind=engine)
 
+
+def configure_database(database_url=None, echo=False):
+    """
+    切換資料庫後端（重新綁定模組層級的 engine 與 Session）
+    
+    Args:
+        database_url: 資料庫連線字串（預設使用 Config.DATABASE_URL）
+        echo: 是否輸出 SQL
+    
+    Returns:
+        Engine: 新的 SQLAlchemy 引擎
+    """
+    global engine
+    
+    old_engine = engine
+    engine = create_db_engine(database_url, echo=echo)
+    Session.configure(bind=engine)
+    old_engine.dispose()
+    
+    return engine
+
 # ========== 資料模型 ==========
 
 class User(Base):
@@ -27,6 +108,9 @@ class User(Base):
     grade = Column(String(20))
     campus = Column(String(50))
     skills = Column(Text)  # JSON 格式儲存技能列表
+    skill_mask = Column(BigInteger)  # 正規化後的技能位元遮罩（見 skill_vocabulary）
+    skill_embedding = Column(LargeBinary)  # 技能語意向量（float32，SEMANTIC_MATCHING 開啟時計算）
+    availability = Column(LargeBinary)  # 每週有空時段位元圖（見 availability；未設定為 NULL）
     
     # 統計資料
     points = Column(Integer, default=100)
@@ -39,6 +123,10 @@ class User(Base):
     status = Column(String(20), default='active')
     
     created_at = Column(DateTime, default=datetime.utcnow)
+    version = Column(Integer, nullable=False, default=0)  # 樂觀並行控制：每次寫入加一
+    
+    # ORM 寫入時自動帶上 WHERE version = 讀取時的版本，被搶先則拋出 StaleDataError
+    __mapper_args__ = {'version_id_col': version}
     
     def to_dict(self):
         """轉換為字典"""
@@ -50,6 +138,9 @@ class User(Base):
             'grade': self.grade,
             'campus': self.campus,
             'skills': json.loads(self.skills) if self.skills else [],
+            'skill_mask': self.skill_mask,
+            'availability': availability.from_bytes(self.availability),
+            'skill_embedding': self.skill_embedding,
             'points': self.points,
             'avg_rating': self.avg_rating,
             'completed_tasks': self.completed_tasks,
@@ -59,6 +150,15 @@ class User(Base):
         }
 
 
+@event.listens_for(User.skills, 'set')
+def _sync_skill_mask(user, value, oldvalue, initiator):
+    """設定技能時一併更新位元遮罩（與語意向量）"""
+    skills = json.loads(value) if value else []
+    user.skill_mask = skill_vocabulary.skill_mask(skills)
+    if Config.SEMANTIC_MATCHING:
+        user.skill_embedding = semantic.to_blob(semantic.user_vector(skills))
+
+
 class Task(Base):
     """任務模型"""
     __tablename__ = 'tasks'
@@ -80,35 +180,76 @@ class Task(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     completed_at = Column(DateTime, nullable=True)  # 新增：完成時間
+    start_time = Column(DateTime, nullable=True)  # 任務進行時間（未設定表示時間彈性）
+    end_time = Column(DateTime, nullable=True)
+    embedding = Column(LargeBinary)  # 標題、描述、分類的語意向量（float32，SEMANTIC_MATCHING 開啟時計算）
+    version = Column(Integer, nullable=False, default=0)  # 樂觀並行控制：每次狀態變更加一
     
     # 關聯
     publisher = relationship('User', foreign_keys=[publisher_id])
     accepted_user = relationship('User', foreign_keys=[accepted_user_id])
     
+    # 索引：開放中任務另建部分索引（PostgreSQL / SQLite 皆支援）
+    __table_args__ = (
+        Index('ix_tasks_status_created_at', 'status', 'created_at'),
+        Index('ix_tasks_publisher_id', 'publisher_id'),
+        Index('ix_tasks_accepted_user_id', 'accepted_user_id'),
+        Index(
+            'ix_tasks_open_created_at', 'created_at',
+            postgresql_where=text("status = 'open'"),
+            sqlite_where=text("status = 'open'")
+        ),
+    )
+    __mapper_args__ = {'version_id_col': version}
+    
     def to_dict(self):
         """轉換為字典"""
         session = Session()
-        publisher = session.query(User).filter_by(id=self.publisher_id).first()
-        accepted_user = session.query(User).filter_by(id=self.accepted_user_id).first() if self.accepted_user_id else None
+        try:
+            publisher = session.query(User).filter_by(id=self.publisher_id).first()
+            accepted_user = session.query(User).filter_by(id=self.accepted_user_id).first() if self.accepted_user_id else None
+        finally:
+            session.close()
         
-        return {
-            'id': self.id,
-            'title': self.title,
-            'description': self.description,
-            'category': self.category,
-            'location': self.location,
-            'campus': self.campus,
-            'points_offered': self.points_offered,
-            'is_urgent': self.is_urgent,
-            'status': self.status,
-            'publisher_id': self.publisher_id,
-            'publisher_name': publisher.name if publisher else '未知',
-            'publisher_rating': publisher.avg_rating if publisher else 0,
-            'accepted_user_id': self.accepted_user_id,
-            'accepted_user_name': accepted_user.name if accepted_user else None,
-            'created_at': self.created_at.strftime('%Y-%m-%d %H:%M') if self.created_at else None,
-            'completed_at': self.completed_at.strftime('%Y-%m-%d %H:%M') if self.completed_at else None
-        }
+        return _task_to_dict(self, publisher, accepted_user)
+
+
+@event.listens_for(Task, 'before_insert')
+@event.listens_for(Task, 'before_update')
+def _sync_task_embedding(mapper, connection, task):
+    """寫入任務時計算語意向量（文字欄位沒有變動就沿用）"""
+    if not Config.SEMANTIC_MATCHING:
+        return
+    state = inspect(task)
+    if task.embedding is None or any(state.attrs[name].history.has_changes() for name in ('title', 'description', 'category')):
+        task.embedding = semantic.to_blob(
+            semantic.embed_text(semantic.task_text(task.title, task.description, task.category))
+        )
+
+
+def _task_to_dict(task, publisher, accepted_user):
+    """以已載入的發起者與幫助者組出任務字典（不再查詢資料庫）"""
+    return {
+        'id': task.id,
+        'title': task.title,
+        'description': task.description,
+        'category': task.category,
+        'location': task.location,
+        'campus': task.campus,
+        'points_offered': task.points_offered,
+        'is_urgent': task.is_urgent,
+        'status': task.status,
+        'publisher_id': task.publisher_id,
+        'publisher_name': publisher.name if publisher else '未知',
+        'publisher_rating': publisher.avg_rating if publisher else 0,
+        'accepted_user_id': task.accepted_user_id,
+        'accepted_user_name': accepted_user.name if accepted_user else None,
+        'created_at': task.created_at.strftime('%Y-%m-%d %H:%M') if task.created_at else None,
+        'completed_at': task.completed_at.strftime('%Y-%m-%d %H:%M') if task.completed_at else None,
+        'start_time': task.start_time.strftime('%Y-%m-%d %H:%M') if task.start_time else None,
+        'end_time': task.end_time.strftime('%Y-%m-%d %H:%M') if task.end_time else None,
+        'embedding': task.embedding
+    }
 
 
 class TaskApplication(Base):
@@ -126,10 +267,19 @@ class TaskApplication(Base):
     task = relationship('Task', foreign_keys=[task_id])
     applicant = relationship('User', foreign_keys=[applicant_id])
     
+    # 索引
+    __table_args__ = (
+        Index('ix_task_applications_task_id_applicant_id', 'task_id', 'applicant_id'),
+        Index('ix_task_applications_applicant_id', 'applicant_id'),
+    )
+    
     def to_dict(self):
         """轉換為字典"""
         session = Session()
-        applicant = session.query(User).filter_by(id=self.applicant_id).first()
+        try:
+            applicant = session.query(User).filter_by(id=self.applicant_id).first()
+        finally:
+            session.close()
         
         return {
             'id': self.id,
@@ -161,12 +311,21 @@ class Review(Base):
     reviewer = relationship('User', foreign_keys=[reviewer_id])
     reviewee = relationship('User', foreign_keys=[reviewee_id])
     
+    # 索引
+    __table_args__ = (
+        Index('ix_reviews_reviewee_id_created_at', 'reviewee_id', 'created_at'),
+        Index('ix_reviews_task_id_reviewer_id', 'task_id', 'reviewer_id'),
+    )
+    
     def to_dict(self):
         """轉換為字典"""
         session = Session()
-        reviewer = session.query(User).filter_by(id=self.reviewer_id).first()
-        reviewee = session.query(User).filter_by(id=self.reviewee_id).first()
-        task = session.query(Task).filter_by(id=self.task_id).first()
+        try:
+            reviewer = session.query(User).filter_by(id=self.reviewer_id).first()
+            reviewee = session.query(User).filter_by(id=self.reviewee_id).first()
+            task = session.query(Task).filter_by(id=self.task_id).first()
+        finally:
+            session.close()
         
         return {
             'id': self.id,
@@ -182,59 +341,298 @@ class Review(Base):
         }
 
 
+class PointLedger(Base):
+    """點數帳本（只新增不修改，使用者點數可由帳本加總還原）"""
+    __tablename__ = 'point_ledger'
+    
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    task_id = Column(Integer, ForeignKey('tasks.id'), nullable=True)
+    
+    amount = Column(Integer, nullable=False)  # 正數為入帳，負數為扣除
+    reason = Column(String(30), nullable=False)  # opening_balance, task_publish, task_reward
+    
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    # 索引
+    __table_args__ = (
+        Index('ix_point_ledger_user_id', 'user_id'),
+    )
+
+
+class Skill(Base):
+    """標準技能（由 Config.SKILL_SYNONYMS 同步）"""
+    __tablename__ = 'skills'
+    
+    id = Column(Integer, primary_key=True)
+    name = Column(String(50), unique=True, nullable=False)  # 小寫
+    bit = Column(Integer, unique=True, nullable=False)  # 在 users.skill_mask 中的位元位置
+
+
+class SkillSynonym(Base):
+    """技能同義詞（例如 ps → 設計）"""
+    __tablename__ = 'skill_synonyms'
+    
+    alias = Column(String(50), primary_key=True)  # 小寫
+    skill_id = Column(Integer, ForeignKey('skills.id'), nullable=False)
+
+
+class Recommendation(Base):
+    """預先計算的推薦清單（由 recommendation_worker 維護，每位使用者 Top K）"""
+    __tablename__ = 'recommendations'
+    
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    task_id = Column(Integer, ForeignKey('tasks.id'), nullable=False)
+    
+    rank = Column(Integer, nullable=False)  # 1 為最推薦
+    score = Column(Float, nullable=False)
+    details = Column(Text)  # JSON 格式儲存各項分數
+    
+    # 索引：頁面以 (user_id, rank) 讀取；任務關閉時以 task_id 找出受影響的清單
+    __table_args__ = (
+        Index('ix_recommendations_user_id_rank', 'user_id', 'rank'),
+        Index('ix_recommendations_task_id', 'task_id'),
+    )
+
+
+class RecommendationState(Base):
+    """每位使用者推薦清單的更新狀態"""
+    __tablename__ = 'recommendation_state'
+    
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    computed_at = Column(DateTime, nullable=True)  # 清單最後一次更新的時間
+    stale = Column(Boolean, default=False)  # 個人資料變更後需要整份重算
+    stale_since = Column(DateTime, nullable=True)
+    config_version = Column(String(16))  # 計算清單時的媒合設定版本（設定變更後整份重算）
+
+
+class IdempotencyKey(Base):
+    """寫入操作的冪等鍵：同一個鍵重送時直接回傳第一次的結果"""
+    __tablename__ = 'idempotency_keys'
+    
+    operation = Column(String(50), primary_key=True)  # create_task, apply_for_task, submit_review
+    key = Column(String(64), primary_key=True)  # 用戶端產生（見 new_idempotency_key）
+    result = Column(Text, nullable=False)  # JSON 格式儲存第一次執行的回傳值
+    created_at = Column(DateTime, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False)
+    
+    __table_args__ = (
+        Index('ix_idempotency_keys_expires_at', 'expires_at'),
+    )
+
+
+class OutboxEvent(Base):
+    """任務生命週期事件（與寫入在同一個交易附加，ID 即讀取位移，依提交順序連續編號）"""
+    __tablename__ = 'outbox_events'
+    
+    id = Column(Integer, primary_key=True, autoincrement=False)  # 由 outbox_sequence 配發
+    event_type = Column(String(50), nullable=False)  # task_created, task_applied, task_accepted, task_completed, review_submitted
+    task_id = Column(Integer, nullable=True)
+    payload = Column(Text, nullable=False)  # JSON 格式
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    def to_dict(self):
+        """轉換為字典"""
+        return {
+            'id': self.id,
+            'event_type': self.event_type,
+            'task_id': self.task_id,
+            'payload': json.loads(self.payload),
+            'created_at': self.created_at
+        }
+
+
+class OutboxSequence(Base):
+    """事件 ID 計數器（只有一列）"""
+    __tablename__ = 'outbox_sequence'
+    
+    id = Column(Integer, primary_key=True)
+    last_id = Column(Integer, nullable=False, default=0)
+
+
+class OutboxOffset(Base):
+    """各事件消費者已處理到的位移"""
+    __tablename__ = 'outbox_offsets'
+    
+    consumer = Column(String(100), primary_key=True)
+    last_id = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
 # ========== 資料庫操作函數 ==========
 
 def init_db():
     """初始化資料庫"""
     Base.metadata.create_all(engine)
+    _add_missing_columns()
+    _backfill_versions()
+    _init_outbox_sequence()
+    
+    # 既有資料表不會被 create_all 補上新索引，逐一檢查建立
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+    
+    backfill_point_ledger()
+    sync_skill_vocabulary()
+    if Config.SEMANTIC_MATCHING:
+        backfill_embeddings()
+
+
+def _add_missing_columns():
+    """既有資料表不會被 create_all 補上新欄位，以 ALTER TABLE 新增（新欄位皆可為空）"""
+    inspector = inspect(engine)
+    
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    column_type = column.type.compile(dialect=engine.dialect)
+                    conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+
+
+def _backfill_versions():
+    """ALTER TABLE 新增的版本欄位為 NULL，補成 0（NULL 永遠比對不到，CAS 更新會一直失敗）"""
+    with engine.begin() as conn:
+        for model in (User, Task):
+            conn.execute(update(model.__table__).where(model.__table__.c.version == None).values(version=0))
+
+
+def iter_users(chunk_size=None):
+    """
+    逐筆產生所有使用者字典（串流讀取，記憶體只保留一批）
+    
+    Args:
+        chunk_size: 每批讀取筆數（預設 Config.DB_STREAM_CHUNK_SIZE）
+    
+    Yields:
+        dict: 使用者字典（同 get_all_users）
+    """
+    session = Session()
+    
+    try:
+        query = session.query(User).filter_by(status='active').order_by(User.id)
+        for user in query.yield_per(chunk_size or Config.DB_STREAM_CHUNK_SIZE):
+            yield user.to_dict()
+    finally:
+        session.close()
 
 
 def get_all_users():
     """取得所有使用者"""
-    session = Session()
-    users = session.query(User).filter_by(status='active').all()
-    return [u.to_dict() for u in users]
+    return list(iter_users())
 
 
 def get_user_by_name(name):
     """根據名字取得使用者"""
     session = Session()
-    user = session.query(User).filter_by(name=name, status='active').first()
-    return user.to_dict() if user else None
+    
+    try:
+        user = session.query(User).filter_by(name=name, status='active').first()
+        return user.to_dict() if user else None
+    finally:
+        session.close()
 
 
 def get_user_by_id(user_id):
     """根據 ID 取得使用者"""
     session = Session()
-    user = session.query(User).filter_by(id=user_id).first()
-    return user.to_dict() if user else None
+    
+    try:
+        user = session.query(User).filter_by(id=user_id).first()
+        return user.to_dict() if user else None
+    finally:
+        session.close()
 
 
-def get_all_tasks(status=None):
-    """取得所有任務"""
-    session = Session()
-    query = session.query(Task)
+def update_user_availability(user_id, windows):
+    """
+    更新使用者每週有空的時段
     
-    if status:
-        query = query.filter_by(status=status)
+    Args:
+        user_id: 使用者 ID
+        windows: [(星期 0-6, 開始小時, 結束小時)]；None 表示清除（時間分數不再比對）
+    
+    Returns:
+        bool: 是否成功
+    """
+    session = Session()
     
-    tasks = query.order_by(Task.created_at.desc()).all()
-    return [t.to_dict() for t in tasks]
+    try:
+        mask = availability.mask_from_windows(windows) if windows is not None else None
+        updated = session.query(User).filter(User.id == user_id).update(
+            {User.availability: availability.to_bytes(mask), User.version: User.version + 1}, synchronize_session=False
+        )
+        if not updated:
+            return False
+        _mark_recommendations_stale(session, [user_id])
+        session.commit()
+        return True
+    except Exception as e:
+        session.rollback()
+        print(f"更新有空時段失敗: {e}")
+        return False
+    finally:
+        session.close()
 
 
-def create_task(task_data):
-    """建立任務（會扣除發起者點數）"""
+def iter_tasks(status=None, chunk_size=None):
+    """
+    逐筆產生任務字典（依建立時間新到舊；串流讀取，發起者與幫助者一併 JOIN，不逐筆查詢）
+    
+    Args:
+        status: 任務狀態篩選（可選）
+        chunk_size: 每批讀取筆數（預設 Config.DB_STREAM_CHUNK_SIZE）
+    
+    Yields:
+        dict: 任務字典（同 get_all_tasks）
+    """
     session = Session()
     
     try:
-        publisher = session.query(User).filter_by(id=task_data['publisher_id']).first()
+        Publisher = aliased(User)
+        AcceptedUser = aliased(User)
+        query = (
+            session.query(Task, Publisher, AcceptedUser)
+            .outerjoin(Publisher, Publisher.id == Task.publisher_id)
+            .outerjoin(AcceptedUser, AcceptedUser.id == Task.accepted_user_id)
+        )
         
-        # 檢查點數是否足夠
-        if publisher.points < task_data['points_offered']:
-            return None  # 點數不足
+        if status:
+            query = query.filter(Task.status == status)
         
-        # 扣除點數
-        publisher.points -= task_data['points_offered']
+        query = query.order_by(Task.created_at.desc())
+        for task, publisher, accepted_user in query.yield_per(chunk_size or Config.DB_STREAM_CHUNK_SIZE):
+            yield _task_to_dict(task, publisher, accepted_user)
+    finally:
+        session.close()
+
+
+def get_all_tasks(status=None):
+    """取得所有任務"""
+    return list(iter_tasks(status))
+
+
+def create_task(task_data, idempotency_key=None):
+    """
+    建立任務（會扣除發起者點數）
+    
+    Args:
+        task_data: 任務資料
+        idempotency_key: 冪等鍵（可選）；重送時回傳第一次建立的任務 ID，不會重複扣點
+    
+    Returns:
+        int: 任務 ID；點數不足或失敗為 None
+    """
+    session = Session()
+    
+    try:
+        if idempotency_key:
+            found, task_id = _find_idempotent_result(session, 'create_task', idempotency_key)
+            if found:
+                return task_id
         
         # 建立任務
         task = Task(
@@ -245,211 +643,1010 @@ def create_task(task_data):
             location=task_data['location'],
             campus=task_data['campus'],
             points_offered=task_data['points_offered'],
-            is_urgent=task_data.get('is_urgent', False)
+            is_urgent=task_data.get('is_urgent', False),
+            start_time=task_data.get('start_time'),
+            end_time=task_data.get('end_time')
         )
         
         session.add(task)
+        session.flush()
+        
+        # 扣除點數（餘額檢查與扣款在同一個 UPDATE 完成）
+        if not _adjust_points(session, task.publisher_id, -task.points_offered, 'task_publish', task.id):
+            session.rollback()
+            return None  # 點數不足
+        
+        task_id = task.id
+        if idempotency_key:
+            _save_idempotent_result(session, 'create_task', idempotency_key, task_id)
+        append_outbox_events(session.connection(), [outbox_event_row('task_created', task_id, {
+            'publisher_id': task.publisher_id, 'category': task.category, 'campus': task.campus,
+            'points_offered': task.points_offered, 'is_urgent': bool(task.is_urgent)
+        })])
+        session.commit()
+        
+        return task_id
+    except Exception as e:
+        session.rollback()
+        found, task_id = get_idempotent_result('create_task', idempotency_key)
+        if found:
+            return task_id
+        print(f"建立任務失敗: {e}")
+        return None
+    finally:
+        session.close()
+
+
+def iter_user_tasks(user_id, task_type='published', status=None, application_status=None,
+                    limit=None, offset=0, chunk_size=None):
+    """逐筆產生使用者的任務字典（參數同 get_user_tasks，另可指定每批讀取筆數）"""
+    session = Session()
+    
+    try:
+        Publisher = aliased(User)
+        AcceptedUser = aliased(User)
+        
+        if task_type == 'published':
+            query = (
+                session.query(Task, Publisher, AcceptedUser)
+                .outerjoin(Publisher, Publisher.id == Task.publisher_id)
+                .outerjoin(AcceptedUser, AcceptedUser.id == Task.accepted_user_id)
+                .filter(Task.publisher_id == user_id)
+            )
+            if status:
+                query = query.filter(Task.status == status)
+            # 同一時間建立的任務以 ID 排序，分頁之間不會重複或遺漏
+            query = query.order_by(Task.created_at.desc(), Task.id.desc()).offset(offset)
+            if limit is not None:
+                query = query.limit(limit)
+            
+            for task, publisher, accepted_user in query.yield_per(chunk_size or Config.DB_STREAM_CHUNK_SIZE):
+                yield _task_to_dict(task, publisher, accepted_user)
+        
+        elif task_type == 'applied':
+            # 單一查詢：申請記錄 + 任務 + 發起者 + 幫助者
+            query = (
+                session.query(TaskApplication, Task, Publisher, AcceptedUser)
+                .join(Task, Task.id == TaskApplication.task_id)
+                .outerjoin(Publisher, Publisher.id == Task.publisher_id)
+                .outerjoin(AcceptedUser, AcceptedUser.id == Task.accepted_user_id)
+                .filter(TaskApplication.applicant_id == user_id)
+            )
+            if status:
+                query = query.filter(Task.status == status)
+            if application_status:
+                query = query.filter(TaskApplication.status == application_status)
+            query = query.order_by(TaskApplication.id).offset(offset)
+            if limit is not None:
+                query = query.limit(limit)
+            
+            for app, task, publisher, accepted_user in query.yield_per(chunk_size or Config.DB_STREAM_CHUNK_SIZE):
+                task_dict = _task_to_dict(task, publisher, accepted_user)
+                task_dict['application_status'] = app.status
+                task_dict['applied_at'] = app.applied_at.strftime('%Y-%m-%d %H:%M') if app.applied_at else None
+                yield task_dict
+    finally:
+        session.close()
+
+
+def get_user_tasks(user_id, task_type='published', status=None, application_status=None,
+                   limit=None, offset=0):
+    """取得使用者的任務
+    
+    Args:
+        user_id: 使用者 ID
+        task_type: 'published' (發布的) 或 'applied' (申請的)
+        status: 任務狀態篩選（可選）
+        application_status: 申請狀態篩選，僅用於 'applied'（可選）
+        limit: 每頁筆數（可選，不指定則回傳全部）
+        offset: 略過筆數
+    """
+    return list(iter_user_tasks(user_id, task_type, status, application_status, limit, offset))
+
+
+def apply_for_task(task_id, applicant_id, idempotency_key=None):
+    """
+    申請任務
+    
+    Args:
+        task_id: 任務 ID
+        applicant_id: 申請者 ID
+        idempotency_key: 冪等鍵（可選）；重送時回傳第一次的結果
+    
+    Returns:
+        bool: 是否成功
+    """
+    session = Session()
+    
+    try:
+        if idempotency_key:
+            found, result = _find_idempotent_result(session, 'apply_for_task', idempotency_key)
+            if found:
+                return result
+        
+        # 檢查是否已申請
+        existing = session.query(TaskApplication).filter_by(
+            task_id=task_id,
+            applicant_id=applicant_id
+        ).first()
+        
+        if existing:
+            return False  # 已經申請過
+        
+        # 建立申請記錄
+        application = TaskApplication(
+            task_id=task_id,
+            applicant_id=applicant_id
+        )
+        
+        session.add(application)
+        session.flush()
+        if idempotency_key:
+            _save_idempotent_result(session, 'apply_for_task', idempotency_key, True)
+        append_outbox_events(session.connection(), [outbox_event_row('task_applied', task_id, {'applicant_id': applicant_id})])
         session.commit()
         
-        return task.id
+        return True
+    except Exception as e:
+        session.rollback()
+        found, result = get_idempotent_result('apply_for_task', idempotency_key)
+        if found:
+            return result
+        print(f"申請任務失敗: {e}")
+        return False
+    finally:
+        session.close()
+
+
+def get_task_applications(task_id):
+    """取得任務的所有申請"""
+    session = Session()
+    
+    try:
+        applications = session.query(TaskApplication).filter_by(task_id=task_id).all()
+        return [a.to_dict() for a in applications]
+    finally:
+        session.close()
+
+
+# ========== 樂觀並行控制 ==========
+#
+# 任務與使用者帶有 version 欄位：讀取時不上鎖，寫入時以 WHERE version = 讀取時的版本
+# 做 compare-and-swap，被其他交易搶先（影響 0 筆）就整個交易重來。
+# 所有變更業務狀態的 UPDATE 都要一併 version + 1。
+
+class ConflictError(Exception):
+    """CAS 更新失敗：讀取後資料已被其他交易修改"""
+
+
+_conflict_lock = threading.Lock()
+_conflict_stats = {}
+
+
+def _record_conflict(operation, field):
+    with _conflict_lock:
+        stats = _conflict_stats.setdefault(operation, {'attempts': 0, 'conflicts': 0, 'exhausted': 0})
+        stats[field] += 1
+
+
+def get_conflict_stats():
+    """
+    取得各操作的版本衝突統計
+    
+    Returns:
+        dict: {操作名稱: {'attempts': 執行次數, 'conflicts': 衝突次數, 'exhausted': 重試用盡次數}}
+    """
+    with _conflict_lock:
+        return {operation: dict(stats) for operation, stats in _conflict_stats.items()}
+
+
+def reset_conflict_stats():
+    """清除版本衝突統計"""
+    with _conflict_lock:
+        _conflict_stats.clear()
+
+
+# PostgreSQL 死結（40P01）與序列化失敗（40001）：交易整個重來即可
+_RETRYABLE_SQLSTATES = {'40P01', '40001'}
+
+
+def _is_retryable(error):
+    """資料庫錯誤是否為死結或序列化失敗"""
+    orig = getattr(error, 'orig', None)
+    return (getattr(orig, 'pgcode', None) in _RETRYABLE_SQLSTATES or
+            getattr(orig, 'sqlstate', None) in _RETRYABLE_SQLSTATES)
+
+
+def _run_with_retry(operation, work):
+    """
+    執行交易，版本衝突、死結或序列化失敗時回滾並以指數退避重試
+    
+    Args:
+        operation: 操作名稱（衝突統計用）
+        work: 接收 session 的函數；回傳值為真時提交，否則回滾
+    
+    Returns:
+        work 的回傳值；重試用盡回傳 False
+    """
+    retries = Config.DB_CONFLICT_RETRIES
+    for attempt in range(retries + 1):
+        _record_conflict(operation, 'attempts')
+        session = Session()
+        try:
+            result = work(session)
+            if result:
+                session.commit()
+            else:
+                session.rollback()
+            return result
+        except (ConflictError, StaleDataError, DBAPIError) as e:
+            session.rollback()
+            if isinstance(e, DBAPIError) and not _is_retryable(e):
+                raise
+            _record_conflict(operation, 'conflicts')
+        finally:
+            session.close()
+        
+        if attempt < retries:
+            time.sleep(min(0.5, Config.DB_CONFLICT_BACKOFF * (2 ** attempt)) * random.uniform(0.5, 1.5))
+    
+    _record_conflict(operation, 'exhausted')
+    print(f"{operation} 版本衝突重試 {retries} 次仍失敗")
+    return False
+
+
+# ========== 冪等鍵 ==========
+#
+# Streamlit 重新執行或使用者連點時，同一個寫入會被送出多次。呼叫端帶上冪等鍵，
+# 第一次成功時結果與寫入在同一個交易記錄下來，之後同一個鍵直接回傳記錄的結果、不碰主要資料表；
+# 同時送出的重複請求在寫入冪等鍵時主鍵衝突而整個回滾，改回傳先提交者的結果。
+# 失敗（例如點數不足）不記錄，重送會重新檢查。
+
+def new_idempotency_key():
+    """產生冪等鍵"""
+    return uuid.uuid4().hex
+
+
+def _find_idempotent_result(session, operation, key):
+    """
+    查詢冪等鍵記錄的結果（過期但尚未清除的記錄一併刪除，視為不存在）
+    
+    Returns:
+        tuple: (是否有記錄, 記錄的結果)
+    """
+    record = session.get(IdempotencyKey, (operation, key))
+    if record is None:
+        return False, None
+    if record.expires_at <= datetime.utcnow():
+        session.delete(record)
+        session.flush()
+        return False, None
+    return True, json.loads(record.result)
+
+
+def _save_idempotent_result(session, operation, key, result):
+    """在寫入的同一個交易記錄結果"""
+    now = datetime.utcnow()
+    session.add(IdempotencyKey(
+        operation=operation, key=key, result=json.dumps(result), created_at=now,
+        expires_at=now + timedelta(seconds=Config.IDEMPOTENCY_TTL)
+    ))
+    session.flush()
+
+
+def get_idempotent_result(operation, key):
+    """
+    查詢冪等鍵是否已有記錄的結果（寫入失敗後也用來檢查同時送出的重複請求是否已提交）
+    
+    Args:
+        operation: 操作名稱（create_task, apply_for_task, submit_review）
+        key: 冪等鍵
+    
+    Returns:
+        tuple: (是否有記錄, 記錄的結果)
+    """
+    if not key:
+        return False, None
+    session = Session()
+    try:
+        return _find_idempotent_result(session, operation, key)
+    finally:
+        session.close()
+
+
+def sweep_idempotency_keys(now=None):
+    """
+    刪除過期的冪等鍵
+    
+    Args:
+        now: 以此時間判斷是否過期（預設為現在）
+    
+    Returns:
+        int: 刪除的筆數
+    """
+    session = Session()
+    
+    try:
+        result = session.execute(
+            IdempotencyKey.__table__.delete().where(IdempotencyKey.expires_at <= (now or datetime.utcnow()))
+        )
+        session.commit()
+        return result.rowcount
+    except Exception as e:
+        session.rollback()
+        print(f"清除過期冪等鍵失敗: {e}")
+        return 0
+    finally:
+        session.close()
+
+
+def start_idempotency_sweeper(interval=None):
+    """
+    在背景執行緒定期清除過期的冪等鍵
+    
+    Returns:
+        threading.Event: 設定後背景執行緒會停止
+    """
+    stop_event = threading.Event()
+    interval = interval or Config.IDEMPOTENCY_SWEEP_INTERVAL
+    
+    def run():
+        while not stop_event.wait(interval):
+            sweep_idempotency_keys()
+    
+    thread = threading.Thread(target=run, name='idempotency-sweeper', daemon=True)
+    thread.start()
+    return stop_event
+
+
+# ========== 事件 Outbox ==========
+#
+# 生命週期寫入（建立、申請、接受、完成、評價）在同一個交易附加事件到 outbox_events，
+# 交易回滾事件也一併消失。推薦更新、統計、通知等下游依事件 ID 位移增量讀取，不必重掃資料表。
+# 事件 ID 由 outbox_sequence 的單一計數列配發：附加事件是交易的最後一步，計數列鎖定到提交為止，
+# 因此 ID 依提交順序連續、沒有空號（回滾時計數一併回滾），讀取到某個 ID 就不會再出現更小的 ID。
+
+def outbox_event_row(event_type, task_id, payload, created_at=None):
+    """組成一筆 outbox_events 資料列（供 append_outbox_events 批次附加）"""
+    return {
+        'event_type': event_type,
+        'task_id': task_id,
+        'payload': json.dumps(payload, ensure_ascii=False, default=str),
+        'created_at': created_at or datetime.utcnow()
+    }
+
+
+def append_outbox_events(connection, rows):
+    """
+    在目前交易附加事件
+    
+    須是交易的最後一個寫入：其他寫入（含冪等鍵）都要先執行或 flush，之後只剩提交，
+    計數列的鎖才只持有到提交為止，也不會在持有時等待其他資料列的鎖。
+    
+    Args:
+        connection: 交易中的連線（session.connection()）
+        rows: outbox_event_row 組成的資料列
+    """
+    if not rows:
+        return
+    sequence = OutboxSequence.__table__
+    connection.execute(
+        update(sequence).where(sequence.c.id == 1).values(last_id=sequence.c.last_id + len(rows))
+    )
+    last_id = connection.execute(select(sequence.c.last_id).where(sequence.c.id == 1)).scalar_one()
+    first_id = last_id - len(rows) + 1
+    connection.execute(insert(OutboxEvent.__table__), [dict(row, id=first_id + i) for i, row in enumerate(rows)])
+
+
+def _init_outbox_sequence():
+    """建立事件 ID 計數列（從既有事件的最大 ID 接續）"""
+    with engine.begin() as conn:
+        if conn.execute(select(OutboxSequence.id)).first() is None:
+            last_id = conn.execute(select(func.coalesce(func.max(OutboxEvent.id), 0))).scalar()
+            conn.execute(insert(OutboxSequence.__table__).values(id=1, last_id=last_id))
+
+
+def read_events(after_id=0, limit=None):
+    """
+    讀取位移之後的事件
+    
+    Args:
+        after_id: 已處理到的事件 ID
+        limit: 最多筆數（預設 OUTBOX_BATCH_SIZE）
+    
+    Returns:
+        list: 依 ID 排序的事件
+    """
+    session = Session()
+    
+    try:
+        rows = (
+            session.query(OutboxEvent)
+            .filter(OutboxEvent.id > after_id)
+            .order_by(OutboxEvent.id)
+            .limit(limit or Config.OUTBOX_BATCH_SIZE)
+        )
+        return [row.to_dict() for row in rows]
+    finally:
+        session.close()
+
+
+def get_consumer_offset(consumer):
+    """取得消費者已處理到的事件 ID（尚未記錄為 0）"""
+    session = Session()
+    
+    try:
+        last_id = session.query(OutboxOffset.last_id).filter(OutboxOffset.consumer == consumer).scalar()
+        return last_id or 0
+    finally:
+        session.close()
+
+
+def commit_consumer_offset(consumer, last_id):
+    """
+    記錄消費者已處理到的事件 ID（位移只會前進）
+    
+    Returns:
+        bool: 是否成功
+    """
+    session = Session()
+    
+    try:
+        offset = session.get(OutboxOffset, consumer)
+        if offset is None:
+            session.add(OutboxOffset(consumer=consumer, last_id=last_id))
+        elif last_id > offset.last_id:
+            offset.last_id = last_id
+        session.commit()
+        return True
+    except Exception as e:
+        session.rollback()
+        print(f"記錄事件位移失敗: {e}")
+        return False
+    finally:
+        session.close()
+
+
+def fetch_events(consumer, limit=None):
+    """讀取消費者位移之後的下一批事件（不移動位移，處理完再呼叫 commit_consumer_offset）"""
+    return read_events(get_consumer_offset(consumer), limit)
+
+
+def tail_events(consumer, batch_size=None, poll_interval=None, stop_event=None):
+    """
+    持續讀取新事件的產生器
+    
+    每次產出一批事件，要求下一批時才提交上一批的位移（at-least-once）：
+    處理到一半中斷的話，重新啟動會從該批重新開始。
+    
+    Args:
+        consumer: 消費者名稱
+        batch_size: 每批筆數（預設 OUTBOX_BATCH_SIZE）
+        poll_interval: 沒有新事件時的等待秒數（預設 OUTBOX_POLL_INTERVAL）
+        stop_event: threading.Event，設定後停止
+    
+    Yields:
+        list: 一批事件
+    """
+    stop_event = stop_event or threading.Event()
+    poll_interval = Config.OUTBOX_POLL_INTERVAL if poll_interval is None else poll_interval
+    
+    while not stop_event.is_set():
+        events = fetch_events(consumer, batch_size)
+        if not events:
+            stop_event.wait(poll_interval)
+            continue
+        yield events
+        commit_consumer_offset(consumer, events[-1]['id'])
+
+
+def prune_outbox_events():
+    """
+    刪除所有消費者都已處理過的事件
+    
+    Returns:
+        int: 刪除的筆數（沒有消費者時不刪除）
+    """
+    session = Session()
+    
+    try:
+        processed = session.query(func.min(OutboxOffset.last_id)).scalar()
+        if not processed:
+            return 0
+        result = session.execute(OutboxEvent.__table__.delete().where(OutboxEvent.id <= processed))
+        session.commit()
+        return result.rowcount
+    except Exception as e:
+        session.rollback()
+        print(f"清除已處理事件失敗: {e}")
+        return 0
+    finally:
+        session.close()
+
+
+# ========== 新增：任務狀態管理 ==========
+
+def accept_application(task_id, applicant_id, publisher_id):
+    """
+    接受申請（發起者操作）
+    
+    Args:
+        task_id: 任務 ID
+        applicant_id: 被接受的申請者 ID
+        publisher_id: 發起者 ID（用於驗證）
+    
+    Returns:
+        bool: 是否成功
+    """
+    session = Session()
+    
+    try:
+        # 條件式更新：所有權與 open 狀態檢查和狀態變更不可分割，同時接受時只有一個請求會成功
+        result = session.execute(
+            update(Task)
+            .where(Task.id == task_id, Task.publisher_id == publisher_id, Task.status == 'open')
+            .values(status='in_progress', accepted_user_id=applicant_id, version=Task.version + 1),
+            execution_options={'synchronize_session': False}
+        )
+        if result.rowcount != 1:
+            session.rollback()
+            return False
+        
+        # 更新申請狀態：一個 UPDATE 處理所有申請者，不逐筆載入
+        session.execute(
+            update(TaskApplication)
+            .where(TaskApplication.task_id == task_id)
+            .values(status=case((TaskApplication.applicant_id == applicant_id, 'accepted'), else_='rejected')),
+            execution_options={'synchronize_session': False}
+        )
+        append_outbox_events(session.connection(), [outbox_event_row('task_accepted', task_id, {
+            'publisher_id': publisher_id, 'accepted_user_id': applicant_id
+        })])
+        
+        session.commit()
+        return True
+    
+    except Exception as e:
+        session.rollback()
+        print(f"接受申請失敗: {e}")
+        return False
+    finally:
+        session.close()
+
+
+def complete_task(task_id, user_id):
+    """
+    完成任務（雙方都可以標記，需要雙方確認）
+    
+    Args:
+        task_id: 任務 ID
+        user_id: 操作者 ID（發起者或幫助者）
+    
+    Returns:
+        bool: 是否成功
+    """
+    def work(session):
+        # 讀取時不上鎖，記下版本
+        task = session.query(
+            Task.publisher_id, Task.accepted_user_id, Task.points_offered, Task.status, Task.version
+        ).filter(Task.id == task_id).first()
+        if not task:
+            return False
+        
+        # 確認任務狀態為 in_progress
+        if task.status != 'in_progress':
+            return False
+        
+        # 驗證操作權限（發起者或被接受的幫助者）
+        if user_id not in [task.publisher_id, task.accepted_user_id]:
+            return False
+        
+        # CAS：版本與讀取時相同才更新，否則重來（重讀後會看到已完成而回傳 False）
+        result = session.execute(
+            update(Task)
+            .where(Task.id == task_id, Task.version == task.version)
+            .values(status='completed', completed_at=datetime.utcnow(), version=Task.version + 1),
+            execution_options={'synchronize_session': False}
+        )
+        if result.rowcount != 1:
+            raise ConflictError(f"任務 {task_id} 已被其他操作變更")
+        
+        # 轉移點數：發起者的點數已在發布時扣除，這裡只入帳給幫助者
+        if task.accepted_user_id:
+            # 依 ID 順序鎖定雙方，互相完成對方的任務時才不會死結
+            _lock_users(session, [task.publisher_id, task.accepted_user_id])
+            
+            # 幫助者獲得點數
+            _adjust_points(session, task.accepted_user_id, task.points_offered, 'task_reward', task_id)
+            
+            # 更新完成任務數
+            session.execute(
+                update(User)
+                .where(User.id.in_([task.publisher_id, task.accepted_user_id]))
+                .values(completed_tasks=User.completed_tasks + 1, version=User.version + 1),
+                execution_options={'synchronize_session': False}
+            )
+            
+            # 完成任務數影響媒合分數，雙方的推薦清單需要重算
+            _mark_recommendations_stale(session, [task.publisher_id, task.accepted_user_id])
+        
+        append_outbox_events(session.connection(), [outbox_event_row('task_completed', task_id, {
+            'publisher_id': task.publisher_id, 'accepted_user_id': task.accepted_user_id,
+            'points_offered': task.points_offered, 'completed_by': user_id
+        })])
+        return True
+    
+    try:
+        return _run_with_retry('complete_task', work)
+    except Exception as e:
+        print(f"完成任務失敗: {e}")
+        return False
+
+
+# ========== 批次任務狀態管理 ==========
+#
+# 活動結束時一次處理大量申請 / 接受 / 完成：整批在同一個交易內驗證與寫入，
+# 規則與單筆函數相同（不合格的項目回傳 False，不影響其他項目），點數與帳本一樣守恆
+
+def _execute_counted(connection, statement, params):
+    """executemany 並回傳影響筆數（驅動程式無法回報 executemany 筆數時逐筆執行）"""
+    if not params:
+        return 0
+    if connection.dialect.supports_sane_multi_rowcount:
+        return connection.execute(statement, params).rowcount
+    return sum(connection.execute(statement, p).rowcount for p in params)
+
+
+def apply_for_tasks(applications):
+    """
+    批次申請任務
+    
+    Args:
+        applications: [(任務 ID, 申請者 ID)]
+    
+    Returns:
+        list: 每一項是否成功（任務不存在、已申請過、同一批重複者為 False）
+    """
+    if not applications:
+        return []
+    session = Session()
+    
+    try:
+        task_ids = {task_id for task_id, _ in applications}
+        existing_tasks = {task_id for (task_id,) in session.query(Task.id).filter(Task.id.in_(task_ids))}
+        applied = set(
+            session.query(TaskApplication.task_id, TaskApplication.applicant_id)
+            .filter(TaskApplication.task_id.in_(task_ids))
+        )
+        
+        results = []
+        rows = []
+        for task_id, applicant_id in applications:
+            ok = task_id in existing_tasks and (task_id, applicant_id) not in applied
+            if ok:
+                applied.add((task_id, applicant_id))
+                rows.append({'task_id': task_id, 'applicant_id': applicant_id, 'status': 'pending',
+                             'applied_at': datetime.utcnow()})
+            results.append(ok)
+        
+        if rows:
+            session.connection().execute(insert(TaskApplication.__table__), rows)
+        append_outbox_events(session.connection(), [
+            outbox_event_row('task_applied', row['task_id'], {'applicant_id': row['applicant_id']}, row['applied_at'])
+            for row in rows
+        ])
+        session.commit()
+        return results
+    except Exception as e:
+        session.rollback()
+        print(f"批次申請任務失敗: {e}")
+        return [False] * len(applications)
+    finally:
+        session.close()
+
+
+def accept_applications(acceptances):
+    """
+    批次接受申請
+    
+    Args:
+        acceptances: [(任務 ID, 被接受的申請者 ID, 發起者 ID)]
+    
+    Returns:
+        list: 每一項是否成功（任務不屬於發起者、不是 open、同一批重複者為 False）
+    """
+    if not acceptances:
+        return []
+    
+    def work(session):
+        task_ids = {task_id for task_id, _, _ in acceptances}
+        tasks = {
+            task_id: (publisher_id, status)
+            for task_id, publisher_id, status in
+            session.query(Task.id, Task.publisher_id, Task.status).filter(Task.id.in_(task_ids))
+            .order_by(Task.id).with_for_update()
+        }
+        
+        results = []
+        accepted = []
+        for task_id, applicant_id, publisher_id in acceptances:
+            ok = task_id in tasks and tasks[task_id] == (publisher_id, 'open')
+            if ok:
+                tasks[task_id] = (publisher_id, 'in_progress')
+                accepted.append({'task': task_id, 'applicant': applicant_id})
+            results.append(ok)
+        
+        connection = session.connection()
+        tasks_table = Task.__table__
+        applications_table = TaskApplication.__table__
+        # 條件式更新：讀取後若已被其他交易接受（SQLite 不支援 FOR UPDATE），整批重來，
+        # 重讀後只有被搶先的項目回傳 False
+        updated = _execute_counted(
+            connection,
+            update(tasks_table)
+            .where(tasks_table.c.id == bindparam('task'), tasks_table.c.status == 'open')
+            .values(status='in_progress', accepted_user_id=bindparam('applicant'),
+                    version=tasks_table.c.version + 1),
+            accepted
+        )
+        if updated != len(accepted):
+            raise ConflictError("任務狀態已被其他操作變更")
+        if accepted:
+            connection.execute(
+                update(applications_table)
+                .where(applications_table.c.task_id == bindparam('task'))
+                .values(status=case((applications_table.c.applicant_id == bindparam('applicant'), 'accepted'),
+                                    else_='rejected')),
+                accepted
+            )
+        append_outbox_events(session.connection(), [
+            outbox_event_row('task_accepted', item['task'], {
+                'publisher_id': tasks[item['task']][0], 'accepted_user_id': item['applicant']
+            })
+            for item in accepted
+        ])
+        return results
+    
+    try:
+        return _run_with_retry('accept_applications', work) or [False] * len(acceptances)
+    except Exception as e:
+        print(f"批次接受申請失敗: {e}")
+        return [False] * len(acceptances)
+
+
+def complete_tasks(completions):
+    """
+    批次完成任務（例如社團活動結束時一次確認所有幫助者）
+    
+    Args:
+        completions: [(任務 ID, 操作者 ID)]，操作者為發起者或被接受的幫助者
+    
+    Returns:
+        list: 每一項是否成功（任務不是 in_progress、操作者無權限、同一批重複者為 False）
+    """
+    if not completions:
+        return []
+    
+    def work(session):
+        task_ids = {task_id for task_id, _ in completions}
+        tasks = {
+            task.id: task for task in
+            session.query(Task.id, Task.publisher_id, Task.accepted_user_id, Task.points_offered, Task.status)
+            .filter(Task.id.in_(task_ids)).order_by(Task.id).with_for_update()
+        }
+        
+        results = []
+        completed = []
+        completed_by = {}
+        for task_id, user_id in completions:
+            task = tasks.get(task_id)
+            ok = (task is not None and task.status == 'in_progress' and task_id not in completed_by
+                  and user_id in (task.publisher_id, task.accepted_user_id))
+            if ok:
+                completed_by[task_id] = user_id
+                completed.append(task)
+            results.append(ok)
+        
+        if completed:
+            connection = session.connection()
+            now = datetime.utcnow()
+            tasks_table = Task.__table__
+            users_table = User.__table__
+            
+            # 讀取後若有任務已被單筆完成，整批重來，重讀後只有該項目回傳 False
+            updated = _execute_counted(
+                connection,
+                update(tasks_table)
+                .where(tasks_table.c.id == bindparam('task'), tasks_table.c.status == 'in_progress')
+                .values(status='completed', completed_at=now, version=tasks_table.c.version + 1),
+                [{'task': task.id} for task in completed]
+            )
+            if updated != len(completed):
+                raise ConflictError("任務狀態已被其他操作變更")
+            
+            # 幫助者入帳（同一人合併成一次 UPDATE，帳本仍逐任務記錄）與雙方完成任務數
+            rewarded = [task for task in completed if task.accepted_user_id]
+            rewards = {}
+            finished = {}
+            for task in rewarded:
+                rewards[task.accepted_user_id] = rewards.get(task.accepted_user_id, 0) + task.points_offered
+                for user_id in (task.publisher_id, task.accepted_user_id):
+                    finished[user_id] = finished.get(user_id, 0) + 1
+            
+            if rewards:
+                # 先依 ID 順序鎖定所有相關使用者，再逐一更新（與 complete_task 相同順序，避免死結）
+                _lock_users(session, finished)
+                connection.execute(
+                    update(users_table)
+                    .where(users_table.c.id == bindparam('user'))
+                    .values(points=users_table.c.points + bindparam('amount'), version=users_table.c.version + 1),
+                    [{'user': user_id, 'amount': amount} for user_id, amount in sorted(rewards.items())]
+                )
+                connection.execute(insert(PointLedger.__table__), [
+                    {'user_id': task.accepted_user_id, 'task_id': task.id, 'amount': task.points_offered,
+                     'reason': 'task_reward', 'created_at': now}
+                    for task in rewarded
+                ])
+                connection.execute(
+                    update(users_table)
+                    .where(users_table.c.id == bindparam('user'))
+                    .values(completed_tasks=users_table.c.completed_tasks + bindparam('count'),
+                            version=users_table.c.version + 1),
+                    [{'user': user_id, 'count': count} for user_id, count in sorted(finished.items())]
+                )
+                _mark_recommendations_stale(session, list(finished))
+            
+            append_outbox_events(session.connection(), [
+                outbox_event_row('task_completed', task.id, {
+                    'publisher_id': task.publisher_id, 'accepted_user_id': task.accepted_user_id,
+                    'points_offered': task.points_offered, 'completed_by': completed_by[task.id]
+                }, now)
+                for task in completed
+            ])
+        
+        return results
+    
+    try:
+        return _run_with_retry('complete_tasks', work) or [False] * len(completions)
     except Exception as e:
-        session.rollback()
-        print(f"建立任務失敗: {e}")
-        return None
-    finally:
-        session.close()
+        print(f"批次完成任務失敗: {e}")
+        return [False] * len(completions)
 
 
-def get_user_tasks(user_id, task_type='published'):
-    """取得使用者的任務
+# ========== 點數帳本 ==========
+
+def _lock_users(session, user_ids):
+    """
+    依 ID 遞增順序鎖定使用者資料列（SQLite 忽略 FOR UPDATE，寫入本來就是序列化的）
+    
+    同一個交易要更新多位使用者時先呼叫，所有交易以相同順序取得鎖，不會互相等待而死結。
+    """
+    session.query(User.id).filter(User.id.in_(set(user_ids))).order_by(User.id).with_for_update().all()
+
+
+def _adjust_points(session, user_id, amount, reason, task_id=None):
+    """
+    以單一 UPDATE 調整點數並寫入帳本
+    
+    扣點時使用 UPDATE ... SET points = points - ? WHERE points >= ?，
+    餘額檢查與扣款不可分割，不會超扣也不會遺失更新。
     
     Args:
+        session: 資料庫 session
         user_id: 使用者 ID
-        task_type: 'published' (發布的) 或 'applied' (申請的)
-    """
-    session = Session()
+        amount: 點數變動（負數為扣除）
+        reason: 帳本原因
+        task_id: 相關任務 ID（可選）
     
-    if task_type == 'published':
-        tasks = session.query(Task).filter_by(publisher_id=user_id).order_by(Task.created_at.desc()).all()
-        return [t.to_dict() for t in tasks]
+    Returns:
+        bool: 是否成功（扣點時餘額不足回傳 False）
+    """
+    stmt = update(User).where(User.id == user_id)
+    if amount < 0:
+        stmt = stmt.where(User.points >= -amount)
     
-    elif task_type == 'applied':
-        applications = session.query(TaskApplication).filter_by(applicant_id=user_id).all()
-        result = []
-        
-        for app in applications:
-            task = session.query(Task).filter_by(id=app.task_id).first()
-            if task:
-                task_dict = task.to_dict()
-                task_dict['application_status'] = app.status
-                task_dict['applied_at'] = app.applied_at.strftime('%Y-%m-%d %H:%M')
-                result.append(task_dict)
-        
-        return result
+    result = session.execute(stmt.values(points=User.points + amount, version=User.version + 1))
+    if result.rowcount != 1:
+        return False
     
-    return []
+    session.add(PointLedger(user_id=user_id, task_id=task_id, amount=amount, reason=reason))
+    return True
 
 
-def apply_for_task(task_id, applicant_id):
-    """申請任務"""
+def backfill_point_ledger():
+    """為尚無帳本記錄的使用者補上期初餘額"""
     session = Session()
     
     try:
-        # 檢查是否已申請
-        existing = session.query(TaskApplication).filter_by(
-            task_id=task_id,
-            applicant_id=applicant_id
-        ).first()
-        
-        if existing:
-            return False  # 已經申請過
-        
-        # 建立申請記錄
-        application = TaskApplication(
-            task_id=task_id,
-            applicant_id=applicant_id
-        )
+        missing = session.query(User.id, User.points).filter(
+            ~User.id.in_(select(PointLedger.user_id))
+        ).all()
         
-        session.add(application)
-        session.commit()
-        
-        return True
-    except Exception as e:
-        session.rollback()
-        print(f"申請任務失敗: {e}")
-        return False
+        if missing:
+            session.add_all([
+                PointLedger(user_id=user_id, amount=points or 0, reason='opening_balance')
+                for user_id, points in missing
+            ])
+            session.commit()
     finally:
         session.close()
 
 
-def get_task_applications(task_id):
-    """取得任務的所有申請"""
-    session = Session()
-    applications = session.query(TaskApplication).filter_by(task_id=task_id).all()
-    return [a.to_dict() for a in applications]
-
-
-# ========== 新增：任務狀態管理 ==========
-
-def accept_application(task_id, applicant_id, publisher_id):
+def get_ledger_balance(user_id):
     """
-    接受申請（發起者操作）
+    由帳本加總計算使用者點數
     
     Args:
-        task_id: 任務 ID
-        applicant_id: 被接受的申請者 ID
-        publisher_id: 發起者 ID（用於驗證）
+        user_id: 使用者 ID
     
     Returns:
-        bool: 是否成功
+        int: 帳本餘額
     """
     session = Session()
     
     try:
-        # 驗證任務所有權
-        task = session.query(Task).filter_by(id=task_id, publisher_id=publisher_id).first()
-        if not task:
-            return False
-        
-        # 確認任務狀態為 open
-        if task.status != 'open':
-            return False
-        
-        # 更新任務狀態
-        task.status = 'in_progress'
-        task.accepted_user_id = applicant_id
-        
-        # 更新申請狀態
-        applications = session.query(TaskApplication).filter_by(task_id=task_id).all()
-        for app in applications:
-            if app.applicant_id == applicant_id:
-                app.status = 'accepted'
-            else:
-                app.status = 'rejected'
-        
-        session.commit()
-        return True
-    
-    except Exception as e:
-        session.rollback()
-        print(f"接受申請失敗: {e}")
-        return False
+        total = session.query(func.coalesce(func.sum(PointLedger.amount), 0)).filter(
+            PointLedger.user_id == user_id
+        ).scalar()
+        return int(total)
     finally:
         session.close()
 
 
-def complete_task(task_id, user_id):
+def audit_point_ledger():
     """
-    完成任務（雙方都可以標記，需要雙方確認）
-    
-    Args:
-        task_id: 任務 ID
-        user_id: 操作者 ID（發起者或幫助者）
+    稽核點數：比對使用者點數與帳本加總
     
     Returns:
-        bool: 是否成功
+        dict: 不一致的使用者 {user_id: {'points': int, 'ledger_balance': int}}
     """
     session = Session()
     
     try:
-        task = session.query(Task).filter_by(id=task_id).first()
-        if not task:
-            return False
-        
-        # 確認任務狀態為 in_progress
-        if task.status != 'in_progress':
-            return False
-        
-        # 驗證操作權限（發起者或被接受的幫助者）
-        if user_id not in [task.publisher_id, task.accepted_user_id]:
-            return False
-        
-        # 更新任務狀態為完成
-        task.status = 'completed'
-        task.completed_at = datetime.utcnow()
-        
-        # 轉移點數：從發起者到幫助者
-        publisher = session.query(User).filter_by(id=task.publisher_id).first()
-        helper = session.query(User).filter_by(id=task.accepted_user_id).first()
-        
-        if helper:
-            # 幫助者獲得點數
-            helper.points += task.points_offered
-            
-            # 更新完成任務數
-            helper.completed_tasks += 1
-            publisher.completed_tasks += 1
-        
-        session.commit()
-        return True
-    
-    except Exception as e:
-        session.rollback()
-        print(f"完成任務失敗: {e}")
-        return False
+        ledger = (
+            session.query(PointLedger.user_id, func.sum(PointLedger.amount).label('balance'))
+            .group_by(PointLedger.user_id)
+            .subquery()
+        )
+        rows = (
+            session.query(User.id, User.points, func.coalesce(ledger.c.balance, 0))
+            .outerjoin(ledger, ledger.c.user_id == User.id)
+            .all()
+        )
+        return {
+            user_id: {'points': points, 'ledger_balance': int(balance)}
+            for user_id, points, balance in rows
+            if points != balance
+        }
     finally:
         session.close()
 
 
 # ========== 新增：評價系統 ==========
 
-def submit_review(task_id, reviewer_id, reviewee_id, rating, comment=''):
+def submit_review(task_id, reviewer_id, reviewee_id, rating, comment='', idempotency_key=None):
     """
     提交評價
     
+    被評價者的平均評分是讀取後計算再寫回，以版本欄位偵測同時評價，衝突時重算
+    
     Args:
         task_id: 任務 ID
         reviewer_id: 評價者 ID
         reviewee_id: 被評價者 ID
         rating: 評分 (1-5)
         comment: 評價內容
+        idempotency_key: 冪等鍵（可選）；重送時回傳第一次的結果
     
     Returns:
         bool: 是否成功
     """
-    session = Session()
-    
-    try:
+    def work(session):
+        if idempotency_key:
+            found, result = _find_idempotent_result(session, 'submit_review', idempotency_key)
+            if found:
+                return result
+        
         # 驗證任務已完成
         task = session.query(Task).filter_by(id=task_id, status='completed').first()
         if not task:
@@ -481,18 +1678,26 @@ def submit_review(task_id, reviewer_id, reviewee_id, rating, comment=''):
         
         session.add(review)
         
-        # 更新被評價者的平均評分
+        # 更新被評價者的平均評分（寫入時比對版本，被搶先會拋出 StaleDataError）
         update_user_rating(session, reviewee_id)
+        _mark_recommendations_stale(session, [reviewee_id])
+        session.flush()
         
-        session.commit()
+        if idempotency_key:
+            _save_idempotent_result(session, 'submit_review', idempotency_key, True)
+        append_outbox_events(session.connection(), [outbox_event_row('review_submitted', task_id, {
+            'reviewer_id': reviewer_id, 'reviewee_id': reviewee_id, 'rating': rating
+        })])
         return True
     
+    try:
+        return _run_with_retry('submit_review', work)
     except Exception as e:
-        session.rollback()
+        found, result = get_idempotent_result('submit_review', idempotency_key)
+        if found:
+            return result
         print(f"提交評價失敗: {e}")
         return False
-    finally:
-        session.close()
 
 
 def update_user_rating(session, user_id):
@@ -503,6 +1708,9 @@ def update_user_rating(session, user_id):
         session: 資料庫 session
         user_id: 使用者 ID
     """
+    # 先取得使用者（記下版本）再讀評價：之後才提交的評價必定讓版本比對失敗而重算
+    user = session.query(User).filter_by(id=user_id).first()
+    
     # 取得該使用者的所有評價
     reviews = session.query(Review).filter_by(reviewee_id=user_id).all()
     
@@ -510,8 +1718,6 @@ def update_user_rating(session, user_id):
         # 計算平均評分
         avg_rating = sum(r.rating for r in reviews) / len(reviews)
         
-        # 取得使用者
-        user = session.query(User).filter_by(id=user_id).first()
         if user:
             user.avg_rating = round(avg_rating, 2)
             
@@ -519,6 +1725,9 @@ def update_user_rating(session, user_id):
             # 完成率基於完成任務數（假設最多50個為滿分）
             completion_rate = min(1.0, user.completed_tasks / 50)
             user.trust_score = round((avg_rating / 5.0 * 0.7) + (completion_rate * 0.3), 2)
+            
+            # 數值沒變 ORM 也要寫入，讓版本遞增（其他同時評價的交易才會偵測到衝突）
+            flag_modified(user, 'avg_rating')
 
 
 def get_reviews_for_user(user_id):
@@ -532,8 +1741,12 @@ def get_reviews_for_user(user_id):
         list: 評價列表
     """
     session = Session()
-    reviews = session.query(Review).filter_by(reviewee_id=user_id).order_by(Review.created_at.desc()).all()
-    return [r.to_dict() for r in reviews]
+    
+    try:
+        reviews = session.query(Review).filter_by(reviewee_id=user_id).order_by(Review.created_at.desc()).all()
+        return [r.to_dict() for r in reviews]
+    finally:
+        session.close()
 
 
 def check_review_status(task_id, user_id):
@@ -549,43 +1762,358 @@ def check_review_status(task_id, user_id):
     """
     session = Session()
     
-    task = session.query(Task).filter_by(id=task_id, status='completed').first()
-    if not task:
-        return {'can_review': False, 'reviewee_id': None, 'has_reviewed': False}
+    try:
+        task = session.query(Task).filter_by(id=task_id, status='completed').first()
+        if not task:
+            return {'can_review': False, 'reviewee_id': None, 'has_reviewed': False}
+        
+        # 確定被評價者
+        if user_id == task.publisher_id:
+            reviewee_id = task.accepted_user_id
+        elif user_id == task.accepted_user_id:
+            reviewee_id = task.publisher_id
+        else:
+            return {'can_review': False, 'reviewee_id': None, 'has_reviewed': False}
+        
+        # 檢查是否已評價
+        existing = session.query(Review).filter_by(
+            task_id=task_id,
+            reviewer_id=user_id,
+            reviewee_id=reviewee_id
+        ).first()
+        
+        return {
+            'can_review': True,
+            'reviewee_id': reviewee_id,
+            'has_reviewed': existing is not None
+        }
+    finally:
+        session.close()
+
+
+def check_review_statuses(task_ids, user_id):
+    """
+    批次檢查用戶對多個任務的評價狀態（固定兩次查詢）
+
+    Args:
+        task_ids: 任務 ID 集合
+        user_id: 使用者 ID
+
+    Returns:
+        dict: {task_id: {'can_review': bool, 'reviewee_id': int, 'has_reviewed': bool}}
+    """
+    task_ids = set(task_ids)
+    result = {
+        task_id: {'can_review': False, 'reviewee_id': None, 'has_reviewed': False}
+        for task_id in task_ids
+    }
+    if not task_ids:
+        return result
+
+    session = Session()
+
+    try:
+        tasks = session.query(Task.id, Task.publisher_id, Task.accepted_user_id).filter(
+            Task.id.in_(task_ids),
+            Task.status == 'completed'
+        ).all()
+
+        # 確定每個任務的被評價者
+        reviewees = {}
+        for task_id, publisher_id, accepted_user_id in tasks:
+            if user_id == publisher_id:
+                reviewees[task_id] = accepted_user_id
+            elif user_id == accepted_user_id:
+                reviewees[task_id] = publisher_id
+
+        if not reviewees:
+            return result
+
+        # 一次取得使用者在這些任務上已提交的評價
+        reviewed = set(session.query(Review.task_id, Review.reviewee_id).filter(
+            Review.task_id.in_(reviewees.keys()),
+            Review.reviewer_id == user_id
+        ).all())
+
+        for task_id, reviewee_id in reviewees.items():
+            result[task_id] = {
+                'can_review': True,
+                'reviewee_id': reviewee_id,
+                'has_reviewed': (task_id, reviewee_id) in reviewed
+            }
+
+        return result
+    finally:
+        session.close()
+
+
+# ========== 技能詞彙 ==========
+
+def sync_skill_vocabulary():
+    """
+    將 Config.SKILL_SYNONYMS 同步到 skills / skill_synonyms 資料表，
+    並補上使用者的技能位元遮罩（詞彙有變動時全部重算）
+    
+    Returns:
+        int: 更新遮罩的使用者數
+    """
+    session = Session()
+    
+    try:
+        skills = {skill.name: skill for skill in session.query(Skill)}
+        changed = False
+        
+        for name, bit in skill_vocabulary.SKILL_BITS.items():
+            skill = skills.get(name)
+            if skill is None:
+                skill = Skill(name=name, bit=bit)
+                session.add(skill)
+                skills[name] = skill
+                changed = True
+            elif skill.bit != bit:
+                # 位元位置不可重複，先移開再設定
+                skill.bit = -skill.id
+                session.flush()
+                skill.bit = bit
+                changed = True
+        session.flush()
+        
+        synonyms = {(s.alias, s.skill_id) for s in session.query(SkillSynonym)}
+        expected = {(alias, skills[name].id) for alias, name in skill_vocabulary.SKILL_ALIASES.items()}
+        if synonyms != expected:
+            session.query(SkillSynonym).delete()
+            session.add_all([SkillSynonym(alias=alias, skill_id=skill_id) for alias, skill_id in sorted(expected)])
+            changed = True
+        
+        # 詞彙變動時所有遮罩都要重算，否則只補上尚未計算的使用者
+        query = session.query(User.id, User.skills)
+        if not changed:
+            query = query.filter(User.skill_mask == None)
+        rows = [
+            {'user_id': user_id, 'mask': skill_vocabulary.skill_mask(json.loads(skills_json) if skills_json else [])}
+            for user_id, skills_json in query
+        ]
+        if rows:
+            session.connection().execute(
+                update(User.__table__)
+                .where(User.__table__.c.id == bindparam('user_id'))
+                .values(skill_mask=bindparam('mask')),
+                rows
+            )
+        
+        session.commit()
+        return len(rows)
+    except Exception as e:
+        session.rollback()
+        print(f"同步技能詞彙失敗: {e}")
+        return 0
+    finally:
+        session.close()
+
+
+def get_users_by_skills(skills, match_all=False):
+    """
+    以技能篩選使用者（在 SQL 以位元遮罩比對，同義詞視為相同技能）
     
-    # 確定被評價者
-    if user_id == task.publisher_id:
-        reviewee_id = task.accepted_user_id
-    elif user_id == task.accepted_user_id:
-        reviewee_id = task.publisher_id
-    else:
-        return {'can_review': False, 'reviewee_id': None, 'has_reviewed': False}
+    Args:
+        skills: 技能名稱列表，例如 ['ps', '攝影']
+        match_all: True 需具備全部技能，False 具備任一即可
+    
+    Returns:
+        list: 使用者字典列表（詞彙外的技能無法比對，不會有結果）
+    """
+    mask = skill_vocabulary.skill_mask(skills)
+    if not mask or (match_all and skill_vocabulary.popcount(mask) != len({skill_vocabulary.normalize_skill(s) for s in skills})):
+        return []
+    
+    session = Session()
+    
+    try:
+        overlap = User.skill_mask.op('&')(literal(mask, BigInteger))
+        condition = overlap == mask if match_all else overlap != 0
+        users = session.query(User).filter(User.status == 'active', condition).all()
+        return [u.to_dict() for u in users]
+    finally:
+        session.close()
+
+
+# ========== 語意向量 ==========
+
+def backfill_embeddings(batch_size=1000):
+    """
+    補上尚未計算語意向量的任務與使用者（例如開啟 SEMANTIC_MATCHING 前建立的資料、批次匯入的資料）
+    
+    Returns:
+        int: 補上的筆數
+    """
+    session = Session()
+    
+    try:
+        count = 0
+        task_rows = [
+            {'row_id': task_id, 'blob': semantic.to_blob(semantic.embed_text(semantic.task_text(title, description, category)))}
+            for task_id, title, description, category in
+            session.query(Task.id, Task.title, Task.description, Task.category).filter(Task.embedding == None)
+        ]
+        user_rows = [
+            {'row_id': user_id, 'blob': semantic.to_blob(semantic.user_vector(json.loads(skills_json) if skills_json else []))}
+            for user_id, skills_json in session.query(User.id, User.skills).filter(User.skill_embedding == None)
+        ]
+        
+        for table, column, rows in ((Task.__table__, 'embedding', task_rows),
+                                    (User.__table__, 'skill_embedding', user_rows)):
+            statement = update(table).where(table.c.id == bindparam('row_id')).values({column: bindparam('blob')})
+            for i in range(0, len(rows), batch_size):
+                session.connection().execute(statement, rows[i:i + batch_size])
+            count += len(rows)
+        
+        session.commit()
+        return count
+    except Exception as e:
+        session.rollback()
+        print(f"補上語意向量失敗: {e}")
+        return 0
+    finally:
+        session.close()
+
+
+# ========== 推薦清單 ==========
+
+def _mark_recommendations_stale(session, user_ids):
+    """標記使用者的推薦清單需要重算（與觸發的變更在同一個交易）"""
+    session.execute(
+        update(RecommendationState)
+        .where(RecommendationState.user_id.in_(user_ids), RecommendationState.stale == False)
+        .values(stale=True, stale_since=datetime.utcnow())
+    )
+
+
+def get_recommendations(user_id, limit=5):
+    """
+    讀取預先計算的推薦清單（單一索引查詢，已關閉的任務會被排除）
+    
+    清單過期時不使用：已標記待重算、計算時的媒合設定版本與目前不同、
+    或超過 RECOMMENDATION_MAX_AGE 秒（例如沒有啟動背景工作，只有夜間批次媒合）。
+    
+    Args:
+        user_id: 使用者 ID
+        limit: 回傳筆數
+    
+    Returns:
+        list: [{'task', 'score', 'scores', 'computed_at'}]，尚未計算或已過期時為空列表（呼叫端改為即時計分）
+    """
+    session = Session()
+    
+    try:
+        state = session.get(RecommendationState, user_id)
+        oldest = datetime.utcnow() - timedelta(seconds=Config.RECOMMENDATION_MAX_AGE)
+        if (state is None or state.stale or state.computed_at is None or state.computed_at < oldest
+                or state.config_version != matching_config.current().version):
+            return []
+        
+        Publisher = aliased(User)
+        AcceptedUser = aliased(User)
+        
+        rows = (
+            session.query(Recommendation, Task, Publisher, AcceptedUser)
+            .join(Task, Task.id == Recommendation.task_id)
+            .join(Publisher, Publisher.id == Task.publisher_id)
+            .outerjoin(AcceptedUser, AcceptedUser.id == Task.accepted_user_id)
+            .filter(Recommendation.user_id == user_id, Task.status == 'open')
+            .order_by(Recommendation.rank)
+            .limit(limit)
+            .all()
+        )
+        
+        return [
+            {
+                'task': _task_to_dict(task, publisher, accepted_user),
+                'score': rec.score,
+                'scores': json.loads(rec.details) if rec.details else {},
+                'computed_at': state.computed_at
+            }
+            for rec, task, publisher, accepted_user in rows
+        ]
+    finally:
+        session.close()
+
+
+# ========== 平台統計 ==========
+
+def get_platform_stats():
+    """取得平台統計數據（使用者與任務皆串流讀取，單次掃描累計）"""
+    # 使用者統計
+    total_users = 0
+    total_points = 0
+    
+    def counted_users():
+        nonlocal total_users, total_points
+        for user in iter_users():
+            total_users += 1
+            total_points += user['points']
+            yield user
+    
+    # Top 3 活躍使用者（同分時依 ID，與完整排序後取前 3 名相同）
+    top_users = heapq.nlargest(3, counted_users(), key=lambda x: x['completed_tasks'])
+    
+    # 任務統計
+    total_tasks = 0
+    status_counts = {}
+    points_in_tasks = 0
+    category_counts = {}
+    campus_counts = {}
+    
+    for task in iter_tasks():
+        total_tasks += 1
+        status_counts[task['status']] = status_counts.get(task['status'], 0) + 1
+        if task['status'] == 'open':
+            points_in_tasks += task['points_offered']
+        category_counts[task['category']] = category_counts.get(task['category'], 0) + 1
+        campus_counts[task['campus']] = campus_counts.get(task['campus'], 0) + 1
     
-    # 檢查是否已評價
-    existing = session.query(Review).filter_by(
-        task_id=task_id,
-        reviewer_id=user_id,
-        reviewee_id=reviewee_id
-    ).first()
+    completed_tasks = status_counts.get('completed', 0)
+    open_tasks = status_counts.get('open', 0)
+    in_progress_tasks = status_counts.get('in_progress', 0)
     
     return {
-        'can_review': True,
-        'reviewee_id': reviewee_id,
-        'has_reviewed': existing is not None
+        'total_users': total_users,
+        'total_tasks': total_tasks,
+        'completed_tasks': completed_tasks,
+        'open_tasks': open_tasks,
+        'in_progress_tasks': in_progress_tasks,
+        'total_points': total_points,
+        'points_in_tasks': points_in_tasks,
+        'category_counts': category_counts,
+        'campus_counts': campus_counts,
+        'top_users': top_users,
+        'completion_rate': (completed_tasks / total_tasks * 100) if total_tasks > 0 else 0
     }
 
 
 # ========== 測試資料 ==========
 
+def clear_all_data(connection):
+    """
+    清空使用者、任務與相關資料（由呼叫端的交易提交）
+
+    重建後任務、使用者 ID 會重新編號，冪等鍵記錄的結果與事件指向的 ID
+    都會對到不相干的新資料，一併清除並重設事件 ID
+
+    Args:
+        connection: Connection 或 Session
+    """
+    for model in (IdempotencyKey, OutboxEvent, OutboxOffset, Recommendation, RecommendationState,
+                  PointLedger, Review, TaskApplication, Task, User):
+        connection.execute(delete(model))
+    connection.execute(update(OutboxSequence).values(last_id=0))
+
+
 def seed_test_data():
     """填充測試資料"""
     session = Session()
     
     # 清空現有資料
-    session.query(Review).delete()
-    session.query(TaskApplication).delete()
-    session.query(Task).delete()
-    session.query(User).delete()
+    clear_all_data(session)
     session.commit()
     
     # 建立測試使用者
@@ -597,6 +2125,7 @@ def seed_test_data():
             'grade': '大二',
             'campus': '外雙溪校區',
             'skills': json.dumps(['攝影', '影片剪輯', '平面設計', 'Photoshop']),
+            'availability': availability.to_bytes(availability.mask_from_windows([(day, 18, 22) for day in range(5)])),
             'points': 200,
             'avg_rating': 4.8,
             'completed_tasks': 15,
@@ -634,6 +2163,7 @@ def seed_test_data():
             'grade': '大四',
             'campus': '外雙溪校區',
             'skills': json.dumps(['數學教學', '程式設計', '資料分析', 'Python']),
+            'availability': availability.to_bytes(availability.mask_from_windows([(day, 13, 18) for day in range(7)])),
             'points': 500,
             'avg_rating': 4.7,
             'completed_tasks': 45,
@@ -649,7 +2179,8 @@ def seed_test_data():
     
     session.commit()
     
-    # 建立測試任務
+    # 建立測試任務（部分任務指定進行時間）
+    today = datetime.now().replace(minute=0, second=0, microsecond=0)
     tasks_data = [
         {
             'publisher_id': users[0].id,
@@ -668,7 +2199,9 @@ def seed_test_data():
             'category': '校園協助',
             'location': '望星廣場',
             'campus': '外雙溪校區',
-            'points_offered': 80
+            'points_offered': 80,
+            'start_time': (today + timedelta(days=3)).replace(hour=18),
+            'end_time': (today + timedelta(days=3)).replace(hour=20)
         },
         {
             'publisher_id': users[2].id,
@@ -677,7 +2210,9 @@ def seed_test_data():
             'category': '學習互助',
             'location': '圖書館 7F會議室',
             'campus': '城中校區',
-            'points_offered': 60
+            'points_offered': 60,
+            'start_time': (today + timedelta(days=2)).replace(hour=14),
+            'end_time': (today + timedelta(days=2)).replace(hour=15)
         },
         {
             'publisher_id': users[3].id,
@@ -716,6 +2251,9 @@ def seed_test_data():
     session.commit()
     session.close()
     
+    # 記錄期初點數
+    backfill_point_ledger()
+    
     print("✅ 測試資料建立完成！")
     print(f"   - 使用者: {len(users_data)} 位")
     print(f"   - 任務: {len(tasks_data)} 個")
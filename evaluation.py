@@ -0,0 +1,350 @@
+"""
+離線評估 - Campus Help
+以歷史申請紀錄重播推薦：在使用者申請任務的當下，把當時開放中的任務交給
+MatchingEngine.get_top_recommendations 排序，檢查使用者實際申請（被接受的權重較高）的任務排在哪裡
+
+- 指標：precision@K、NDCG@K（被接受 = 2、申請 = 1）、MRR（第一個相關任務的名次倒數）
+- 同時記錄每組權重的計分吞吐量
+- 格狀搜尋：每組權重交給 process pool 平行評估，worker 各自讀取本機快照（SQLite 檔），不影響線上資料庫
+
+限制：使用者特徵（評分、完成數、技能）取目前的值，而非申請當時的值
+
+使用方式:
+    python evaluation.py                                   # 快照目前資料庫並評估目前權重
+    python evaluation.py --snapshot eval.db --grid skill=0.3,0.4,0.5 time=0.1,0.2 --workers 4
+    python evaluation.py --snapshot eval.db --reuse-snapshot --output eval.json
+"""
+import argparse
+import itertools
+import json
+import math
+import os
+import random
+import sys
+import time
+from datetime import timedelta
+from multiprocessing import Pool
+
+from sqlalchemy import insert, select
+
+import database
+import matching_config
+from config import Config
+from matching_engine import MatchingEngine
+
+# 快照需要的資料表
+SNAPSHOT_TABLES = ('users', 'tasks', 'task_applications')
+
+# 被接受的申請比單純申請更相關
+RELEVANCE_ACCEPTED = 2
+RELEVANCE_APPLIED = 1
+
+# worker 行程內的資料（由 _init_worker 設定）
+_worker_state = {}
+
+
+# ========== 快照 ==========
+
+def snapshot_database(path, batch_size=5000):
+    """
+    把評估需要的資料表複製到本機 SQLite 檔（來源可以是任何支援的資料庫）
+
+    Args:
+        path: 快照檔路徑（已存在會覆蓋）
+        batch_size: 每批複製筆數
+
+    Returns:
+        dict: 各資料表複製筆數
+    """
+    if os.path.exists(path):
+        os.remove(path)
+    target = database.create_db_engine(f"sqlite:///{path}")
+    tables = [database.Base.metadata.tables[name] for name in SNAPSHOT_TABLES]
+    database.Base.metadata.create_all(target, tables=tables)
+
+    counts = {}
+    try:
+        # 在同一個讀取交易內複製，三張表彼此一致
+        with database.engine.connect() as source, source.begin(), target.begin() as dest:
+            for table in tables:
+                counts[table.name] = 0
+                result = source.execute(select(table)).mappings()
+                while True:
+                    rows = result.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    dest.execute(insert(table), [dict(row) for row in rows])
+                    counts[table.name] += len(rows)
+    finally:
+        target.dispose()
+    return counts
+
+
+# ========== 評估資料 ==========
+
+def load_dataset(session):
+    """
+    讀取評估資料
+
+    Returns:
+        dict: {'users': {id: 使用者字典}, 'tasks': [任務字典], 'applications': [(使用者 ID, 任務 ID, 申請時間, 是否被接受)]}
+    """
+    users = {user.id: user.to_dict() for user in session.query(database.User)}
+
+    tasks = []
+    for task in session.query(database.Task).order_by(database.Task.created_at):
+        tasks.append({
+            'id': task.id,
+            'title': task.title,
+            'description': task.description or '',
+            'category': task.category,
+            'campus': task.campus,
+            'is_urgent': task.is_urgent,
+            'publisher_id': task.publisher_id,
+            'accepted_user_id': task.accepted_user_id,
+            'start_time': task.start_time.strftime('%Y-%m-%d %H:%M') if task.start_time else None,
+            'end_time': task.end_time.strftime('%Y-%m-%d %H:%M') if task.end_time else None,
+            # 以下兩欄只用於判斷申請當下任務是否開放
+            '_created_at': task.created_at,
+            '_completed_at': task.completed_at
+        })
+
+    accepted = {task['id']: task['accepted_user_id'] for task in tasks}
+    applications = [
+        (applicant_id, task_id, applied_at, status == 'accepted' or accepted.get(task_id) == applicant_id)
+        for applicant_id, task_id, applied_at, status in
+        session.query(database.TaskApplication.applicant_id, database.TaskApplication.task_id,
+                      database.TaskApplication.applied_at, database.TaskApplication.status)
+        .order_by(database.TaskApplication.applied_at)
+        if applied_at
+    ]
+    return {'users': users, 'tasks': tasks, 'applications': applications}
+
+
+def build_queries(dataset, lookback_days=30, max_queries=500, seed=42):
+    """
+    由申請紀錄建立評估查詢
+
+    每位使用者每天一個查詢：候選任務為申請當下開放中的任務（建立於 lookback_days 天內、尚未完成、
+    不是自己發布的），相關任務為候選中使用者有申請的任務
+
+    Returns:
+        list: [(使用者 ID, 候選任務索引列表, {任務 ID: 相關程度})]
+    """
+    tasks = dataset['tasks']
+    lookback = timedelta(days=lookback_days)
+
+    # 使用者 → {任務 ID: 相關程度}
+    relevance = {}
+    for user_id, task_id, _, was_accepted in dataset['applications']:
+        grades = relevance.setdefault(user_id, {})
+        grades[task_id] = max(grades.get(task_id, 0), RELEVANCE_ACCEPTED if was_accepted else RELEVANCE_APPLIED)
+
+    # 每位使用者每天取第一次申請的時間
+    moments = {}
+    for user_id, _, applied_at, _ in dataset['applications']:
+        moments.setdefault((user_id, applied_at.date()), applied_at)
+    moments = sorted(moments.items(), key=lambda item: item[1])
+    if len(moments) > max_queries:
+        moments = sorted(random.Random(seed).sample(moments, max_queries), key=lambda item: item[1])
+
+    queries = []
+    for (user_id, _), applied_at in moments:
+        if user_id not in dataset['users']:
+            continue
+        pool = [
+            index for index, task in enumerate(tasks)
+            if applied_at - lookback <= task['_created_at'] <= applied_at
+            and (task['_completed_at'] is None or task['_completed_at'] > applied_at)
+            and task['publisher_id'] != user_id
+        ]
+        grades = {tasks[i]['id']: relevance[user_id][tasks[i]['id']] for i in pool if tasks[i]['id'] in relevance[user_id]}
+        if grades:
+            queries.append((user_id, pool, grades))
+    return queries
+
+
+# ========== 指標 ==========
+
+def ranking_metrics(ranked_ids, grades, k):
+    """
+    單一查詢的排序指標
+
+    Args:
+        ranked_ids: 依分數排序的任務 ID（完整排序）
+        grades: {任務 ID: 相關程度}
+        k: 截斷名次
+
+    Returns:
+        tuple: (precision@k, NDCG@k, reciprocal rank)
+    """
+    top = ranked_ids[:k]
+    precision = sum(1 for task_id in top if task_id in grades) / k
+
+    dcg = sum((2 ** grades.get(task_id, 0) - 1) / math.log2(rank + 2) for rank, task_id in enumerate(top))
+    ideal = sorted(grades.values(), reverse=True)[:k]
+    idcg = sum((2 ** grade - 1) / math.log2(rank + 2) for rank, grade in enumerate(ideal))
+    ndcg = dcg / idcg if idcg else 0.0
+
+    reciprocal_rank = 0.0
+    for rank, task_id in enumerate(ranked_ids, start=1):
+        if task_id in grades:
+            reciprocal_rank = 1 / rank
+            break
+    return precision, ndcg, reciprocal_rank
+
+
+def evaluate(dataset, queries, config, k=5):
+    """
+    以指定媒合設定重播所有查詢
+
+    Returns:
+        dict: 平均 precision@k、NDCG@k、MRR，以及計分吞吐量
+    """
+    matcher = MatchingEngine(config)
+    tasks = dataset['tasks']
+    totals = [0.0, 0.0, 0.0]
+    pairs = 0
+
+    start = time.perf_counter()
+    for user_id, pool, grades in queries:
+        candidates = [tasks[i] for i in pool]
+        ranked = matcher.get_top_recommendations(dataset['users'][user_id], candidates, top_n=len(candidates))
+        for i, value in enumerate(ranking_metrics([rec['task']['id'] for rec in ranked], grades, k)):
+            totals[i] += value
+        pairs += len(candidates)
+    elapsed = time.perf_counter() - start
+
+    count = len(queries) or 1
+    return {
+        'weights': dict(config.weights),
+        'config_version': config.version,
+        'queries': len(queries),
+        f"precision@{k}": round(totals[0] / count, 4),
+        f"ndcg@{k}": round(totals[1] / count, 4),
+        'mrr': round(totals[2] / count, 4),
+        'pairs': pairs,
+        'pairs_per_second': round(pairs / elapsed) if elapsed > 0 else 0
+    }
+
+
+# ========== 格狀搜尋 ==========
+
+def weight_grid(values):
+    """
+    權重組合
+
+    Args:
+        values: {權重名稱: [候選值]}，未列出的權重沿用目前設定
+
+    Returns:
+        list: 權重 dict 列表（笛卡兒積）
+    """
+    base = dict(matching_config.current().weights)
+    names = list(values)
+    return [dict(base, **dict(zip(names, combo))) for combo in itertools.product(*(values[n] for n in names))]
+
+
+def _init_worker(snapshot_path, lookback_days, max_queries, seed):
+    """worker 行程初始化：從快照讀取評估資料並建立查詢"""
+    # 自建引擎，不動從父行程繼承的連線
+    engine = database.create_db_engine(f"sqlite:///{snapshot_path}")
+    session = database.Session(bind=engine)
+    try:
+        dataset = load_dataset(session)
+    finally:
+        session.close()
+        engine.dispose()
+    _worker_state.update({'dataset': dataset, 'queries': build_queries(dataset, lookback_days, max_queries, seed)})
+
+
+def _evaluate_weights(args):
+    weights, k = args
+    config = matching_config.current().with_weights(weights)
+    return evaluate(_worker_state['dataset'], _worker_state['queries'], config, k)
+
+
+def grid_search(snapshot_path, grid, workers=None, k=5, lookback_days=30, max_queries=500, seed=42):
+    """
+    平行評估多組權重
+
+    Args:
+        snapshot_path: snapshot_database 建立的快照檔
+        grid: 權重 dict 列表（weight_grid）
+        workers: process 數（預設為 CPU 核心數）
+
+    Returns:
+        list: 每組權重的評估結果，依 NDCG 由高到低
+    """
+    workers = min(workers or os.cpu_count() or 1, len(grid)) or 1
+    with Pool(processes=workers, initializer=_init_worker,
+              initargs=(snapshot_path, lookback_days, max_queries, seed)) as pool:
+        results = pool.map(_evaluate_weights, [(weights, k) for weights in grid])
+    return sorted(results, key=lambda r: (r[f"ndcg@{k}"], r['mrr']), reverse=True)
+
+
+def _parse_grid(specs):
+    """['skill=0.3,0.4', 'time=0.1'] → {'skill': [0.3, 0.4], 'time': [0.1]}"""
+    values = {}
+    for spec in specs:
+        name, _, numbers = spec.partition('=')
+        values[name.strip()] = [float(n) for n in numbers.split(',') if n.strip()]
+    return values
+
+
+def main():
+    """命令列入口"""
+    parser = argparse.ArgumentParser(description='Campus Help 推薦離線評估')
+    parser.add_argument('--snapshot', default='evaluation_snapshot.db', help='本機快照檔')
+    parser.add_argument('--reuse-snapshot', action='store_true', help='沿用既有快照，不重新複製')
+    parser.add_argument('--grid', nargs='*', default=[], help='權重候選值，例如 skill=0.3,0.4 time=0.1,0.2')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='process 數')
+    parser.add_argument('--k', type=int, default=Config.RECOMMENDATION_TOP_K, help='precision / NDCG 的截斷名次')
+    parser.add_argument('--lookback-days', type=int, default=30, help='候選任務的建立時間範圍（天）')
+    parser.add_argument('--max-queries', type=int, default=500, help='最多評估的查詢數')
+    parser.add_argument('--top', type=int, default=10, help='顯示前幾組權重')
+    parser.add_argument('--output', help='結果 JSON 路徑')
+    parser.add_argument('--database-url', help='來源資料庫（預設使用 DATABASE_URL）')
+    args = parser.parse_args()
+
+    print("=" * 50)
+    print("  Campus Help 推薦離線評估")
+    print("=" * 50)
+
+    if not (args.reuse_snapshot and os.path.exists(args.snapshot)):
+        if args.database_url:
+            database.configure_database(args.database_url)
+        database.init_db()
+        start = time.perf_counter()
+        counts = snapshot_database(args.snapshot)
+        print(f"📦 快照 {args.snapshot}: " + ', '.join(f"{name} {n} 筆" for name, n in counts.items())
+              + f"（{time.perf_counter() - start:.1f} 秒）")
+
+    # 目前的權重一併評估，作為比較基準
+    baseline = dict(matching_config.current().weights)
+    grid = weight_grid(_parse_grid(args.grid)) if args.grid else []
+    if baseline not in grid:
+        grid.insert(0, baseline)
+    print(f"🔍 評估 {len(grid)} 組權重（{min(args.workers, len(grid))} 個 process）")
+    start = time.perf_counter()
+    results = grid_search(args.snapshot, grid, workers=args.workers, k=args.k,
+                          lookback_days=args.lookback_days, max_queries=args.max_queries)
+    print(f"   ⏱️  {time.perf_counter() - start:.1f} 秒，每組 {results[0]['queries'] if results else 0} 個查詢\n")
+
+    names = list(grid[0])
+    header = ' '.join(f"{name:>8}" for name in names)
+    print(f"   {header} {'P@' + str(args.k):>7} {'NDCG@' + str(args.k):>8} {'MRR':>7} {'配對/秒':>8}")
+    for result in results[:args.top]:
+        weights = ' '.join(f"{result['weights'].get(name, 0):>8.2f}" for name in names)
+        print(f"   {weights} {result[f'precision@{args.k}']:>7.3f} {result[f'ndcg@{args.k}']:>8.3f} "
+              f"{result['mrr']:>7.3f} {result['pairs_per_second']:>9}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 結果已寫入 {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
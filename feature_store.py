@@ -0,0 +1,382 @@
+"""
+特徵儲存 - Campus Help
+媒合只需要每位使用者、每個任務的少數欄位，不必為此組出完整的 to_dict 字典。
+這裡把這些欄位存成欄位式的 NumPy 陣列：
+
+- 校區、分類編成整數代碼
+- 技能為位元遮罩（skill_vocabulary，使用者直接讀取 users.skill_mask 欄位）
+- 評分、信任值、完成任務數為 float 陣列
+- 使用者每週有空時段為 21 bytes 位元圖，任務時間為 (起始時段, 時段數) 區間（見 availability）
+- SEMANTIC_MATCHING 開啟時另有 (N, DIM) 的 float32 語意向量（讀取資料庫的 blob）
+
+一次查詢即可從資料庫建立，之後可針對變動的使用者 / 任務增量更新；
+存檔為一組 .npy 檔，可用 mmap 載入，多個行程共用同一份作業系統頁面快取。
+
+使用方式:
+    store = FeatureStore.from_database()
+    store.update_tasks([task_id])        # 任務新增或狀態改變後
+    store.save('features/')
+    store = FeatureStore.load('features/', mmap_mode='r')
+"""
+import json
+import os
+
+import numpy as np
+
+import availability
+import database
+import matching_config
+import semantic
+import skill_vocabulary
+from config import Config
+
+# 欄位定義（名稱 → dtype）；active 為 False 的列視為已移除
+TASK_FIELDS = {
+    'task_id': np.int64,
+    'publisher_id': np.int64,
+    'skill_mask': np.uint64,
+    'campus': np.int32,
+    'category': np.int32,
+    'online': np.bool_,
+    'urgent': np.bool_,
+    'created_at': np.float64,  # Unix 時間（同分時新任務在前）
+    'time_start': np.int16,    # 每週時段區間；time_slots 為 0 表示未設定時間
+    'time_slots': np.int16,
+    'active': np.bool_
+}
+
+USER_FIELDS = {
+    'user_id': np.int64,
+    'skill_mask': np.uint64,
+    'campus': np.int32,
+    'willing_cross': np.bool_,
+    'avg_rating': np.float64,
+    'trust_score': np.float64,
+    'completed_tasks': np.float64,
+    'availability': (np.uint8, (availability.MASK_BYTES,)),
+    'has_availability': np.bool_,
+    'active': np.bool_
+}
+
+# 語意向量為二維欄位：(dtype, 每列形狀)
+if Config.SEMANTIC_MATCHING:
+    TASK_FIELDS['embedding'] = USER_FIELDS['embedding'] = (np.float32, (semantic.DIM,))
+
+
+def _empty(spec, rows):
+    dtype, shape = spec if isinstance(spec, tuple) else (spec, ())
+    return np.zeros((rows,) + shape, dtype=dtype)
+
+
+class ArrayTable:
+    """以 ID 索引的欄位式陣列，支援新增、覆寫與標記移除"""
+
+    def __init__(self, fields, id_field, arrays=None, size=0):
+        self.fields = fields
+        self.id_field = id_field
+        self.size = size
+        self.arrays = arrays or {name: _empty(spec, 16) for name, spec in fields.items()}
+        self.index = {int(row_id): row for row, row_id in enumerate(self.arrays[id_field][:size])}
+
+    def __len__(self):
+        return int(np.count_nonzero(self.column('active')))
+
+    def column(self, name):
+        """取得欄位（只含已使用的列）"""
+        return self.arrays[name][:self.size]
+
+    def columns(self):
+        return {name: self.column(name) for name in self.fields}
+
+    def upsert(self, values):
+        """新增或覆寫一列"""
+        self._ensure_writable()
+        row_id = int(values[self.id_field])
+        row = self.index.get(row_id)
+        if row is None:
+            row = self.size
+            self._ensure_capacity(row + 1)
+            self.index[row_id] = row
+            self.size += 1
+        for name, value in values.items():
+            self.arrays[name][row] = value
+        self.arrays['active'][row] = True
+
+    def deactivate(self, row_id):
+        row = self.index.get(int(row_id))
+        if row is not None:
+            self._ensure_writable()
+            self.arrays['active'][row] = False
+
+    def compact(self):
+        """移除已停用的列"""
+        keep = self.column('active')
+        self.arrays = {name: np.ascontiguousarray(self.column(name)[keep]) for name in self.fields}
+        self.size = int(np.count_nonzero(keep))
+        self.index = {int(row_id): row for row, row_id in enumerate(self.arrays[self.id_field])}
+
+    def nbytes(self):
+        return sum(self.column(name).nbytes for name in self.fields)
+
+    def _ensure_writable(self):
+        # mmap 唯讀載入的陣列在第一次更新時複製成一般陣列，存檔本身不受影響
+        if not self.arrays[self.id_field].flags.writeable:
+            self.arrays = {name: np.array(array) for name, array in self.arrays.items()}
+
+    def _ensure_capacity(self, capacity):
+        current = len(self.arrays[self.id_field])
+        if capacity <= current:
+            return
+        # 容量加倍，攤銷後每次新增為 O(1)
+        new_capacity = max(capacity, current * 2, 16)
+        for name, array in self.arrays.items():
+            grown = np.zeros((new_capacity,) + array.shape[1:], dtype=array.dtype)
+            grown[:self.size] = array[:self.size]
+            self.arrays[name] = grown
+
+
+class FeatureStore:
+    """使用者與開放中任務的媒合特徵"""
+
+    def __init__(self, campus_codes=None, category_codes=None):
+        self.campus_codes = campus_codes or {}
+        self.category_codes = category_codes or {}
+        self.tasks = ArrayTable(TASK_FIELDS, 'task_id')
+        self.users = ArrayTable(USER_FIELDS, 'user_id')
+        # 任務技能遮罩依建立時的關鍵字表推斷
+        self.config = matching_config.current()
+
+    # ========== 建立與更新 ==========
+
+    @classmethod
+    def from_database(cls, batch_size=5000):
+        """一次查詢讀取所有活躍使用者與開放中任務（只選需要的欄位，分批讀取）"""
+        store = cls()
+        session = database.Session()
+
+        try:
+            for row in session.query(*_USER_COLUMNS).filter(database.User.status == 'active').yield_per(batch_size):
+                store.users.upsert(store._encode_user(row))
+            for row in session.query(*_TASK_COLUMNS).filter(database.Task.status == 'open').yield_per(batch_size):
+                store.tasks.upsert(store._encode_task(row))
+        finally:
+            session.close()
+        return store
+
+    def update_tasks(self, task_ids):
+        """
+        重新讀取指定任務；已關閉或不存在的任務會被移除
+
+        Args:
+            task_ids: 任務 ID 列表
+        """
+        task_ids = list(task_ids)
+        session = database.Session()
+
+        try:
+            rows = session.query(*_TASK_COLUMNS).filter(database.Task.id.in_(task_ids)).all()
+        finally:
+            session.close()
+
+        found = set()
+        for row in rows:
+            found.add(row.id)
+            if row.status == 'open':
+                self.tasks.upsert(self._encode_task(row))
+            else:
+                self.tasks.deactivate(row.id)
+        for task_id in set(task_ids) - found:
+            self.tasks.deactivate(task_id)
+
+    def update_users(self, user_ids):
+        """
+        重新讀取指定使用者；停用或不存在的使用者會被移除
+
+        Args:
+            user_ids: 使用者 ID 列表
+        """
+        user_ids = list(user_ids)
+        session = database.Session()
+
+        try:
+            rows = session.query(*_USER_COLUMNS).filter(database.User.id.in_(user_ids)).all()
+        finally:
+            session.close()
+
+        found = set()
+        for row in rows:
+            found.add(row.id)
+            if row.status == 'active':
+                self.users.upsert(self._encode_user(row))
+            else:
+                self.users.deactivate(row.id)
+        for user_id in set(user_ids) - found:
+            self.users.deactivate(user_id)
+
+    def _encode_task(self, row):
+        # 技能推斷只需要文字欄位，推斷完就不再保留文字
+        text = (row.description or '').lower() + ' ' + (row.title or '').lower()
+        time_start, time_slots = availability.task_interval(row.start_time, row.end_time)
+        return {
+            'task_id': row.id,
+            'publisher_id': row.publisher_id,
+            'skill_mask': self.config.infer_skill_mask(row.category, text),
+            'campus': self.campus_code(row.campus),
+            'category': self.category_codes.setdefault(row.category, len(self.category_codes)),
+            'online': '線上' in (row.campus or ''),
+            'urgent': bool(row.is_urgent),
+            'created_at': row.created_at.timestamp() if row.created_at else 0.0,
+            'time_start': time_start,
+            'time_slots': time_slots,
+            **self._encode_embedding(row.embedding, lambda: semantic.embed_text(
+                semantic.task_text(row.title, row.description, row.category)))
+        }
+
+    def _encode_user(self, row):
+        skill_mask = row.skill_mask
+        if skill_mask is None:
+            skill_mask = skill_vocabulary.skill_mask(json.loads(row.skills) if row.skills else [])
+        return {
+            'user_id': row.id,
+            'skill_mask': skill_mask,
+            'campus': self.campus_code(row.campus),
+            'willing_cross': bool(row.willing_cross_campus),
+            'avg_rating': row.avg_rating,
+            'trust_score': row.trust_score,
+            'completed_tasks': row.completed_tasks,
+            'availability': availability.mask_array(availability.from_bytes(row.availability)),
+            'has_availability': row.availability is not None,
+            **self._encode_embedding(row.skill_embedding, lambda: semantic.user_vector(
+                json.loads(row.skills) if row.skills else []))
+        }
+
+    @staticmethod
+    def _encode_embedding(blob, compute):
+        # 資料庫尚未補上向量（或維度設定已變更）時當場計算
+        if 'embedding' not in TASK_FIELDS:
+            return {}
+        vector = semantic.stored_vector(blob)
+        return {'embedding': vector if vector is not None else compute()}
+
+    # ========== 編碼 ==========
+
+    def campus_code(self, campus):
+        return self.campus_codes.setdefault(campus, len(self.campus_codes))
+
+    def rating_scores(self, config=None):
+        """所有使用者的評價信任分數（與 MatchingEngine._calculate_rating_score 相同）"""
+        thresholds = (config or matching_config.current()).thresholds
+        rating_normalized = (self.users.column('avg_rating') - 1) / 4
+        completion_factor = np.minimum(1.0, self.users.column('completed_tasks') / thresholds['rating_full_completed'])
+        score = (
+            rating_normalized * thresholds['rating_avg_weight'] +
+            self.users.column('trust_score') * thresholds['rating_trust_weight'] +
+            completion_factor * thresholds['rating_completion_weight']
+        )
+        return np.maximum(0.0, np.minimum(1.0, score))
+
+    def nbytes(self):
+        """陣列佔用的位元組數"""
+        return self.tasks.nbytes() + self.users.nbytes()
+
+    # ========== 存檔 ==========
+
+    def save(self, path):
+        """
+        存成一組 .npy 檔與 meta.json（先移除已停用的列）
+
+        Args:
+            path: 目錄
+        """
+        os.makedirs(path, exist_ok=True)
+        for prefix, table in (('tasks', self.tasks), ('users', self.users)):
+            table.compact()
+            for name in table.fields:
+                np.save(os.path.join(path, f"{prefix}.{name}.npy"), table.column(name))
+
+        meta = {
+            'skill_bits': skill_vocabulary.SKILL_BITS,
+            'inference_version': self.config.inference_version,
+            'semantic_dim': semantic.DIM if 'embedding' in TASK_FIELDS else None,
+            # 校區 / 分類可能是 None，JSON 物件的鍵只能是字串，因此以 [值, 代碼] 列表保存
+            'campus_codes': [[campus, code] for campus, code in self.campus_codes.items()],
+            'category_codes': [[category, code] for category, code in self.category_codes.items()]
+        }
+        tmp_path = os.path.join(path, 'meta.json.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(tmp_path, os.path.join(path, 'meta.json'))
+        return path
+
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        """
+        載入存檔
+
+        Args:
+            path: 目錄
+            mmap_mode: 'r' 以唯讀 mmap 載入（多行程共用）；None 則整份讀入記憶體
+
+        Returns:
+            FeatureStore
+        """
+        with open(os.path.join(path, 'meta.json'), encoding='utf-8') as f:
+            meta = json.load(f)
+
+        if meta['skill_bits'] != skill_vocabulary.SKILL_BITS:
+            raise ValueError("特徵存檔的技能詞彙與目前設定不同，請重新建立")
+        if meta.get('inference_version') != matching_config.current().inference_version:
+            raise ValueError("特徵存檔的技能關鍵字設定與目前設定不同，請重新建立")
+        if meta.get('semantic_dim') != (semantic.DIM if 'embedding' in TASK_FIELDS else None):
+            raise ValueError("特徵存檔的語意向量設定（SEMANTIC_MATCHING / SEMANTIC_DIM）與目前設定不同，請重新建立")
+        
+        store = cls(
+            campus_codes={campus: code for campus, code in meta['campus_codes']},
+            category_codes={category: code for category, code in meta['category_codes']}
+        )
+        for prefix, fields, id_field in (('tasks', TASK_FIELDS, 'task_id'), ('users', USER_FIELDS, 'user_id')):
+            arrays = {
+                name: np.load(os.path.join(path, f"{prefix}.{name}.npy"), mmap_mode=mmap_mode)
+                for name in fields
+            }
+            setattr(store, prefix, ArrayTable(fields, id_field, arrays, size=len(arrays[id_field])))
+        return store
+
+
+_TASK_COLUMNS = (
+    database.Task.id, database.Task.publisher_id, database.Task.title, database.Task.description,
+    database.Task.category, database.Task.campus, database.Task.is_urgent, database.Task.status,
+    database.Task.created_at, database.Task.start_time, database.Task.end_time, database.Task.embedding
+)
+
+_USER_COLUMNS = (
+    database.User.id, database.User.skills, database.User.skill_mask, database.User.campus,
+    database.User.willing_cross_campus, database.User.avg_rating, database.User.trust_score,
+    database.User.completed_tasks, database.User.status, database.User.availability,
+    database.User.skill_embedding
+)
+
+
+def main():
+    """命令列入口：從資料庫建立特徵並存檔"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Campus Help 媒合特徵存檔')
+    parser.add_argument('path', help='輸出目錄')
+    parser.add_argument('--database-url', help='來源資料庫（預設使用 DATABASE_URL）')
+    args = parser.parse_args()
+
+    if args.database_url:
+        database.configure_database(args.database_url)
+
+    store = FeatureStore.from_database()
+    store.save(args.path)
+    print(f"✅ 已存檔至 {args.path}")
+    print(f"   - 使用者: {len(store.users)} 位 | 開放任務: {len(store.tasks)} 個")
+    print(f"   - 陣列大小: {store.nbytes() / 1024:.1f} KB")
+    return 0
+
+
+if __name__ == '__main__':
+    import sys
+    sys.exit(main())
@@ -0,0 +1,278 @@
+"""
+媒合設定 - Campus Help
+把 Config 的媒合權重、技能關鍵字、分類技能與分數門檻編譯成唯讀的 MatchingConfig：
+
+- 載入時一次建好查表結構（關鍵字 → 技能位元、分類 → 技能遮罩），計分時不再重建
+- 每份設定帶有版本戳記（內容雜湊），推薦清單以此判斷是否需要重算
+- MATCHING_CONFIG_PATH 指向的 JSON 檔可覆寫任一項；背景執行緒監看檔案，
+  存檔後重新編譯，成功才以單一參照替換（計分中的呼叫持續使用舊設定算完），失敗則保留舊設定
+
+JSON 範例（只需列出要覆寫的項目）:
+    {"weights": {"skill": 0.5, "time": 0.1}, "thresholds": {"skill_per_match": 0.25}}
+
+使用方式:
+    config = matching_config.current()
+    config.weights['skill'], config.version
+    matching_config.start_watcher()      # 監看設定檔
+"""
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime
+
+import skill_vocabulary
+from config import Config
+
+SECTIONS = ('weights', 'skill_keywords', 'category_skills', 'thresholds')
+REQUIRED_WEIGHTS = ('skill', 'time', 'rating', 'location')
+OPTIONAL_WEIGHTS = ('semantic',)
+
+
+class MatchingConfig:
+    """編譯後的媒合設定（建立後不再修改，重新載入時整份替換）"""
+
+    def __init__(self, raw, source='config'):
+        """
+        Args:
+            raw: {'weights', 'skill_keywords', 'category_skills', 'thresholds'}
+            source: 設定來源（顯示用）
+
+        Raises:
+            ValueError: 設定內容不合法
+        """
+        self.raw = _validate(raw)
+        self.source = source
+        self.loaded_at = datetime.utcnow()
+        self.version = _digest(self.raw)
+
+        self.weights = dict(self.raw['weights'])
+        self.weight_sum = sum(self.weights.values())
+        self.thresholds = dict(self.raw['thresholds'])
+
+        # 查表結構：(技能, 技能位元, 關鍵字) 與 分類 → (技能集合, 技能遮罩)
+        self.skill_keywords = tuple(
+            (skill.lower(), skill_vocabulary.skill_mask([skill]), tuple(k.lower() for k in keywords))
+            for skill, keywords in self.raw['skill_keywords'].items()
+        )
+        self.category_skills = {
+            category: (frozenset(s.lower() for s in skills), skill_vocabulary.skill_mask(skills))
+            for category, skills in self.raw['category_skills'].items()
+        }
+        # 技能推斷結果只取決於這兩張表（與詞彙），FeatureStore 存檔以此判斷是否過期
+        self.inference_version = _digest({
+            'skill_keywords': self.raw['skill_keywords'],
+            'category_skills': self.raw['category_skills'],
+            'skill_bits': skill_vocabulary.SKILL_BITS
+        })
+
+    def with_weights(self, weights):
+        """以新權重建立另一份設定（其他項目相同）"""
+        return MatchingConfig(dict(self.raw, weights=dict(weights)), source=self.source)
+
+    def infer_skills(self, category, text):
+        """
+        根據任務分類與文字推斷所需技能
+
+        Args:
+            category: 任務分類
+            text: 小寫的標題與描述
+
+        Returns:
+            set: 標準技能（小寫）
+        """
+        inferred = {skill for skill, _, keywords in self.skill_keywords if any(k in text for k in keywords)}
+        if category in self.category_skills:
+            inferred.update(self.category_skills[category][0])
+        return inferred
+
+    def infer_skill_mask(self, category, text):
+        """同 infer_skills，直接回傳技能遮罩"""
+        mask = 0
+        for _, bit, keywords in self.skill_keywords:
+            if any(k in text for k in keywords):
+                mask |= bit
+        if category in self.category_skills:
+            mask |= self.category_skills[category][1]
+        return mask
+
+
+def _digest(data):
+    encoded = json.dumps(data, sort_keys=True, ensure_ascii=False).encode('utf-8')
+    return hashlib.sha1(encoded).hexdigest()[:12]
+
+
+def _validate(raw):
+    unknown = set(raw) - set(SECTIONS)
+    if unknown:
+        raise ValueError(f"未知的設定項目: {', '.join(sorted(unknown))}")
+
+    weights = raw['weights']
+    missing = [name for name in REQUIRED_WEIGHTS if name not in weights]
+    if missing:
+        raise ValueError(f"缺少權重: {', '.join(missing)}")
+    unknown = set(weights) - set(REQUIRED_WEIGHTS) - set(OPTIONAL_WEIGHTS)
+    if unknown:
+        raise ValueError(f"未知的權重: {', '.join(sorted(unknown))}")
+    for name, value in list(weights.items()) + list(raw['thresholds'].items()):
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or value < 0:
+            raise ValueError(f"{name} 必須是非負數（目前為 {value!r}）")
+    if sum(weights.values()) <= 0:
+        raise ValueError("權重總和必須大於 0")
+
+    unknown = set(raw['thresholds']) - set(Config.MATCHING_THRESHOLDS)
+    if unknown:
+        raise ValueError(f"未知的門檻: {', '.join(sorted(unknown))}")
+
+    for section in ('skill_keywords', 'category_skills'):
+        for name, values in raw[section].items():
+            if not isinstance(values, (list, tuple)) or not all(isinstance(v, str) for v in values):
+                raise ValueError(f"{section}.{name} 必須是字串列表")
+
+    # 推斷出的技能必須在詞彙內，才能以位元遮罩比對
+    for skill in list(raw['skill_keywords']) + [s for skills in raw['category_skills'].values() for s in skills]:
+        if skill_vocabulary.normalize_skill(skill) not in skill_vocabulary.SKILL_BITS:
+            raise ValueError(f"技能「{skill}」不在技能詞彙（Config.SKILL_SYNONYMS）中")
+
+    return {
+        'weights': {name: float(value) for name, value in weights.items()},
+        'skill_keywords': {skill: list(keywords) for skill, keywords in raw['skill_keywords'].items()},
+        'category_skills': {category: list(skills) for category, skills in raw['category_skills'].items()},
+        'thresholds': dict(raw['thresholds'])
+    }
+
+
+# ========== 載入 ==========
+
+def default_raw():
+    """Config 中的預設設定"""
+    return {
+        'weights': dict(Config.MATCHING_WEIGHTS),
+        'skill_keywords': {skill: list(keywords) for skill, keywords in Config.MATCHING_SKILL_KEYWORDS.items()},
+        'category_skills': {category: list(skills) for category, skills in Config.MATCHING_CATEGORY_SKILLS.items()},
+        'thresholds': dict(Config.MATCHING_THRESHOLDS)
+    }
+
+
+def load(path=None):
+    """
+    讀取預設設定並套用 JSON 檔的覆寫
+
+    Args:
+        path: JSON 檔路徑（預設 Config.MATCHING_CONFIG_PATH；檔案不存在時只用預設值）
+
+    Returns:
+        MatchingConfig
+
+    Raises:
+        ValueError: 設定檔格式錯誤或內容不合法
+    """
+    path = path or Config.MATCHING_CONFIG_PATH
+    raw = default_raw()
+    source = 'config'
+
+    if path and os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            try:
+                overrides = json.load(f)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"設定檔不是合法的 JSON: {e}")
+        if not isinstance(overrides, dict):
+            raise ValueError("設定檔必須是 JSON 物件")
+        for section, values in overrides.items():
+            if section not in raw:
+                raise ValueError(f"未知的設定項目: {section}")
+            if not isinstance(values, dict):
+                raise ValueError(f"{section} 必須是 JSON 物件")
+            raw[section].update(values)
+        source = path
+
+    # 沒有語意向量時不能使用語意權重（批次計分需要預先計算的向量）
+    if not Config.SEMANTIC_MATCHING:
+        raw['weights']['semantic'] = 0.0
+
+    return MatchingConfig(raw, source=source)
+
+
+def _load_initial():
+    try:
+        return load()
+    except (OSError, ValueError) as e:
+        print(f"載入媒合設定失敗，使用預設值: {e}")
+        return MatchingConfig(default_raw())
+
+
+_current = _load_initial()
+_reload_lock = threading.Lock()
+
+
+def current():
+    """目前生效的媒合設定"""
+    return _current
+
+
+def reload(path=None):
+    """
+    重新載入設定；內容不合法時保留目前設定
+
+    Returns:
+        bool: 是否已替換為新設定
+    """
+    global _current
+
+    with _reload_lock:
+        try:
+            config = load(path)
+        except (OSError, ValueError) as e:
+            print(f"載入媒合設定失敗，沿用版本 {_current.version}: {e}")
+            return False
+        if config.version == _current.version:
+            return False
+        _current = config
+        print(f"✅ 已載入媒合設定 {config.version}（{config.source}）")
+        return True
+
+
+# ========== 監看設定檔 ==========
+
+class ConfigWatcher:
+    """輪詢設定檔的修改時間，有變動就重新載入"""
+
+    def __init__(self, path=None, interval=None):
+        self.path = path or Config.MATCHING_CONFIG_PATH
+        self.interval = interval or Config.MATCHING_CONFIG_POLL_INTERVAL
+        self._signature = self._stat()
+
+    def _stat(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None  # 檔案不存在：使用預設值
+        return stat.st_mtime_ns, stat.st_size
+
+    def check(self):
+        """檢查一次；檔案有變動時重新載入，回傳是否已替換設定"""
+        signature = self._stat()
+        if signature == self._signature:
+            return False
+        self._signature = signature
+        return reload(self.path)
+
+    def run_forever(self, stop_event):
+        while not stop_event.wait(self.interval):
+            self.check()
+
+
+def start_watcher(path=None, interval=None):
+    """
+    在背景執行緒監看設定檔
+
+    Returns:
+        threading.Event: 設定後背景執行緒會停止
+    """
+    stop_event = threading.Event()
+    watcher = ConfigWatcher(path, interval)
+    thread = threading.Thread(target=watcher.run_forever, args=(stop_event,),
+                              name='matching-config-watcher', daemon=True)
+    thread.start()
+    return stop_event
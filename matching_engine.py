@@ -2,18 +2,56 @@
 智慧媒合引擎 - Campus Help
 多因子加權模型計算媒合分數
 """
+import heapq
 from datetime import datetime
 
+from skill_vocabulary import skill_mask, popcount
+from config import Config
+import availability
+import matching_config
+import semantic
+
+
+def _task_text(task):
+    """技能推斷用的文字（小寫的描述與標題）"""
+    return (task.get('description', '') or '').lower() + ' ' + (task.get('title', '') or '').lower()
+
+
+def _user_vector(user):
+    """使用者技能向量：優先使用寫入時存下的向量，沒有（或維度不同）才當場計算"""
+    vector = semantic.stored_vector(user.get('skill_embedding'))
+    return vector if vector is not None else semantic.user_vector(user.get('skills', []))
+
+
+def _task_vector(task):
+    """任務向量：優先使用寫入時存下的向量，沒有（或維度不同）才當場計算"""
+    vector = semantic.stored_vector(task.get('embedding'))
+    return vector if vector is not None else semantic.task_vector(task)
+
+
 class MatchingEngine:
     """任務媒合引擎"""
     
-    # 權重配置
-    WEIGHTS = {
-        'skill': 0.4,      # 技能匹配度
-        'time': 0.2,       # 時間重疊度
-        'rating': 0.2,     # 評價信任值
-        'location': 0.2    # 地點相符度
-    }
+    def __init__(self, config=None):
+        """
+        Args:
+            config: 固定使用的 MatchingConfig；None 表示每次計分都使用最新載入的設定（設定檔熱重新載入）
+        """
+        self._config = config
+    
+    @property
+    def config(self):
+        return self._config or matching_config.current()
+    
+    @property
+    def WEIGHTS(self):
+        """權重配置（見 Config.MATCHING_WEIGHTS）"""
+        return self.config.weights
+    
+    @WEIGHTS.setter
+    def WEIGHTS(self, weights):
+        # 只改這個實例的權重，其他設定沿用目前版本
+        self._config = self.config.with_weights(weights)
     
     def calculate_match_score(self, user, task):
         """
@@ -26,27 +64,31 @@ class MatchingEngine:
         Returns:
             dict: 包含各項分數和總分的字典
         """
+        # 整次計分使用同一份設定，重新載入不會讓各項分數用到不同版本
+        config = self.config
+        weights = config.weights
+        
         # 1. 技能匹配度
-        skill_score = self._calculate_skill_score(user, task)
+        skill_score = self._calculate_skill_score(user, task, config)
         
-        # 2. 時間重疊度 (簡化版：假設都有空)
-        time_score = self._calculate_time_score(user, task)
+        # 2. 時間重疊度
+        time_score = self._calculate_time_score(user, task, config)
         
         # 3. 評價信任值
-        rating_score = self._calculate_rating_score(user)
+        rating_score = self._calculate_rating_score(user, config)
         
         # 4. 地點相符度
-        location_score = self._calculate_location_score(user, task)
+        location_score = self._calculate_location_score(user, task, config)
         
         # 計算總分
         total_score = (
-            skill_score * self.WEIGHTS['skill'] +
-            time_score * self.WEIGHTS['time'] +
-            rating_score * self.WEIGHTS['rating'] +
-            location_score * self.WEIGHTS['location']
+            skill_score * weights['skill'] +
+            time_score * weights['time'] +
+            rating_score * weights['rating'] +
+            location_score * weights['location']
         )
         
-        return {
+        result = {
             'total_score': total_score,
             'skill_score': skill_score,
             'time_score': time_score,
@@ -57,86 +99,79 @@ class MatchingEngine:
                 '時間相符': f"{time_score:.0%}",
                 '評價信任': f"{rating_score:.0%}",
                 '地點相符': f"{location_score:.0%}"
-            }
+            },
+            'config_version': config.version
         }
+        
+        # 5. 語意相似度（選用，加入後依權重總和重新歸一化）
+        if weights.get('semantic'):
+            semantic_score = self._calculate_semantic_score(user, task)
+            result['semantic_score'] = semantic_score
+            result['breakdown']['語意相似'] = f"{semantic_score:.0%}"
+            result['total_score'] = (total_score + semantic_score * weights['semantic']) / config.weight_sum
+        
+        return result
     
-    def _calculate_skill_score(self, user, task):
+    def _calculate_skill_score(self, user, task, config=None):
         """
         計算技能匹配度
         
         邏輯：
         - 根據任務分類推斷所需技能
-        - 計算使用者技能與任務需求的重疊度
+        - 計算使用者技能與任務需求的重疊度（位元遮罩 AND 後的位元數，同義詞視為相同技能）
         """
-        user_skills = set([s.lower() for s in user.get('skills', [])])
+        config = config or self.config
+        thresholds = config.thresholds
         
-        # 根據任務分類推斷所需技能
-        category = task.get('category', '')
-        required_skills = self._infer_skills_from_category(category, task)
+        user_mask = user.get('skill_mask')
+        if user_mask is None:
+            user_mask = skill_mask(user.get('skills', []))
         
-        if not required_skills:
-            return 0.5  # 無法判斷時給中等分數
+        # 根據任務分類推斷所需技能（查表結構在載入設定時已建好）
+        required_mask = config.infer_skill_mask(task.get('category', ''), _task_text(task))
+        
+        if not required_mask:
+            return thresholds['skill_unknown']  # 無法判斷時給中等分數
         
         # 計算重疊度
-        overlap = len(user_skills.intersection(required_skills))
+        overlap = popcount(user_mask & required_mask)
         
         if overlap == 0:
-            return 0.3  # 基礎分數（願意嘗試）
+            return thresholds['skill_no_overlap']  # 基礎分數（願意嘗試）
         
-        # 有重疊技能
-        score = min(1.0, 0.5 + (overlap * 0.2))  # 每個匹配技能加 20%
-        return score
+        # 有重疊技能，每個匹配技能加分
+        return min(1.0, thresholds['skill_base'] + (overlap * thresholds['skill_per_match']))
     
     def _infer_skills_from_category(self, category, task):
         """根據任務分類和描述推斷所需技能"""
-        description = task.get('description', '').lower()
-        title = task.get('title', '').lower()
-        combined = description + ' ' + title
-        
-        # 技能關鍵字映射
-        skill_keywords = {
-            '搬運': ['搬', '搬運', '行李', '家具'],
-            '修理電腦': ['電腦', '修理', '維修', '重灌'],
-            '攝影': ['攝影', '拍照', '相機', '照片'],
-            '設計': ['設計', 'photoshop', 'ps', '美編', '排版'],
-            '教學': ['教', '解題', '輔導', '家教'],
-            '程式設計': ['程式', 'python', 'coding', '寫程式'],
-            '翻譯': ['翻譯', '英文', '日文'],
-            '跑腿': ['代購', '買', '送']
-        }
-        
-        inferred_skills = set()
-        for skill, keywords in skill_keywords.items():
-            if any(keyword in combined for keyword in keywords):
-                inferred_skills.add(skill.lower())
-        
-        # 根據分類加入通用技能
-        category_skills = {
-            '日常支援': {'搬運', '跑腿'},
-            '學習互助': {'教學'},
-            '校園協助': {'攝影', '活動協助'},
-            '技能交換': {'設計', '程式設計'}
-        }
-        
-        if category in category_skills:
-            inferred_skills.update([s.lower() for s in category_skills[category]])
-        
-        return inferred_skills
+        return self.config.infer_skills(category, _task_text(task))
     
-    def _calculate_time_score(self, user, task):
+    def _calculate_time_score(self, user, task, config=None):
         """
         計算時間重疊度
         
-        簡化版：假設使用者都有空（黑客松展示用）
-        實際版本需要比對時間表
+        邏輯：
+        - 比對任務時間與使用者每週有空時段（位元圖），依任務時段中有空的比例給分
+        - 任務未設定時間或使用者未設定時段時無法比對：急件 0.8，否則 1.0
+        """
+        thresholds = (config or self.config).thresholds
+        start_slot, length = availability.task_interval(task.get('start_time'), task.get('end_time'))
+        return availability.time_score(
+            user.get('availability'), start_slot, length, task.get('is_urgent'),
+            thresholds['time_no_overlap'], thresholds['time_urgent']
+        )
+    
+    def _calculate_semantic_score(self, user, task):
         """
-        # 如果是急件，降低分數（除非使用者明確表示有空）
-        if task.get('is_urgent'):
-            return 0.8
+        計算語意相似度
         
-        return 1.0  # 簡化版：假設時間都合適
+        邏輯：
+        - 使用者技能（含同義詞）與任務標題、描述、分類的 n-gram 向量餘弦相似度
+        - 可補上關鍵字推斷不到的換句話說
+        """
+        return semantic.similarity(_user_vector(user), _task_vector(task))
     
-    def _calculate_rating_score(self, user):
+    def _calculate_rating_score(self, user, config=None):
         """
         計算評價信任值
         
@@ -145,6 +180,7 @@ class MatchingEngine:
         - 完成率（用完成任務數估算）
         - 信任值
         """
+        thresholds = (config or self.config).thresholds
         avg_rating = user.get('avg_rating', 3.0)
         trust_score = user.get('trust_score', 0.5)
         completed = user.get('completed_tasks', 0)
@@ -153,18 +189,18 @@ class MatchingEngine:
         rating_normalized = (avg_rating - 1) / 4
         
         # 完成率評估（完成越多，越可靠）
-        completion_factor = min(1.0, completed / 20)  # 20個任務為滿分
+        completion_factor = min(1.0, completed / thresholds['rating_full_completed'])
         
         # 綜合計算
         score = (
-            rating_normalized * 0.5 +
-            trust_score * 0.3 +
-            completion_factor * 0.2
+            rating_normalized * thresholds['rating_avg_weight'] +
+            trust_score * thresholds['rating_trust_weight'] +
+            completion_factor * thresholds['rating_completion_weight']
         )
         
         return max(0.0, min(1.0, score))
     
-    def _calculate_location_score(self, user, task):
+    def _calculate_location_score(self, user, task, config=None):
         """
         計算地點相符度
         
@@ -172,8 +208,9 @@ class MatchingEngine:
         - 同校區：1.0
         - 跨校區但願意：0.6
         - 線上任務：1.0
-        - 不願跨校區：0.0
+        - 不願跨校區：0.2
         """
+        thresholds = (config or self.config).thresholds
         user_campus = user.get('campus', '')
         task_campus = task.get('campus', '')
         willing_cross = user.get('willing_cross_campus', False)
@@ -189,44 +226,57 @@ class MatchingEngine:
         # 跨校區
         if user_campus != task_campus:
             if willing_cross:
-                return 0.6
+                return thresholds['location_cross_willing']
             else:
-                return 0.2  # 給一點分數（可能會考慮）
+                return thresholds['location_cross_unwilling']  # 給一點分數（可能會考慮）
         
         return 0.5  # 預設中等分數
     
-    def get_top_recommendations(self, user, tasks, top_n=5):
+    def get_top_recommendations(self, user, tasks, top_n=5, candidate_index=None, candidates=None):
         """
         取得 Top N 推薦任務
         
+        逐一計分並只保留目前最好的 top_n 筆（heapq，O(N log K)，不需先建好所有任務的分數列表），
+        同分時依 tasks 的順序排列，與完整排序後取前 N 筆的結果相同
+        
+        傳入向量索引時先以語意最近鄰取候選，只對候選完整計分（近似結果，任務量大時使用）；
+        索引建立後才新增的任務不在索引內，一律計分
+        
         Args:
             user (dict): 使用者資料
-            tasks (list): 任務列表
+            tasks (iterable): 任務列表或 generator
             top_n (int): 返回數量
+            candidate_index (semantic.VectorIndex): 開放中任務的向量索引（可選）
+            candidates (int): 向量索引取的候選數（預設 Config.SEMANTIC_CANDIDATES）
         
         Returns:
-            list: 排序後的推薦列表
+            list: [{'task', 'score', 'details'}]，分數由高到低
         """
-        recommendations = []
-        
-        for task in tasks:
-            # 不推薦自己發布的任務
-            if task.get('publisher_id') == user.get('id'):
-                continue
-            
-            # 計算分數
-            score_data = self.calculate_match_score(user, task)
-            
-            recommendations.append({
-                'task': task,
-                'score': score_data['total_score'],
-                'details': score_data
-            })
-        
-        # 排序
-        recommendations.sort(key=lambda x: x['score'], reverse=True)
-        
-        return recommendations[:top_n]
+        # 整份清單使用同一份設定
+        matcher = self if self._config else MatchingEngine(self.config)
+        
+        shortlist = None
+        candidates = candidates or Config.SEMANTIC_CANDIDATES
+        if candidate_index is not None and len(candidate_index) > candidates:
+            shortlist = {task_id for task_id, _ in candidate_index.search(_user_vector(user), k=candidates)}
+            indexed = set(candidate_index.ids.tolist())
+        
+        def scored():
+            for task in tasks:
+                # 不推薦自己發布的任務
+                if task.get('publisher_id') == user.get('id'):
+                    continue
+                if shortlist is not None and task.get('id') in indexed and task.get('id') not in shortlist:
+                    continue
+                
+                score_data = matcher.calculate_match_score(user, task)
+                yield {
+                    'task': task,
+                    'score': score_data['total_score'],
+                    'details': score_data
+                }
+        
+        return heapq.nlargest(top_n, scored(), key=lambda rec: rec['score'])
 
 
 # 測試用
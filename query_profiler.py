@@ -0,0 +1,167 @@
+"""
+SQL 查詢分析模組 - Campus Help
+掛在 SQLAlchemy 引擎上，統計每次請求（Streamlit 每次 rerun）的查詢數、
+資料庫耗時、最慢的查詢，並找出重複執行的查詢（N+1 徵兆）
+
+使用方式:
+    SQL_PROFILING=1 streamlit run app.py
+
+    profiler = query_profiler.start_request('home')
+    ...
+    summary = query_profiler.end_request()
+"""
+import json
+import logging
+import time
+from contextvars import ContextVar
+
+from sqlalchemy import event
+
+from config import Config
+
+logger = logging.getLogger('campus_help.sql')
+
+# 目前請求的 profiler（Streamlit 每個 Session 在各自的執行緒執行，互不干擾）
+_current_profiler = ContextVar('campus_help_query_profiler', default=None)
+
+
+class QueryProfiler:
+    """單次請求的 SQL 統計"""
+
+    def __init__(self, label='', slow_query_limit=None, repeat_threshold=None):
+        """
+        Args:
+            label: 請求標籤（例如頁面名稱）
+            slow_query_limit: 保留最慢查詢的筆數
+            repeat_threshold: 同一條 SQL 執行幾次以上視為重複
+        """
+        self.label = label
+        self.slow_query_limit = slow_query_limit or Config.SQL_PROFILING_SLOW_LIMIT
+        self.repeat_threshold = repeat_threshold or Config.SQL_PROFILING_REPEAT_THRESHOLD
+        self.started_at = time.perf_counter()
+
+        self.statement_count = 0
+        self.total_time = 0.0
+        self.slowest = []  # [(耗時, SQL, 參數)]
+        self.statement_counts = {}  # SQL → 次數（同樣的 SQL、不同參數 = N+1）
+        self.exact_counts = {}  # (SQL, 參數) → 次數（完全相同的查詢）
+
+    def record(self, statement, parameters, duration):
+        """記錄一次查詢"""
+        self.statement_count += 1
+        self.total_time += duration
+
+        self.statement_counts[statement] = self.statement_counts.get(statement, 0) + 1
+        exact_key = (statement, repr(parameters))
+        self.exact_counts[exact_key] = self.exact_counts.get(exact_key, 0) + 1
+
+        if len(self.slowest) < self.slow_query_limit or duration > self.slowest[-1][0]:
+            self.slowest.append((duration, statement, parameters))
+            self.slowest.sort(key=lambda item: item[0], reverse=True)
+            del self.slowest[self.slow_query_limit:]
+
+    def summary(self):
+        """
+        整理統計結果
+
+        Returns:
+            dict: 查詢數、資料庫耗時、最慢查詢、重複查詢
+        """
+        repeated = [
+            {'statement': statement, 'count': count}
+            for statement, count in self.statement_counts.items()
+            if count >= self.repeat_threshold
+        ]
+        repeated.sort(key=lambda item: item['count'], reverse=True)
+
+        duplicates = [
+            {'statement': statement, 'parameters': parameters, 'count': count}
+            for (statement, parameters), count in self.exact_counts.items()
+            if count > 1
+        ]
+        duplicates.sort(key=lambda item: item['count'], reverse=True)
+
+        return {
+            'label': self.label,
+            'statement_count': self.statement_count,
+            'db_time_ms': round(self.total_time * 1000, 2),
+            'wall_time_ms': round((time.perf_counter() - self.started_at) * 1000, 2),
+            'slowest': [
+                {'duration_ms': round(duration * 1000, 2), 'statement': statement, 'parameters': repr(parameters)}
+                for duration, statement, parameters in self.slowest
+            ],
+            'repeated': repeated,
+            'duplicates': duplicates
+        }
+
+
+# ========== 引擎事件 ==========
+
+def _configure_logger():
+    """啟用分析時才設定 log 輸出（只匯入模組不更動 logging 設定）"""
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter('%(asctime)s %(name)s %(message)s'))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start_time', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start_times = conn.info.get('query_start_time')
+    if not start_times:
+        return
+    duration = time.perf_counter() - start_times.pop()
+
+    profiler = _current_profiler.get()
+    if profiler is not None:
+        profiler.record(statement, parameters, duration)
+
+
+def attach(db_engine):
+    """在引擎上掛載查詢計時事件，並設定 log 輸出"""
+    _configure_logger()
+    if not event.contains(db_engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(db_engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(db_engine, 'after_cursor_execute', _after_cursor_execute)
+
+
+# ========== 請求範圍 ==========
+
+def start_request(label=''):
+    """開始統計一次請求，回傳 profiler"""
+    profiler = QueryProfiler(label)
+    _current_profiler.set(profiler)
+    return profiler
+
+
+def end_request(log=True):
+    """
+    結束目前請求的統計
+
+    Args:
+        log: 是否輸出一行結構化 log（JSON）
+
+    Returns:
+        dict: 統計結果（沒有進行中的請求時回傳 None）
+    """
+    profiler = _current_profiler.get()
+    if profiler is None:
+        return None
+    _current_profiler.set(None)
+
+    summary = profiler.summary()
+    if log:
+        logger.info(json.dumps({
+            'event': 'sql_profile',
+            'label': summary['label'],
+            'statement_count': summary['statement_count'],
+            'db_time_ms': summary['db_time_ms'],
+            'wall_time_ms': summary['wall_time_ms'],
+            'slowest_ms': summary['slowest'][0]['duration_ms'] if summary['slowest'] else 0,
+            'repeated_statements': len(summary['repeated'])
+        }, ensure_ascii=False))
+    return summary
@@ -0,0 +1,380 @@
+"""
+推薦清單背景更新 - Campus Help
+為每位活躍使用者預先計算 Top K 推薦任務並寫入 recommendations 資料表，
+AI 推薦頁面只需一次索引查詢
+
+增量更新：
+- 新開放的任務：只對新任務計分，併入既有清單
+- 任務關閉（被接受、完成）：清單中含已關閉任務的使用者整份重算
+- 個人資料變更（完成任務、收到評價）：該使用者整份重算
+- 新使用者：整份計算
+- 媒合設定重新載入（版本不同）：所有使用者整份重算
+
+使用方式:
+    python recommendation_worker.py             # 持續執行，每 RECOMMENDATION_REFRESH_INTERVAL 秒更新
+    python recommendation_worker.py --once      # 只更新一次
+    RECOMMENDATION_WORKER=1 streamlit run app.py  # 由 app 啟動背景執行緒
+"""
+import argparse
+import heapq
+import json
+import logging
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, insert, or_, update
+from sqlalchemy.orm import aliased
+
+import database
+from config import Config
+from matching_engine import MatchingEngine
+
+logger = logging.getLogger('campus_help.recommendations')
+
+
+def _configure_logging():
+    """啟動背景更新時才設定 log 輸出（只匯入模組不更動 logging 設定）"""
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter('%(asctime)s %(name)s %(message)s'))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+
+
+class RecommendationWorker:
+    """維護預先計算的推薦清單"""
+
+    def __init__(self, top_k=None, clock_skew=None, batch_size=500):
+        """
+        Args:
+            top_k: 每位使用者保留的推薦數
+            clock_skew: 掃描新任務時往前重疊的秒數（涵蓋交易較晚提交的任務）
+            batch_size: 每個交易寫入的使用者數
+        """
+        self.top_k = top_k or Config.RECOMMENDATION_TOP_K
+        self.clock_skew = timedelta(seconds=Config.RECOMMENDATION_CLOCK_SKEW if clock_skew is None else clock_skew)
+        self.batch_size = batch_size
+        self.matcher = MatchingEngine()
+
+    def refresh(self):
+        """
+        執行一次增量更新
+
+        Returns:
+            dict: 重算 / 合併的使用者數、計分次數、耗時與吞吐量
+        """
+        started_at = datetime.utcnow()
+        start = time.perf_counter()
+        stats = {'users': 0, 'users_recomputed': 0, 'users_merged': 0, 'lists_written': 0, 'scores_computed': 0}
+        # 本輪固定使用同一版本的設定，更新中途重新載入也不會混用
+        matcher = MatchingEngine(self.matcher.config)
+        version = matcher.config.version
+        stats['config_version'] = version
+
+        session = database.Session()
+        try:
+            users = [u.to_dict() for u in session.query(database.User).filter_by(status='active')]
+            states = {s.user_id: s for s in session.query(database.RecommendationState)}
+            open_tasks = load_open_tasks(session)
+            stats['users'] = len(users)
+
+            # 清單中含已關閉任務的使用者
+            closed_users = {
+                user_id for (user_id,) in
+                session.query(database.Recommendation.user_id)
+                .join(database.Task, database.Task.id == database.Recommendation.task_id)
+                .filter(database.Task.status != 'open')
+                .distinct()
+            }
+
+            full_users = []
+            merge_users = []
+            for user in users:
+                state = states.get(user['id'])
+                if (state is None or state.stale or state.computed_at is None or user['id'] in closed_users
+                        or state.config_version != version):
+                    full_users.append(user)
+                else:
+                    merge_users.append(user)
+
+            # 整份重算
+            task_dicts = [task for task, _ in open_tasks]
+            for batch in _chunks(full_users, self.batch_size):
+                lists = {}
+                for user in batch:
+                    top = matcher.get_top_recommendations(user, task_dicts, self.top_k)
+                    stats['scores_computed'] += len(task_dicts)
+                    lists[user['id']] = [(rec['score'], rec['task']['id'], rec['details']) for rec in top]
+                write_lists(session, lists)
+                mark_fresh(session, [user['id'] for user in batch], states, started_at, version)
+                session.commit()
+                stats['users_recomputed'] += len(batch)
+                stats['lists_written'] += len(lists)
+
+            # 只併入新任務
+            if merge_users:
+                since = min(states[user['id']].computed_at for user in merge_users) - self.clock_skew
+                new_tasks = [(task, created_at) for task, created_at in open_tasks if created_at and created_at > since]
+                if new_tasks:
+                    created = {task['id']: created_at for task, created_at in open_tasks}
+                    current = self._load_lists(session, [user['id'] for user in merge_users])
+                    lists = {}
+                    for user in merge_users:
+                        window = states[user['id']].computed_at - self.clock_skew
+                        candidates = [task for task, created_at in new_tasks if created_at > window]
+                        if not candidates:
+                            continue
+                        merged = self._merge(matcher, user, current.get(user['id'], []), candidates, created)
+                        stats['scores_computed'] += len(candidates)
+                        stats['users_merged'] += 1
+                        if [item[1] for item in merged] != [item[1] for item in current.get(user['id'], [])]:
+                            lists[user['id']] = merged
+                    for user_ids in _chunks(list(lists), self.batch_size):
+                        write_lists(session, {user_id: lists[user_id] for user_id in user_ids})
+                        session.commit()
+                    stats['lists_written'] += len(lists)
+
+                # 未受新任務影響的清單仍是最新的
+                session.execute(
+                    update(database.RecommendationState)
+                    .where(database.RecommendationState.stale == False,
+                           database.RecommendationState.computed_at < started_at)
+                    .values(computed_at=started_at)
+                )
+                session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+        elapsed = time.perf_counter() - start
+        stats['elapsed_seconds'] = round(elapsed, 3)
+        stats['scores_per_second'] = round(stats['scores_computed'] / elapsed) if elapsed > 0 else 0
+        stats['staleness'] = get_staleness()
+        return stats
+
+    def run_forever(self, interval=None, stop_event=None):
+        """
+        持續更新直到 stop_event 被設定
+
+        Args:
+            interval: 兩次更新間隔秒數
+            stop_event: threading.Event（None 表示永不停止）
+        """
+        _configure_logging()
+        interval = interval or Config.RECOMMENDATION_REFRESH_INTERVAL
+        stop_event = stop_event or threading.Event()
+        while not stop_event.is_set():
+            start = time.perf_counter()
+            try:
+                stats = self.refresh()
+                logger.info(json.dumps({'event': 'recommendation_refresh', 'status': 'ok', **stats}, ensure_ascii=False))
+            except Exception as e:
+                # 失敗也輸出同樣格式的結構化 log，監控才看得到清單持續變舊
+                try:
+                    staleness = get_staleness()
+                except Exception:
+                    staleness = None
+                logger.exception(json.dumps({
+                    'event': 'recommendation_refresh',
+                    'status': 'error',
+                    'error': str(e),
+                    'elapsed_seconds': round(time.perf_counter() - start, 3),
+                    'staleness': staleness
+                }, ensure_ascii=False))
+            stop_event.wait(interval)
+
+    # ========== 內部函數 ==========
+
+    def _load_lists(self, session, user_ids):
+        """載入既有清單 {user_id: [(score, task_id, details)]}"""
+        lists = {}
+        for user_batch in _chunks(user_ids, self.batch_size):
+            rows = (
+                session.query(database.Recommendation)
+                .filter(database.Recommendation.user_id.in_(user_batch))
+                .order_by(database.Recommendation.user_id, database.Recommendation.rank)
+            )
+            for rec in rows:
+                details = json.loads(rec.details) if rec.details else {}
+                lists.setdefault(rec.user_id, []).append((rec.score, rec.task_id, details))
+        return lists
+
+    def _merge(self, matcher, user, current, candidates, created):
+        """新任務計分後併入既有清單，取前 top_k"""
+        merged = {task_id: (score, task_id, details) for score, task_id, details in current}
+        for task in candidates:
+            if task.get('publisher_id') == user.get('id'):
+                continue
+            details = matcher.calculate_match_score(user, task)
+            merged[task['id']] = (details['total_score'], task['id'], details)
+        # 依分數、同分時依建立時間新到舊，順序與整份重算一致
+        return heapq.nlargest(self.top_k, merged.values(),
+                              key=lambda item: (item[0], created.get(item[1]) or datetime.min))
+
+
+# ========== 清單讀寫 ==========
+
+def load_open_tasks(session):
+    """
+    一次查詢載入所有開放中任務（依建立時間新到舊，與頁面排序一致）
+
+    Returns:
+        list: [(任務字典, 建立時間)]
+    """
+    Publisher = aliased(database.User)
+    rows = (
+        session.query(database.Task, Publisher)
+        .join(Publisher, Publisher.id == database.Task.publisher_id)
+        .filter(database.Task.status == 'open')
+        .order_by(database.Task.created_at.desc())
+        .all()
+    )
+    return [(database._task_to_dict(task, publisher, None), task.created_at) for task, publisher in rows]
+
+
+
+def write_lists(session, lists):
+    """以新清單取代使用者的舊清單"""
+    if not lists:
+        return
+    session.execute(
+        delete(database.Recommendation).where(database.Recommendation.user_id.in_(list(lists)))
+    )
+    rows = [
+        {
+            'user_id': user_id,
+            'task_id': task_id,
+            'rank': rank,
+            'score': score,
+            'details': json.dumps(details, ensure_ascii=False)
+        }
+        for user_id, items in lists.items()
+        for rank, (score, task_id, details) in enumerate(items, start=1)
+    ]
+    if rows:
+        session.execute(insert(database.Recommendation), rows)
+
+
+def mark_fresh(session, user_ids, known_user_ids, started_at, config_version=None):
+    """
+    整份重算完成後清除 stale 標記，並記錄使用的媒合設定版本
+
+    更新期間又被標記的使用者（stale_since 晚於本次開始）保留標記，下一輪再重算
+    """
+    new_users = [user_id for user_id in user_ids if user_id not in known_user_ids]
+    if new_users:
+        session.execute(
+            insert(database.RecommendationState),
+            [{'user_id': user_id, 'computed_at': started_at, 'stale': False, 'config_version': config_version}
+             for user_id in new_users]
+        )
+    session.execute(
+        update(database.RecommendationState)
+        .where(
+            database.RecommendationState.user_id.in_(user_ids),
+            or_(database.RecommendationState.stale_since == None,
+                database.RecommendationState.stale_since < started_at)
+        )
+        .values(computed_at=started_at, stale=False, stale_since=None, config_version=config_version)
+    )
+
+
+def _chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+# ========== 狀態查詢 ==========
+
+def get_staleness():
+    """
+    推薦清單的新鮮度
+
+    Returns:
+        dict: 使用者數、待重算數、最舊清單的秒數、等待最久的重算秒數
+    """
+    session = database.Session()
+
+    try:
+        now = datetime.utcnow()
+        active_users = session.query(database.User).filter_by(status='active').count()
+        states = (
+            session.query(database.RecommendationState)
+            .join(database.User, database.User.id == database.RecommendationState.user_id)
+            .filter(database.User.status == 'active')
+            .all()
+        )
+
+        computed = [s.computed_at for s in states if s.computed_at]
+        pending = [s.stale_since for s in states if s.stale and s.stale_since]
+
+        return {
+            'users': active_users,
+            'users_without_list': active_users - len(computed),
+            'stale_users': len(pending),
+            'oldest_list_seconds': round((now - min(computed)).total_seconds(), 1) if computed else None,
+            'max_pending_seconds': round((now - min(pending)).total_seconds(), 1) if pending else 0.0
+        }
+    finally:
+        session.close()
+
+
+def start_background_worker(interval=None):
+    """
+    在背景執行緒持續更新推薦清單
+
+    Returns:
+        threading.Event: 設定後背景執行緒會停止
+    """
+    _configure_logging()
+    stop_event = threading.Event()
+    worker = RecommendationWorker()
+    thread = threading.Thread(
+        target=worker.run_forever,
+        kwargs={'interval': interval, 'stop_event': stop_event},
+        name='recommendation-worker',
+        daemon=True
+    )
+    thread.start()
+    return stop_event
+
+
+def main():
+    """命令列入口"""
+    parser = argparse.ArgumentParser(description='Campus Help 推薦清單背景更新')
+    parser.add_argument('--once', action='store_true', help='只更新一次')
+    parser.add_argument('--interval', type=int, default=Config.RECOMMENDATION_REFRESH_INTERVAL, help='更新間隔（秒）')
+    parser.add_argument('--top-k', type=int, default=Config.RECOMMENDATION_TOP_K, help='每位使用者的推薦數')
+    parser.add_argument('--database-url', help='目標資料庫（預設使用 DATABASE_URL）')
+    args = parser.parse_args()
+    _configure_logging()
+
+    if args.database_url:
+        database.configure_database(args.database_url)
+    database.init_db()
+
+    worker = RecommendationWorker(top_k=args.top_k)
+    if not args.once:
+        print(f"🔄 推薦清單背景更新中（每 {args.interval} 秒），Ctrl+C 結束")
+        try:
+            worker.run_forever(args.interval)
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    stats = worker.refresh()
+    staleness = stats['staleness']
+    print("✅ 推薦清單更新完成")
+    print(f"   - 使用者: {stats['users']} 位（整份重算 {stats['users_recomputed']}、併入新任務 {stats['users_merged']}）")
+    print(f"   - 寫入清單: {stats['lists_written']} 份")
+    print(f"   ⏱️  耗時: {stats['elapsed_seconds']} 秒（{stats['scores_per_second']} 次計分/秒）")
+    print(f"   🕒 待重算: {staleness['stale_users']} 位 | 最舊清單: {staleness['oldest_list_seconds']} 秒")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,215 @@
+"""
+語意媒合 - Campus Help（選用，SEMANTIC_MATCHING=1 時啟用）
+關鍵字推斷技能會漏掉換句話說的任務（例如「幫忙拍畢業照」不含「攝影」），
+這裡以字元 n-gram 雜湊向量化任務文字與使用者技能，用餘弦相似度補上語意分數
+
+- 向量化：中文字元 1-gram / 2-gram 與英數單字，雜湊到固定維度（不需下載模型，純 CPU）
+- 儲存：寫入任務 / 使用者時計算，以 float32 blob 存在資料庫
+- 索引：VectorIndex，少量資料以 NumPy 暴力搜尋，大量資料改用 IVF（k-means 分群後只搜尋最近的幾群）
+- 媒合：Config.MATCHING_WEIGHTS['semantic'] 為語意分數的權重（預設 SEMANTIC_WEIGHT）
+
+使用方式:
+    vector = embed_text('幫忙拍畢業照')
+    index = VectorIndex.from_database()
+    index.search(user_vector(['攝影']), k=10)   # [(任務 ID, 相似度)]
+"""
+import math
+import re
+import zlib
+from functools import lru_cache
+
+import numpy as np
+
+import skill_vocabulary
+from config import Config
+
+DIM = Config.SEMANTIC_DIM
+
+_TOKEN_PATTERN = re.compile(r'[a-z0-9]+|[^\sa-z0-9]')
+_PUNCTUATION = set('，。！？、；：「」『』（）()[]【】…—-~,.!?;:\'"/\\|#')
+
+
+def _features(text):
+    """文字 → 特徵字串（中文單字、相鄰兩字、英數單字）"""
+    # 以空白分段，2-gram 不跨越詞與詞的邊界
+    for chunk in text.lower().split():
+        tokens = [t for t in _TOKEN_PATTERN.findall(chunk) if t not in _PUNCTUATION]
+        yield from tokens
+        for left, right in zip(tokens, tokens[1:]):
+            if len(left) == 1 and len(right) == 1:
+                yield left + right
+
+
+@lru_cache(maxsize=8192)
+def _embed_cached(text):
+    vector = np.zeros(DIM, dtype=np.float32)
+    for feature in _features(text):
+        h = zlib.crc32(feature.encode('utf-8'))
+        # 以雜湊值的最高位元決定正負號，降低碰撞造成的偏差
+        vector[h % DIM] += 1.0 if h & 0x80000000 else -1.0
+    norm = float(np.linalg.norm(vector))
+    if norm > 0:
+        vector /= norm
+    vector.flags.writeable = False  # 快取共用，不可修改
+    return vector
+
+
+def embed_text(text):
+    """
+    文字 → 單位長度的 float32 向量（空字串為零向量）
+
+    Args:
+        text: 任意文字
+
+    Returns:
+        np.ndarray: shape (DIM,)
+    """
+    return _embed_cached(text or '')
+
+
+def task_text(title, description, category):
+    return ' '.join(part for part in (title, description, category) if part)
+
+
+def task_vector(task):
+    """任務字典 → 向量（標題、描述、分類）"""
+    return embed_text(task_text(task.get('title'), task.get('description'), task.get('category')))
+
+
+def user_vector(skills):
+    """使用者技能 → 向量（標準技能連同同義詞一起向量化，涵蓋更多說法）"""
+    return _user_vector_cached(tuple(skills))
+
+
+@lru_cache(maxsize=8192)
+def _user_vector_cached(skills):
+    words = []
+    for skill in skills:
+        canonical = skill_vocabulary.normalize_skill(skill)
+        words.append(canonical)
+        words.extend(alias for alias, target in skill_vocabulary.SKILL_ALIASES.items()
+                     if target == canonical and alias != canonical)
+    return embed_text(' '.join(sorted(set(words))))
+
+
+def similarity(u, v):
+    """餘弦相似度，負值視為 0（兩者皆為單位向量）"""
+    return max(0.0, min(1.0, float(np.dot(u, v))))
+
+
+def to_blob(vector):
+    return np.asarray(vector, dtype=np.float32).tobytes()
+
+
+def from_blob(blob):
+    return np.frombuffer(blob, dtype=np.float32)
+
+
+def stored_vector(blob):
+    """資料庫存的向量；尚未計算或維度與目前設定不同時回傳 None（呼叫端改為當場計算）"""
+    if not blob:
+        return None
+    vector = from_blob(blob)
+    return vector if len(vector) == DIM else None
+
+
+class VectorIndex:
+    """向量最近鄰索引：暴力搜尋或 IVF"""
+
+    def __init__(self, ids, vectors, n_lists=None, seed=0):
+        """
+        Args:
+            ids: 向量對應的 ID
+            vectors: shape (N, DIM) 的單位向量
+            n_lists: IVF 分群數；None 時依資料量決定（少於 SEMANTIC_ANN_THRESHOLD 筆用暴力搜尋）
+            seed: k-means 初始化的亂數種子
+        """
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.vectors = np.ascontiguousarray(vectors, dtype=np.float32).reshape(len(self.ids), DIM)
+
+        if n_lists is None:
+            n_lists = int(math.sqrt(len(self.ids))) if len(self.ids) >= Config.SEMANTIC_ANN_THRESHOLD else 0
+        self.n_lists = min(n_lists, len(self.ids))
+        self.centroids = None
+        self.lists = None
+        if self.n_lists > 1:
+            self._build_ivf(seed)
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def from_database(cls, **kwargs):
+        """以開放中任務的向量建立索引"""
+        import database
+
+        session = database.Session()
+        try:
+            rows = (
+                session.query(database.Task.id, database.Task.embedding)
+                .filter(database.Task.status == 'open', database.Task.embedding != None)
+                .all()
+            )
+        finally:
+            session.close()
+
+        vectors = np.array([from_blob(blob) for _, blob in rows], dtype=np.float32).reshape(len(rows), DIM)
+        return cls([task_id for task_id, _ in rows], vectors, **kwargs)
+
+    def _build_ivf(self, seed, iterations=10, sample_size=20000):
+        """球面 k-means：以抽樣資料訓練群中心，再把所有向量分到最近的群"""
+        rng = np.random.default_rng(seed)
+        sample = self.vectors
+        if len(sample) > sample_size:
+            sample = sample[rng.choice(len(sample), sample_size, replace=False)]
+
+        centroids = sample[rng.choice(len(sample), self.n_lists, replace=False)].copy()
+        for _ in range(iterations):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            for c in range(self.n_lists):
+                members = sample[assignment == c]
+                if len(members):
+                    center = members.sum(axis=0)
+                    norm = np.linalg.norm(center)
+                    centroids[c] = center / norm if norm > 0 else centroids[c]
+
+        assignment = np.argmax(self.vectors @ centroids.T, axis=1)
+        order = np.argsort(assignment, kind='stable')
+        bounds = np.searchsorted(assignment[order], np.arange(self.n_lists + 1))
+        self.centroids = centroids
+        self.lists = [order[bounds[c]:bounds[c + 1]] for c in range(self.n_lists)]
+
+    def search(self, query, k=10, nprobe=None):
+        """
+        找出最相似的 k 筆
+
+        Args:
+            query: 查詢向量
+            k: 回傳筆數
+            nprobe: IVF 搜尋的群數（預設 Config.SEMANTIC_NPROBE）
+
+        Returns:
+            list: [(ID, 相似度)]，相似度由高到低
+        """
+        if len(self.ids) == 0:
+            return []
+        query = np.asarray(query, dtype=np.float32)
+
+        if self.centroids is None:
+            rows = None
+            scores = self.vectors @ query
+        else:
+            nprobe = min(nprobe or Config.SEMANTIC_NPROBE, self.n_lists)
+            nearest = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+            rows = np.concatenate([self.lists[c] for c in nearest])
+            scores = self.vectors[rows] @ query
+
+        k = min(k, len(scores))
+        if k == 0:
+            return []
+        # 先用 partition 找出第 k 高的分數，保留所有同分者，同分時 ID 小的在前（暴力搜尋與 IVF 順序一致）
+        threshold = np.partition(scores, len(scores) - k)[len(scores) - k]
+        top = np.flatnonzero(scores >= threshold)
+        positions = top if rows is None else rows[top]
+        order = np.lexsort((self.ids[positions], -scores[top]))[:k]
+        return [(int(self.ids[positions[i]]), float(scores[top[i]])) for i in order]
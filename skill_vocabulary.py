@@ -0,0 +1,55 @@
+"""
+技能詞彙 - Campus Help
+將使用者填寫的技能（含同義詞，例如 "ps" → "設計"）正規化為標準技能，
+並以整數位元遮罩表示技能集合：技能重疊數 = popcount(user_mask & task_mask)
+
+詞彙定義在 Config.SKILL_SYNONYMS，順序即位元位置；
+資料庫的 skills / skill_synonyms 資料表於 init_db 時同步，供 SQL 查詢使用
+"""
+from config import Config
+
+# 位元遮罩存在 BIGINT（有號 64 位元）欄位，最多 63 個技能
+MAX_SKILLS = 63
+
+# 標準技能 → 位元位置
+SKILL_BITS = {skill.lower(): bit for bit, skill in enumerate(Config.SKILL_SYNONYMS)}
+
+# 同義詞（含標準技能本身）→ 標準技能
+SKILL_ALIASES = {}
+for _skill, _synonyms in Config.SKILL_SYNONYMS.items():
+    for _alias in [_skill] + list(_synonyms):
+        SKILL_ALIASES[_alias.lower()] = _skill.lower()
+
+if len(SKILL_BITS) > MAX_SKILLS:
+    raise ValueError(f"技能詞彙超過 {MAX_SKILLS} 個（{len(SKILL_BITS)}），無法以位元遮罩編碼")
+
+
+def normalize_skill(name):
+    """
+    正規化技能名稱
+
+    Returns:
+        str: 標準技能（小寫）；不在詞彙中的技能回傳去除空白後的小寫名稱
+    """
+    name = name.strip().lower()
+    return SKILL_ALIASES.get(name, name)
+
+
+def skill_mask(skills):
+    """技能列表 → 位元遮罩（詞彙外的技能不佔位元）"""
+    mask = 0
+    for skill in skills:
+        bit = SKILL_BITS.get(normalize_skill(skill))
+        if bit is not None:
+            mask |= 1 << bit
+    return mask
+
+
+def skills_from_mask(mask):
+    """位元遮罩 → 標準技能列表"""
+    return [skill for skill, bit in SKILL_BITS.items() if mask & (1 << bit)]
+
+
+def popcount(mask):
+    """位元數（Python 3.9 沒有 int.bit_count）"""
+    return bin(mask).count('1')
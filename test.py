@@ -1,8 +1,15 @@
 """
 功能測試腳本
 驗證所有模組是否正常運作
+
+資料庫後端測試預設使用暫存 SQLite；設定 TEST_POSTGRES_URL，
+或安裝 pgserver（自動啟動本機 PostgreSQL）即可一併測試 PostgreSQL。
 """
+import os
 import sys
+import tempfile
+import threading
+import time
 
 def test_imports():
     """測試所有模組是否可以匯入"""
@@ -86,9 +93,509 @@ def test_database():
         print(f"   ❌ 資料庫測試失敗: {e}")
         return False
 
+def _backend_urls(tmp_dir):
+    """列出要測試的資料庫後端（名稱, 連線字串, 清理函數）"""
+    backends = [('SQLite', f"sqlite:///{os.path.join(tmp_dir, 'backend_test.db')}", None)]
+    
+    pg_url = os.getenv('TEST_POSTGRES_URL')
+    if pg_url:
+        backends.append(('PostgreSQL', pg_url, None))
+    else:
+        try:
+            import pgserver
+            server = pgserver.get_server(os.path.join(tmp_dir, 'pgdata'))
+            backends.append(('PostgreSQL (pgserver)', server.get_uri(), server.cleanup))
+        except ImportError:
+            print("   ℹ️  未設定 TEST_POSTGRES_URL 且未安裝 pgserver，略過 PostgreSQL")
+    
+    return backends
+
+def _check_task_lifecycle(database):
+    """在目前的後端上跑完整任務流程，並驗證點數守恆"""
+    database.init_db()
+    database.seed_test_data()
+    
+    users = database.get_all_users()
+    publisher, helper = users[0], users[1]
+    total_before = sum(u['points'] for u in users)
+    
+    # 技能位元遮罩在 SQL 中篩選（同義詞 ps → 設計）
+    assert [u['name'] for u in database.get_users_by_skills(['ps'])] == ['王小美'], "技能篩選錯誤"
+    assert len(database.get_users_by_skills(['python', '教學'], match_all=True)) == 1, "技能篩選（全部符合）錯誤"
+    
+    task_id = database.create_task({
+        'publisher_id': publisher['id'],
+        'title': '後端測試任務',
+        'description': '驗證資料庫後端的任務流程',
+        'category': '日常支援',
+        'location': '圖書館',
+        'campus': publisher['campus'],
+        'points_offered': 40
+    })
+    assert task_id, "建立任務失敗"
+    assert database.apply_for_task(task_id, helper['id']), "申請任務失敗"
+    assert database.accept_application(task_id, helper['id'], publisher['id']), "接受申請失敗"
+    assert database.complete_task(task_id, helper['id']), "完成任務失敗"
+    assert not database.complete_task(task_id, publisher['id']), "任務被重複完成"
+    assert database.submit_review(task_id, publisher['id'], helper['id'], 5.0), "提交評價失敗"
+    
+    publisher_after = database.get_user_by_id(publisher['id'])
+    helper_after = database.get_user_by_id(helper['id'])
+    assert publisher_after['points'] == publisher['points'] - 40, "發起者點數錯誤"
+    assert helper_after['points'] == helper['points'] + 40, "幫助者點數錯誤"
+    
+    # 批次流程：同一批內的重複、無權限與狀態不符項目回傳 False，其餘與單筆流程結果相同
+    task_ids = [database.create_task({
+        'publisher_id': publisher['id'],
+        'title': f'批次任務 {i}',
+        'description': '活動結束一次確認',
+        'category': '校園協助',
+        'location': '體育館',
+        'campus': publisher['campus'],
+        'points_offered': 10
+    }) for i in range(3)]
+    helpers = users[1:4]
+    assert database.apply_for_tasks([(t, h['id']) for t, h in zip(task_ids, helpers)] + [(task_ids[0], helpers[0]['id'])]) == \
+        [True, True, True, False], "批次申請結果錯誤"
+    assert database.accept_applications([(t, h['id'], publisher['id']) for t, h in zip(task_ids, helpers)] +
+                                        [(task_ids[0], helpers[1]['id'], publisher['id'])]) == \
+        [True, True, True, False], "批次接受結果錯誤"
+    assert database.complete_tasks([(task_ids[0], helpers[1]['id'])] + [(t, publisher['id']) for t in task_ids]) == \
+        [False, True, True, True], "批次完成結果錯誤"
+    for helper_before in helpers:
+        assert database.get_user_by_id(helper_before['id'])['points'] == \
+            helper_before['points'] + 10 + (40 if helper_before['id'] == helper['id'] else 0), "批次完成點數錯誤"
+
+    # 併發接受：多個執行緒同時接受同一任務，只有一個成功，申請狀態與得標者一致
+    task_id = database.create_task({
+        'publisher_id': publisher['id'],
+        'title': '熱門任務',
+        'description': '很多人申請',
+        'category': '日常支援',
+        'location': '圖書館',
+        'campus': publisher['campus'],
+        'points_offered': 10
+    })
+    applicants = [u['id'] for u in users[1:]]
+    database.apply_for_tasks([(task_id, applicant_id) for applicant_id in applicants])
+    attempts = [applicants[i % len(applicants)] for i in range(8)]
+    outcomes = []
+    _run_concurrently(len(attempts), lambda i: database.accept_application(task_id, attempts[i], publisher['id']), outcomes)
+    assert outcomes.count(True) == 1, f"併發接受應只有一個成功（{outcomes.count(True)} 個成功）"
+    winner = attempts[outcomes.index(True)]
+    statuses = {a['applicant_id']: a['status'] for a in database.get_task_applications(task_id)}
+    assert statuses == {a: 'accepted' if a == winner else 'rejected' for a in applicants}, "申請狀態與得標者不一致"
+
+    # 併發完成：雙方多個執行緒同時完成同一任務，版本比對後只有一個成功、只入帳一次
+    database.reset_conflict_stats()
+    winner_points = database.get_user_by_id(winner)['points']
+    _run_concurrently(16, lambda i: database.complete_task(task_id, (winner, publisher['id'])[i % 2]), outcomes)
+    assert outcomes.count(True) == 1, f"併發完成應只有一個成功（{outcomes.count(True)} 個成功）"
+    assert database.get_user_by_id(winner)['points'] == winner_points + 10, "併發完成重複入帳"
+    stats = database.get_conflict_stats()['complete_task']
+    assert stats['attempts'] >= 16 and stats['exhausted'] == 0, f"完成任務重試用盡: {stats}"
+
+    # 併發評價同一個人：平均評分是讀取後寫回，版本衝突時重算，不會遺失其他人的評分
+    reviewers = [(t, h['id']) for t, h in zip(task_ids, helpers)] + [(task_id, winner)]
+    _run_concurrently(len(reviewers), lambda i: database.submit_review(
+        reviewers[i][0], reviewers[i][1], publisher['id'], 1 + i % 5, '併發評價'), outcomes)
+    assert all(outcomes), "併發評價失敗"
+    ratings = [r['rating'] for r in database.get_reviews_for_user(publisher['id'])]
+    assert database.get_user_by_id(publisher['id'])['avg_rating'] == round(sum(ratings) / len(ratings), 2), \
+        "併發評價後平均評分錯誤"
+
+    # 交叉完成：A 完成 A 發給 B 的任務、B 同時完成 B 發給 A 的任務，使用者依 ID 順序鎖定，不會死結
+    user_a, user_b = users[1]['id'], users[2]['id']
+    cross = []
+    for publisher_id, helper_id in [(user_a, user_b), (user_b, user_a)] * 4:
+        cross_task = database.create_task({
+            'publisher_id': publisher_id,
+            'title': '互相幫忙',
+            'description': '彼此交換的任務',
+            'category': '日常支援',
+            'location': '宿舍',
+            'campus': publisher['campus'],
+            'points_offered': 10
+        })
+        assert cross_task, "交叉任務建立失敗"
+        cross.append((cross_task, publisher_id, helper_id))
+    assert all(database.apply_for_tasks([(t, h) for t, _, h in cross]))
+    assert all(database.accept_applications([(t, h, p) for t, p, h in cross]))
+    database.reset_conflict_stats()
+    _run_concurrently(len(cross), lambda i: database.complete_task(cross[i][0], cross[i][1]), outcomes)
+    assert all(outcomes), f"交叉完成失敗（死結未重試？）: {outcomes}, {database.get_conflict_stats()}"
+
+    # 批次完成途中有一項被單筆完成：只有該項回傳 False，其他項目照常完成
+    # （在批次讀取之後、寫入之前插入單筆完成；PostgreSQL 已用 FOR UPDATE 鎖住，單筆完成等到批次提交後失敗）
+    race_tasks = [database.create_task({
+        'publisher_id': publisher['id'],
+        'title': f'社團活動 {i}',
+        'description': '活動結束一次確認',
+        'category': '校園協助',
+        'location': '體育館',
+        'campus': publisher['campus'],
+        'points_offered': 5
+    }) for i in range(6)]
+    race_helpers = [users[1 + i % 3]['id'] for i in range(len(race_tasks))]
+    assert all(database.apply_for_tasks(list(zip(race_tasks, race_helpers))))
+    assert all(database.accept_applications([(t, h, publisher['id']) for t, h in zip(race_tasks, race_helpers)]))
+    target = 2
+    single = []
+    execute_counted = database._execute_counted
+    
+    def execute_after_single_completion(connection, statement, params):
+        if not single:
+            thread = threading.Thread(target=lambda: single.append(
+                database.complete_task(race_tasks[target], race_helpers[target])))
+            thread.start()
+            thread.join(timeout=0.5)
+            single.append(thread)
+        return execute_counted(connection, statement, params)
+    
+    database.reset_conflict_stats()
+    database._execute_counted = execute_after_single_completion
+    try:
+        batch = database.complete_tasks([(t, publisher['id']) for t in race_tasks])
+    finally:
+        database._execute_counted = execute_counted
+    next(item for item in single if isinstance(item, threading.Thread)).join()
+    single_ok = next(item for item in single if isinstance(item, bool))
+    assert batch[:target] + batch[target + 1:] == [True] * (len(race_tasks) - 1), f"其他項目應完成: {batch}"
+    assert batch[target] != single_ok, f"同一任務應只被完成一次（批次 {batch[target]}、單筆 {single_ok}）"
+    if database.engine.dialect.name == 'sqlite':
+        assert single_ok and database.get_conflict_stats()['complete_tasks']['conflicts'] >= 1, "批次應重試後只讓出被搶先的項目"
+    assert all(t['status'] == 'completed' for t in database.get_all_tasks() if t['id'] in race_tasks), "批次任務未全部完成"
+    
+    # 任務完成後，發起者扣除的點數全數轉給幫助者，總點數不變
+    total_after = sum(u['points'] for u in database.get_all_users())
+    assert total_after == total_before, "點數不守恆"
+    
+    # 使用者點數必須能由帳本加總還原
+    assert not database.audit_point_ledger(), "點數與帳本不一致"
+    
+    # 串流讀取（每批 2 筆，跨越多批）與一次讀取的結果相同
+    assert list(database.iter_tasks(chunk_size=2)) == database.get_all_tasks(), "串流讀取任務結果不同"
+    assert list(database.iter_users(chunk_size=2)) == database.get_all_users(), "串流讀取使用者結果不同"
+    assert list(database.iter_user_tasks(helper['id'], 'applied', chunk_size=1)) == \
+        database.get_user_tasks(helper['id'], 'applied'), "串流讀取申請任務結果不同"
+
+def _run_concurrently(count, target, outcomes):
+    """以 count 個執行緒同時（Barrier 對齊）執行 target(i)，結果寫回 outcomes"""
+    barrier = threading.Barrier(count)
+    outcomes[:] = [None] * count
+
+    def run(i):
+        barrier.wait()
+        outcomes[i] = target(i)
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+def _check_review_statuses(database):
+    """一次查詢多個任務的評價狀態：已評價、未評價、非參與者與未完成的任務"""
+    users = database.get_all_users()
+    publisher, helper, other_publisher, other_helper = (u['id'] for u in users[:4])
+    
+    def make_task(publisher_id, helper_id, complete=True):
+        task_id = database.create_task({
+            'publisher_id': publisher_id,
+            'title': '評價狀態測試',
+            'description': '確認批次評價狀態',
+            'category': '日常支援',
+            'location': '圖書館',
+            'campus': users[0]['campus'],
+            'points_offered': 10
+        })
+        assert database.apply_for_task(task_id, helper_id)
+        assert database.accept_application(task_id, helper_id, publisher_id)
+        if complete:
+            assert database.complete_task(task_id, helper_id)
+        return task_id
+    
+    reviewed = make_task(publisher, helper)
+    pending = make_task(publisher, helper)
+    not_participant = make_task(other_publisher, other_helper)
+    in_progress = make_task(publisher, helper, complete=False)
+    missing = max(t['id'] for t in database.get_all_tasks()) + 1
+    assert database.submit_review(reviewed, publisher, helper, 5.0), "提交評價失敗"
+    
+    no_review = {'can_review': False, 'reviewee_id': None, 'has_reviewed': False}
+    statuses = database.check_review_statuses([reviewed, pending, not_participant, in_progress, missing], publisher)
+    assert statuses == {
+        reviewed: {'can_review': True, 'reviewee_id': helper, 'has_reviewed': True},
+        pending: {'can_review': True, 'reviewee_id': helper, 'has_reviewed': False},
+        not_participant: no_review,
+        in_progress: no_review,
+        missing: no_review
+    }, f"發起者的評價狀態錯誤: {statuses}"
+    
+    # 幫助者的角度：被評價者是發起者，發起者的評價不算幫助者已評價
+    statuses = database.check_review_statuses([reviewed, not_participant], helper)
+    assert statuses == {
+        reviewed: {'can_review': True, 'reviewee_id': publisher, 'has_reviewed': False},
+        not_participant: no_review
+    }, f"幫助者的評價狀態錯誤: {statuses}"
+    assert database.check_review_statuses([], publisher) == {}, "空清單應回傳空結果"
+
+def _check_user_tasks(database):
+    """使用者任務分頁的邊界（limit / offset）與各種狀態篩選"""
+    users = database.get_all_users()
+    publisher, helper = users[0]['id'], users[1]['id']
+    
+    for user_id, task_type in [(publisher, 'published'), (helper, 'applied')]:
+        tasks = database.get_user_tasks(user_id, task_type)
+        total = len(tasks)
+        assert total >= 3, f"{task_type} 任務太少，無法測試分頁"
+        
+        # 逐頁讀取（每頁 2 筆）接起來與一次讀取相同，不重複也不遺漏
+        pages = [database.get_user_tasks(user_id, task_type, limit=2, offset=offset) for offset in range(0, total, 2)]
+        assert [t for page in pages for t in page] == tasks, f"{task_type} 分頁結果與全部不同"
+        assert all(len(page) == 2 for page in pages[:-1]) and len(pages[-1]) == total - 2 * (len(pages) - 1), \
+            f"{task_type} 每頁筆數錯誤"
+        
+        # 邊界：limit=0、offset 到底或超過、limit 大於總數、最後一筆
+        assert database.get_user_tasks(user_id, task_type, limit=0) == [], f"{task_type} limit=0 應回傳空清單"
+        assert database.get_user_tasks(user_id, task_type, offset=total) == [], f"{task_type} offset 到底應回傳空清單"
+        assert database.get_user_tasks(user_id, task_type, limit=5, offset=total + 5) == [], f"{task_type} offset 超過總數"
+        assert database.get_user_tasks(user_id, task_type, limit=total + 5) == tasks, f"{task_type} limit 大於總數"
+        assert database.get_user_tasks(user_id, task_type, limit=5, offset=total - 1) == tasks[-1:], f"{task_type} 最後一筆錯誤"
+        assert list(database.iter_user_tasks(user_id, task_type, limit=3, offset=1, chunk_size=2)) == tasks[1:4], \
+            f"{task_type} 串流分頁結果不同"
+        
+        # 任務狀態篩選：每種狀態的結果都是全部任務的子序列，合起來等於全部
+        by_status = {}
+        for status in ['open', 'in_progress', 'completed', 'cancelled']:
+            by_status[status] = database.get_user_tasks(user_id, task_type, status=status)
+            assert by_status[status] == [t for t in tasks if t['status'] == status], f"{task_type} 狀態 {status} 篩選錯誤"
+        assert sum(len(v) for v in by_status.values()) == total, f"{task_type} 狀態篩選後總數不符"
+        assert by_status['completed'], f"{task_type} 應有已完成任務"
+    
+    # 申請狀態篩選（可與任務狀態同時使用）
+    applied = database.get_user_tasks(helper, 'applied')
+    for application_status in ['pending', 'accepted', 'rejected']:
+        assert database.get_user_tasks(helper, 'applied', application_status=application_status) == \
+            [t for t in applied if t['application_status'] == application_status], f"申請狀態 {application_status} 篩選錯誤"
+    assert database.get_user_tasks(helper, 'applied', status='completed', application_status='accepted', limit=1) == \
+        [t for t in applied if t['status'] == 'completed' and t['application_status'] == 'accepted'][:1], "組合篩選錯誤"
+
+def _check_idempotency(database):
+    """重送同一個冪等鍵回傳第一次的結果，不重複扣點；過期後由清除程序刪除"""
+    from datetime import datetime, timedelta
+    
+    publisher, helper = database.get_all_users()[:2]
+    points_before = database.get_user_by_id(publisher['id'])['points']
+    task_data = {
+        'publisher_id': publisher['id'],
+        'title': '連點測試',
+        'description': '同一個按鈕按了好幾次',
+        'category': '日常支援',
+        'location': '學生餐廳',
+        'campus': publisher['campus'],
+        'points_offered': 10
+    }
+    
+    # 同時送出同一個鍵：只建立一個任務、只扣一次點
+    key = database.new_idempotency_key()
+    outcomes = []
+    _run_concurrently(6, lambda i: database.create_task(task_data, idempotency_key=key), outcomes)
+    assert outcomes[0] and len(set(outcomes)) == 1, f"同一個冪等鍵建立了不同任務: {outcomes}"
+    task_id = outcomes[0]
+    assert database.create_task(task_data, idempotency_key=key) == task_id, "重送冪等鍵未回傳原任務"
+    assert database.get_idempotent_result('create_task', key) == (True, task_id), "查不到冪等鍵記錄的結果"
+    assert database.get_idempotent_result('create_task', database.new_idempotency_key()) == (False, None)
+    assert database.get_user_by_id(publisher['id'])['points'] == points_before - 10, "同一個冪等鍵重複扣點"
+    assert database.create_task(task_data, idempotency_key=database.new_idempotency_key()) != task_id, \
+        "不同冪等鍵應建立新任務"
+    
+    # 申請：重送回傳第一次的成功結果；不帶鍵的重複申請仍然失敗
+    apply_key = database.new_idempotency_key()
+    assert database.apply_for_task(task_id, helper['id'], idempotency_key=apply_key), "申請任務失敗"
+    assert database.apply_for_task(task_id, helper['id'], idempotency_key=apply_key), "重送申請未回傳原結果"
+    assert not database.apply_for_task(task_id, helper['id']), "重複申請應失敗"
+    assert len(database.get_task_applications(task_id)) == 1, "重送申請建立了多筆記錄"
+    
+    # 評價
+    assert database.accept_application(task_id, helper['id'], publisher['id'])
+    assert database.complete_task(task_id, helper['id'])
+    key = database.new_idempotency_key()
+    for _ in range(3):
+        assert database.submit_review(task_id, publisher['id'], helper['id'], 4, '', idempotency_key=key), \
+            "重送評價未回傳原結果"
+    reviews = [r for r in database.get_reviews_for_user(helper['id']) if r['task_id'] == task_id]
+    assert len(reviews) == 1, "重送評價建立了多筆記錄"
+    assert not database.audit_point_ledger(), "冪等重送後點數與帳本不一致"
+    
+    # 過期清除：清除後同一個鍵視為新請求
+    assert database.sweep_idempotency_keys() == 0, "未過期的冪等鍵被清除"
+    assert database.sweep_idempotency_keys(now=datetime.utcnow() + timedelta(days=30)) >= 3, "過期冪等鍵未被清除"
+    assert not database.apply_for_task(task_id, helper['id'], idempotency_key=apply_key), "清除後的冪等鍵仍回傳舊結果"
+
+def _check_outbox(database):
+    """生命週期寫入附加事件；tail 讀取依位移增量處理，回滾的寫入不留下事件"""
+    # 前面的流程（含併發完成、冪等重送）每個任務只留下一筆完成事件，且與任務狀態一致
+    events = database.read_events(0, limit=100000)
+    ids = [e['id'] for e in events]
+    assert ids == list(range(1, len(ids) + 1)), "事件 ID 不連續（併發或回滾後出現空號）"
+    completed = [e['task_id'] for e in events if e['event_type'] == 'task_completed']
+    assert len(completed) == len(set(completed)), "同一任務有多筆完成事件"
+    statuses = {t['id']: t['status'] for t in database.get_all_tasks()}
+    assert completed and all(statuses[task_id] == 'completed' for task_id in completed), "完成事件與任務狀態不一致"
+    assert {'task_created', 'task_applied', 'task_accepted', 'task_completed', 'review_submitted'} <= \
+        {e['event_type'] for e in events}, "缺少生命週期事件"
+    
+    # tail：每批 7 筆跨越多批，讀完後位移停在最後一筆
+    stop_event = threading.Event()
+    seen = []
+    for batch in database.tail_events('test-consumer', batch_size=7, poll_interval=0.01, stop_event=stop_event):
+        seen.extend(e['id'] for e in batch)
+        if seen[-1] == ids[-1]:
+            stop_event.set()
+    assert seen == ids, "tail 讀取的事件與全部事件不同"
+    assert database.get_consumer_offset('test-consumer') == ids[-1], "位移未提交"
+    assert database.fetch_events('test-consumer') == [], "位移之後不應有事件"
+    
+    # 新的寫入只產生新事件；點數不足而回滾的寫入不留下事件
+    publisher = database.get_all_users()[0]
+    task_data = {
+        'publisher_id': publisher['id'],
+        'title': '事件測試',
+        'description': '確認下游能增量讀取',
+        'category': '日常支援',
+        'location': '體育館',
+        'campus': publisher['campus'],
+        'points_offered': 10
+    }
+    task_id = database.create_task(task_data)
+    assert database.create_task(dict(task_data, points_offered=10 ** 9)) is None
+    new_events = database.fetch_events('test-consumer')
+    assert [(e['event_type'], e['task_id']) for e in new_events] == [('task_created', task_id)], \
+        f"新事件不正確: {new_events}"
+    
+    # 清除已處理事件後，新事件的 ID 仍大於位移
+    assert database.prune_outbox_events() == len(ids), "清除已處理事件筆數錯誤"
+    assert database.read_events(0) == new_events, "清除了未處理的事件"
+    
+    # 重建測試資料時，冪等鍵、事件與位移一併清除，事件 ID 從頭編號
+    key = database.new_idempotency_key()
+    assert database.create_task(task_data, idempotency_key=key)
+    database.seed_test_data()
+    assert database.read_events(0) == [] and database.get_consumer_offset('test-consumer') == 0, "重建後仍有舊事件"
+    assert database.get_idempotent_result('create_task', key) == (False, None), "重建後仍有舊冪等鍵"
+    publisher = database.get_all_users()[0]
+    task_id = database.create_task(dict(task_data, publisher_id=publisher['id']))
+    assert [(e['id'], e['task_id']) for e in database.read_events(0)] == [(1, task_id)], "重建後事件 ID 未重設"
+
+def _check_bulk_io(database, tmp_dir):
+    """批次匯入任務（驗證、扣點、帳本）與匯出"""
+    import csv
+    import bulk_io
+    
+    publisher = database.get_all_users()[0]
+    path = os.path.join(tmp_dir, 'club_tasks.csv')
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['publisher_id', 'title', 'description', 'category', 'location', 'campus', 'points_offered', 'start_time', 'end_time'])
+        writer.writerow([publisher['id'], '社團搬器材', '期末成果展', '校園協助', '體育館', '線上', 10, '2026-12-01 18:00', '2026-12-01 20:00'])
+        writer.writerow([publisher['id'], '分類錯誤', '', '不存在的分類', '體育館', '線上', 10, '', ''])
+        writer.writerow([publisher['id'], '點數不足', '', '校園協助', '體育館', '線上', publisher['points'], '', ''])
+    
+    stats = bulk_io.import_tasks(path)
+    assert stats['imported'] == 1 and [row for row, _ in stats['rejected']] == [2, 3], "批次匯入驗證錯誤"
+    assert database.get_user_by_id(publisher['id'])['points'] == publisher['points'] - 10, "批次匯入未扣點"
+    assert not database.audit_point_ledger(), "批次匯入後點數與帳本不一致"
+    
+    tasks = database.get_all_tasks()
+    exported = bulk_io.export_table('tasks', os.path.join(tmp_dir, 'tasks.csv'))
+    assert exported['rows'] == len(tasks), "匯出筆數不正確"
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        return
+    bulk_io.export_table('tasks', os.path.join(tmp_dir, 'tasks.parquet'))
+    assert pq.read_table(os.path.join(tmp_dir, 'tasks.parquet')).num_rows == len(tasks), "Parquet 匯出筆數不正確"
+
+def test_database_backends():
+    """測試資料庫後端（SQLite 與 PostgreSQL 跑同一套流程）"""
+    print("\n🔍 測試 3: 資料庫後端...")
+    
+    import database
+    
+    passed = True
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name, url, cleanup in _backend_urls(tmp_dir):
+            try:
+                database.configure_database(url)
+                _check_task_lifecycle(database)
+                _check_review_statuses(database)
+                _check_user_tasks(database)
+                _check_bulk_io(database, tmp_dir)
+                _check_idempotency(database)
+                _check_outbox(database)
+                print(f"   ✅ {name}: 任務流程（含批次與併發接受、完成、評價）、點數守恆、帳本稽核、批次評價狀態、使用者任務分頁、批次匯入匯出、冪等鍵與事件 outbox")
+            except Exception as e:
+                print(f"   ❌ {name} 測試失敗: {e}")
+                passed = False
+            finally:
+                database.configure_database()
+                if cleanup:
+                    cleanup()
+    
+    return passed
+
+def test_data_generator():
+    """測試合成資料產生器（相同種子產生相同資料）"""
+    print("\n🔍 測試 4: 合成資料產生器...")
+    
+    import database
+    from data_generator import generate_synthetic_data
+    
+    try:
+        snapshots = []
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for run in range(2):
+                database.configure_database(f"sqlite:///{os.path.join(tmp_dir, f'synthetic_{run}.db')}")
+                counts = generate_synthetic_data(num_users=200, num_tasks=1000, seed=7)
+                assert counts['users'] == 200 and counts['tasks'] == 1000, "筆數不正確"
+                assert not database.audit_point_ledger(), "點數與帳本不一致"
+                snapshots.append(database.get_all_tasks())
+            
+            # 清空重建時冪等鍵、事件與位移一併清除，事件 ID 從頭編號（ID 重新編號後不會對到新資料）
+            publisher = database.get_all_users()[0]
+            task_data = {
+                'publisher_id': publisher['id'],
+                'title': '重建前的任務',
+                'description': '重建後不應再被冪等鍵或事件引用',
+                'category': '日常支援',
+                'location': '圖書館',
+                'campus': publisher['campus'],
+                'points_offered': 10
+            }
+            key = database.new_idempotency_key()
+            assert database.create_task(task_data, idempotency_key=key)
+            database.commit_consumer_offset('test-consumer', database.read_events(0)[-1]['id'])
+            generate_synthetic_data(num_users=20, num_tasks=50, seed=7, clear=True)
+            assert database.read_events(0) == [] and database.get_consumer_offset('test-consumer') == 0, "重建後仍有舊事件"
+            assert database.get_idempotent_result('create_task', key) == (False, None), "重建後仍有舊冪等鍵"
+            task_id = database.create_task(dict(task_data, publisher_id=database.get_all_users()[0]['id']))
+            assert [(e['id'], e['task_id']) for e in database.read_events(0)] == [(1, task_id)], "重建後事件 ID 未重設"
+            database.configure_database()
+        
+        assert snapshots[0] == snapshots[1], "相同種子產生的資料不同"
+        print(f"   ✅ 產生 {counts['users']} 位使用者、{counts['tasks']} 個任務、"
+              f"{counts['task_applications']} 筆申請")
+        print("   ✅ 相同種子可重現，清空重建時一併清除冪等鍵與事件")
+        return True
+    except Exception as e:
+        print(f"   ❌ 合成資料測試失敗: {e}")
+        database.configure_database()
+        return False
+
 def test_matching_engine():
     """測試媒合引擎"""
-    print("\n🔍 測試 3: 媒合引擎...")
+    print("\n🔍 測試 5: 媒合引擎...")
     
     try:
         from matching_engine import MatchingEngine
@@ -123,6 +630,74 @@ def test_matching_engine():
         print(f"      - 評價: {result['rating_score']:.2%}")
         print(f"      - 地點: {result['location_score']:.2%}")
         
+        # 同義詞：使用者填 "PS" 等同具備「設計」技能
+        design_task = dict(task, title='海報設計', description='需要美編', category='技能交換')
+        synonym_score = engine._calculate_skill_score(dict(user, skills=['PS']), design_task)
+        assert synonym_score == engine._calculate_skill_score(dict(user, skills=['設計']), design_task) > 0.3, "技能同義詞未生效"
+        print(f"   ✅ 技能同義詞: PS → 設計 ({synonym_score:.0%})")
+        
+        # 時段媒合：任務時間與使用者每週有空時段的重疊比例（2026-10-19 為週一）
+        import availability
+        evening_user = dict(user, availability=availability.mask_from_windows([(0, 18, 22)]))
+        evening_task = dict(task, start_time='2026-10-19 19:00', end_time='2026-10-19 21:00')
+        morning_task = dict(task, start_time='2026-10-19 09:00', end_time='2026-10-19 10:00')
+        partial_task = dict(task, start_time='2026-10-19 17:00', end_time='2026-10-19 19:00')
+        assert engine._calculate_time_score(evening_user, evening_task) == 1.0, "有空時段內的任務應為滿分"
+        assert engine._calculate_time_score(evening_user, morning_task) == 0.3, "沒空的時段分數應最低"
+        assert abs(engine._calculate_time_score(evening_user, partial_task) - 0.65) < 1e-9, "部分重疊應依比例給分"
+        assert engine._calculate_time_score(user, evening_task) == 1.0, "未設定有空時段時不比對"
+        starts, lengths = zip(*(availability.task_interval(t['start_time'], t['end_time'])
+                                for t in (evening_task, morning_task, partial_task)))
+        vectorized = availability.time_scores(availability.mask_array(evening_user['availability']), starts, lengths, [False] * 3)
+        expected = [engine._calculate_time_score(evening_user, t) for t in (evening_task, morning_task, partial_task)]
+        assert list(vectorized) == expected, "向量化時間分數與逐筆計算不同"
+        print("   ✅ 時段媒合: 有空 100% / 沒空 30% / 部分重疊 65%")
+        
+        # 語意媒合：換句話說的任務（不含「攝影」關鍵字）語意分數高於無關任務，開啟後依權重重新歸一化
+        import semantic
+        photo_task = dict(task, title='幫忙拍畢業照', description='想找人拍幾張照片', category='校園協助')
+        other_task = dict(task, title='代購午餐', description='幫忙買便當', category='日常支援')
+        assert engine._calculate_semantic_score(user, photo_task) > engine._calculate_semantic_score(user, other_task), "語意分數未區分相關任務"
+        semantic_engine = MatchingEngine()
+        semantic_engine.WEIGHTS = dict(engine.WEIGHTS, semantic=0.2)
+        blended = semantic_engine.calculate_match_score(user, photo_task)
+        assert 0 <= blended['total_score'] <= 1 and '語意相似' in blended['breakdown'], "語意分數未加入總分"
+        print(f"   ✅ 語意相似: 幫忙拍畢業照 {blended['semantic_score']:.0%}")
+        
+        # 有寫入時存下的向量就直接使用（維度不同才當場計算）
+        stored = dict(photo_task, embedding=semantic.to_blob(semantic.task_vector(other_task)))
+        assert engine._calculate_semantic_score(user, stored) == engine._calculate_semantic_score(user, other_task), \
+            "未使用存下的任務向量"
+        wrong_dim = dict(photo_task, embedding=semantic.to_blob([1.0, 0.0]))
+        assert engine._calculate_semantic_score(user, wrong_dim) == engine._calculate_semantic_score(user, photo_task), \
+            "維度不同的向量應改為當場計算"
+        
+        # 向量索引：IVF 搜尋到的第一筆與暴力搜尋相同
+        texts = ['幫忙拍畢業照', '海報設計', '教微積分解題', 'Python 作業討論', '代購午餐', '陪同就醫'] * 5
+        vectors = [semantic.embed_text(f"{text} #{i}") for i, text in enumerate(texts)]
+        query = semantic.user_vector(['攝影'])
+        brute = semantic.VectorIndex(range(len(texts)), vectors, n_lists=0)
+        ivf = semantic.VectorIndex(range(len(texts)), vectors, n_lists=4)
+        assert [i for i, _ in brute.search(query, k=3)] == [i for i, _ in ivf.search(query, k=3, nprobe=4)], "IVF 搜尋結果與暴力搜尋不同"
+        assert all(texts[i] == '幫忙拍畢業照' for i, _ in brute.search(query, k=3)), "向量索引找不到最相關的任務"
+        print("   ✅ 向量索引: 暴力搜尋 / IVF 結果一致")
+
+        # Top-K：generator 輸入，結果與完整排序後取前 K 筆相同（同分依輸入順序）
+        candidates = [dict(task, id=i, title=title, description=title) for i, title in enumerate(texts)]
+        full = sorted(((engine.calculate_match_score(user, t)['total_score'], t['id']) for t in candidates),
+                      key=lambda item: item[0], reverse=True)
+        top = engine.get_top_recommendations(user, (t for t in candidates), top_n=5)
+        assert [rec['task']['id'] for rec in top] == [task_id for _, task_id in full[:5]], "Top-K 與完整排序結果不同"
+        print("   ✅ Top-K 推薦與完整排序一致")
+        
+        # 向量索引取候選：只對語意最近鄰計分，索引建立後才新增的任務（最後一筆）仍會計分
+        indexed = candidates[:-1]
+        index = semantic.VectorIndex([t['id'] for t in indexed], [semantic.task_vector(t) for t in indexed], n_lists=0)
+        shortlist = {task_id for task_id, _ in index.search(semantic.user_vector(user['skills']), k=4)}
+        top = engine.get_top_recommendations(user, candidates, top_n=len(candidates), candidate_index=index, candidates=4)
+        assert {rec['task']['id'] for rec in top} == shortlist | {candidates[-1]['id']}, "向量索引候選篩選錯誤"
+        print("   ✅ 向量索引取候選後計分")
+
         return True
     except Exception as e:
         print(f"   ❌ 媒合引擎測試失敗: {e}")
@@ -130,9 +705,305 @@ def test_matching_engine():
         traceback.print_exc()
         return False
 
+def test_recommendation_worker():
+    """測試推薦清單（背景增量更新、夜間批次媒合都與逐筆計分結果一致）"""
+    print("\n🔍 測試 6: 推薦清單背景更新...")
+    
+    import database
+    from data_generator import generate_synthetic_data
+    from matching_engine import MatchingEngine
+    from recommendation_worker import RecommendationWorker
+    
+    def assert_lists_match(users):
+        open_tasks = database.get_all_tasks(status='open')
+        for user in users:
+            user = database.get_user_by_id(user['id'])
+            expected = [rec['task']['id'] for rec in MatchingEngine().get_top_recommendations(user, open_tasks, 5)]
+            actual = [rec['task']['id'] for rec in database.get_recommendations(user['id'], limit=5)]
+            assert expected == actual, f"使用者 {user['id']} 的推薦清單不一致"
+    
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            database.configure_database(f"sqlite:///{os.path.join(tmp_dir, 'recommendations.db')}")
+            generate_synthetic_data(num_users=100, num_tasks=300, seed=11)
+            users = database.get_all_users()
+            worker = RecommendationWorker(top_k=5)
+            
+            stats = worker.refresh()
+            assert stats['users_recomputed'] == len(users), "首次更新應整份計算"
+            assert_lists_match(users[:20])
+            print(f"   ✅ 整份計算 {stats['users']} 位使用者（{stats['scores_per_second']} 次計分/秒）")
+            
+            # 過期的清單（待重算、超過最長保存時間）不使用，呼叫端改為即時計分
+            from config import Config
+            user_id = users[1]['id']
+            session = database.Session()
+            database._mark_recommendations_stale(session, [user_id])
+            session.commit()
+            session.close()
+            assert database.get_recommendations(user_id) == [], "待重算的清單不應被使用"
+            worker.refresh()
+            assert database.get_recommendations(user_id), "重算後應使用清單"
+            max_age = Config.RECOMMENDATION_MAX_AGE
+            Config.RECOMMENDATION_MAX_AGE = 0
+            try:
+                assert database.get_recommendations(user_id) == [], "超過最長保存時間的清單不應被使用"
+            finally:
+                Config.RECOMMENDATION_MAX_AGE = max_age
+            
+            # 新任務只併入、已關閉的任務觸發重算
+            publisher = users[0]
+            database.create_task({
+                'publisher_id': publisher['id'],
+                'title': '協助拍照與設計海報',
+                'description': '需要攝影與 photoshop 美編',
+                'category': '技能交換',
+                'location': '圖書館',
+                'campus': publisher['campus'],
+                'points_offered': 10
+            })
+            top_task_id = database.get_recommendations(users[1]['id'])[0]['task']['id']
+            session = database.Session()
+            session.query(database.Task).filter_by(id=top_task_id).update({'status': 'in_progress'})
+            session.commit()
+            session.close()
+            
+            stats = worker.refresh()
+            assert stats['users_merged'] > 0 and stats['users_recomputed'] < len(users), "應只增量更新"
+            assert stats['staleness']['stale_users'] == 0, "更新後不應有待重算的使用者"
+            assert_lists_match(users[:20])
+            print(f"   ✅ 增量更新: 重算 {stats['users_recomputed']} 位、併入 {stats['users_merged']} 位")
+            
+            # 更新失敗時輸出與成功時同樣格式的結構化 log（只匯入模組不設定 log handler）
+            import json
+            import logging
+            worker_logger = logging.getLogger('campus_help.recommendations')
+            if not Config.RECOMMENDATION_WORKER:
+                assert not worker_logger.handlers, "匯入模組時不應設定 log handler"
+            records = []
+            capture = logging.Handler()
+            capture.emit = records.append
+            worker_logger.addHandler(capture)
+            stop_event = threading.Event()
+            failing = RecommendationWorker(top_k=5)
+            def refresh_and_fail():
+                stop_event.set()
+                raise RuntimeError('資料庫離線')
+            failing.refresh = refresh_and_fail
+            try:
+                failing.run_forever(interval=0.01, stop_event=stop_event)
+            finally:
+                worker_logger.removeHandler(capture)
+            entry = json.loads(records[-1].getMessage())
+            assert records[-1].levelno == logging.ERROR and records[-1].exc_info, "更新失敗應以 error 等級記錄例外"
+            assert entry['event'] == 'recommendation_refresh' and entry['status'] == 'error' and \
+                entry['error'] == '資料庫離線' and entry['staleness']['users'] == len(users), f"失敗 log 格式錯誤: {entry}"
+            
+            # 夜間批次媒合（多行程向量化計分）與逐筆計分結果相同
+            from batch_scoring import run_batch
+            stats = run_batch(workers=2)
+            assert stats['users'] == len(users), "批次媒合使用者數不正確"
+            assert_lists_match(users[:20])
+            print(f"   ✅ 批次媒合: {stats['pairs']} 組（{stats['pairs_per_second']} 組/秒）")
+            
+            # 特徵存檔以 mmap 載入後結果相同
+            from feature_store import FeatureStore
+            features_path = os.path.join(tmp_dir, 'features')
+            FeatureStore.from_database().save(features_path)
+            stats = run_batch(workers=2, features=features_path)
+            assert_lists_match(users[:20])
+            print(f"   ✅ 特徵存檔（mmap）: {stats['feature_bytes'] / 1024:.1f} KB")
+            
+            # 媒合設定檔修改後熱重新載入，清單依新版本整份重算；不合法的設定不會被套用
+            import matching_config
+            config_path = os.path.join(tmp_dir, 'matching_config.json')
+            watcher = matching_config.ConfigWatcher(config_path)
+            old_version = matching_config.current().version
+            with open(config_path, 'w', encoding='utf-8') as f:
+                json.dump({'weights': {'skill': 0.7, 'time': 0.1, 'rating': 0.1, 'location': 0.1},
+                           'skill_keywords': {'攝影': ['攝影', '拍照', '相機', '照片', '畢業照']}}, f)
+            assert watcher.check() and matching_config.current().version != old_version, "設定檔未重新載入"
+            assert MatchingEngine().WEIGHTS['skill'] == 0.7, "既有設定未被替換"
+            assert database.get_recommendations(users[1]['id']) == [], "設定版本不同的清單不應被使用"
+            stats = worker.refresh()
+            assert stats['users_recomputed'] == len(users), "設定版本變更後應整份重算"
+            assert_lists_match(users[:20])
+            
+            new_version = matching_config.current().version
+            with open(config_path, 'w', encoding='utf-8') as f:
+                json.dump({'weights': {'skill': -1}}, f)
+            assert not watcher.check() and matching_config.current().version == new_version, "不合法的設定不應套用"
+            print(f"   ✅ 媒合設定熱重新載入: {old_version} → {new_version}")
+            
+            os.remove(config_path)
+            watcher.check()
+            assert matching_config.current().version == old_version, "刪除設定檔後應回到預設值"
+            database.configure_database()
+        
+        return True
+    except Exception as e:
+        print(f"   ❌ 推薦清單測試失敗: {e}")
+        database.configure_database()
+        return False
+
+def test_evaluation():
+    """測試離線評估（歷史申請重播、指標計算、多行程格狀搜尋）"""
+    print("\n🔍 測試 7: 離線評估...")
+    
+    import database
+    import evaluation
+    from data_generator import generate_synthetic_data
+    
+    try:
+        # 指標：相關任務排第一為滿分，完全沒排到為 0
+        assert evaluation.ranking_metrics([1, 2, 3], {1: 2}, k=1) == (1.0, 1.0, 1.0), "完美排序應為滿分"
+        assert evaluation.ranking_metrics([2, 3, 1], {1: 2}, k=2)[:2] == (0.0, 0.0), "未進前 K 名應為 0"
+        assert evaluation.ranking_metrics([2, 3, 1], {1: 2}, k=2)[2] == 1 / 3, "MRR 應取第一個相關任務的名次"
+        
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            database.configure_database(f"sqlite:///{os.path.join(tmp_dir, 'history.db')}")
+            generate_synthetic_data(num_users=60, num_tasks=200, seed=5)
+            snapshot_path = os.path.join(tmp_dir, 'snapshot.db')
+            counts = evaluation.snapshot_database(snapshot_path)
+            assert counts['tasks'] == 200, "快照筆數不正確"
+            database.configure_database()
+            
+            grid = evaluation.weight_grid({'skill': [0.2, 0.6]})
+            results = evaluation.grid_search(snapshot_path, grid, workers=2, k=5)
+            assert len(results) == 2 and results[0]['queries'] > 0, "應評估每組權重"
+            for result in results:
+                assert all(0 <= result[key] <= 1 for key in ('precision@5', 'ndcg@5', 'mrr')), "指標超出範圍"
+            assert results[0]['ndcg@5'] >= results[1]['ndcg@5'], "結果應依 NDCG 排序"
+        
+        best = results[0]
+        print(f"   ✅ {best['queries']} 個查詢: P@5 {best['precision@5']:.3f}、NDCG@5 {best['ndcg@5']:.3f}、"
+              f"MRR {best['mrr']:.3f}（{best['pairs_per_second']} 組/秒）")
+        return True
+    except Exception as e:
+        print(f"   ❌ 離線評估測試失敗: {e}")
+        database.configure_database()
+        return False
+
+def test_tracing():
+    """測試頁面效能追蹤（階段彙總、Prometheus 輸出、輸出節流）"""
+    print("\n🔍 測試 8: 頁面效能追蹤...")
+    
+    import tracing
+    from config import Config
+    
+    tracing_enabled = Config.TRACING
+    try:
+        Config.TRACING = True
+        tracing.registry.reset()
+        for _ in range(3):
+            tracing.start_page('home')
+            with tracing.span('data_fetch'):
+                with tracing.span('matching'):
+                    time.sleep(0.002)
+            tracing.end_page(export=False)
+        
+        stats = tracing.registry.snapshot()
+        assert stats[('home', 'data_fetch')]['count'] == 3 and stats[('home', 'matching')]['count'] == 3, "階段次數錯誤"
+        page = stats[('home', tracing.PAGE_SPAN)]
+        assert page['sum'] >= stats[('home', 'data_fetch')]['sum'] >= stats[('home', 'matching')]['sum'] > 0, \
+            "巢狀階段耗時應包含在外層"
+        # 巢狀的子階段不重複扣除：元件渲染 = 頁面總耗時 - 最外層階段
+        widget = stats[('home', tracing.SELF_SPAN)]['sum']
+        assert abs(page['sum'] - stats[('home', 'data_fetch')]['sum'] - widget) < 1e-3, "元件渲染耗時計算錯誤"
+        assert page['p50'] <= page['p95'] <= page['p99'], "分位數順序錯誤"
+        
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'traces.prom')
+            tracing.registry.export_prometheus(path)
+            with open(path, encoding='utf-8') as f:
+                lines = f.read().splitlines()
+            metric = 'campus_help_span_duration_seconds'
+            assert f"# TYPE {metric} summary" in lines, "缺少 TYPE 宣告"
+            assert f'{metric}_count{{page="home",span="data_fetch"}} 3' in lines, "缺少 count"
+            assert any(line.startswith(f'{metric}{{page="home",span="matching",quantile="0.99"}} ') for line in lines), \
+                "缺少分位數"
+            
+            # 節流：間隔內只輸出一次；多執行緒同時輸出不會互相覆蓋暫存檔
+            tracing.registry._last_export = None
+            assert tracing.registry.export_if_due(path, interval=60)
+            assert not tracing.registry.export_if_due(path, interval=60), "間隔內不應重複輸出"
+            threads = [threading.Thread(target=tracing.registry.export_prometheus, args=(path,)) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            assert os.listdir(tmp_dir) == ['traces.prom'], f"留下暫存檔: {os.listdir(tmp_dir)}"
+        
+        print(f"   ✅ 階段彙總（p50 {page['p50'] * 1000:.1f} ms）、Prometheus 輸出與節流")
+        return True
+    except Exception as e:
+        print(f"   ❌ 頁面效能追蹤測試失敗: {e}")
+        return False
+    finally:
+        Config.TRACING = tracing_enabled
+        tracing.registry.reset()
+
+def test_query_profiler():
+    """測試 SQL 查詢分析（最慢查詢、重複 SQL 與完全相同的查詢）"""
+    print("\n🔍 測試 9: SQL 查詢分析...")
+    
+    import logging
+    import database
+    import query_profiler
+    from config import Config
+    
+    try:
+        # 最慢查詢只保留 N 筆、由慢到快
+        profiler = query_profiler.QueryProfiler('unit', slow_query_limit=2, repeat_threshold=3)
+        for duration in [0.1, 0.3, 0.2, 0.05]:
+            profiler.record('SELECT 1', (), duration)
+        summary = profiler.summary()
+        assert [q['duration_ms'] for q in summary['slowest']] == [300.0, 200.0], "最慢查詢排序或筆數錯誤"
+        assert summary['repeated'] == [{'statement': 'SELECT 1', 'count': 4}], "重複 SQL 統計錯誤"
+        assert summary['duplicates'][0]['count'] == 4 and summary['db_time_ms'] == 650.0, "相同查詢統計錯誤"
+        
+        # 只匯入模組不設定 log 輸出；掛載到引擎時才設定
+        sql_logger = logging.getLogger('campus_help.sql')
+        if not Config.SQL_PROFILING:
+            assert not sql_logger.handlers, "匯入模組時不應設定 log handler"
+        
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            try:
+                database.configure_database(f"sqlite:///{os.path.join(tmp_dir, 'profiler_test.db')}")
+                query_profiler.attach(database.engine)
+                assert sql_logger.handlers, "掛載後應設定 log handler"
+                database.init_db()
+                database.seed_test_data()
+                user_ids = [u['id'] for u in database.get_all_users()]
+                
+                # 每位使用者各查兩次：同一條 SQL 不同參數（N+1），且每組參數重複一次
+                query_profiler.start_request('profiled_block')
+                for _ in range(2):
+                    for user_id in user_ids:
+                        database.get_user_by_id(user_id)
+                summary = query_profiler.end_request(log=False)
+            finally:
+                database.configure_database()
+        
+        assert query_profiler.end_request() is None, "請求結束後不應再有 profiler"
+        assert summary['label'] == 'profiled_block' and summary['statement_count'] >= 2 * len(user_ids), "查詢數錯誤"
+        top = summary['repeated'][0]
+        assert 'FROM users' in top['statement'] and top['count'] >= 2 * len(user_ids), f"未偵測到重複 SQL: {summary['repeated']}"
+        assert len([d for d in summary['duplicates'] if d['statement'] == top['statement']]) == len(user_ids), \
+            "未偵測到完全相同的查詢"
+        durations = [q['duration_ms'] for q in summary['slowest']]
+        assert 0 < len(durations) <= Config.SQL_PROFILING_SLOW_LIMIT and durations == sorted(durations, reverse=True), \
+            "最慢查詢排序錯誤"
+        
+        print(f"   ✅ {summary['statement_count']} 個查詢，重複 SQL {top['count']} 次，完全相同 {len(user_ids)} 組")
+        return True
+    except Exception as e:
+        print(f"   ❌ SQL 查詢分析測試失敗: {e}")
+        return False
+
 def test_ai_service():
     """測試 AI 服務"""
-    print("\n🔍 測試 4: AI 服務...")
+    print("\n🔍 測試 10: AI 服務...")
     
     try:
         from ai_service import AIService
@@ -168,7 +1039,13 @@ def main():
     tests = [
         ("模組匯入", test_imports),
         ("資料庫功能", test_database),
+        ("資料庫後端", test_database_backends),
+        ("合成資料", test_data_generator),
         ("媒合引擎", test_matching_engine),
+        ("推薦清單", test_recommendation_worker),
+        ("離線評估", test_evaluation),
+        ("效能追蹤", test_tracing),
+        ("SQL 查詢分析", test_query_profiler),
         ("AI 服務", test_ai_service),
     ]
     
@@ -0,0 +1,220 @@
+"""
+頁面效能追蹤模組 - Campus Help
+為每個頁面的各階段（資料讀取、媒合、AI 呼叫、圖表建立、元件渲染）計時，
+彙總成 p50 / p95 / p99，並以 Prometheus 文字格式輸出到本機檔案
+
+使用方式:
+    TRACING=1 streamlit run app.py
+
+    tracing.start_page('home')
+    with tracing.span('data_fetch'):
+        tasks = get_all_tasks()
+    tracing.end_page()   # 記錄 page_render 與 widget_render，並輸出檔案
+"""
+import math
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from config import Config
+
+# 頁面總耗時扣掉各子階段後，剩下的時間歸為元件渲染
+PAGE_SPAN = 'page_render'
+SELF_SPAN = 'widget_render'
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+_current_page = ContextVar('campus_help_page_trace', default=None)
+
+
+class SpanStats:
+    """單一 (頁面, 階段) 的耗時統計；保留最近的樣本計算分位數"""
+
+    def __init__(self, sample_limit):
+        self.count = 0
+        self.total = 0.0
+        self.samples = deque(maxlen=sample_limit)
+
+    def add(self, duration):
+        self.count += 1
+        self.total += duration
+        self.samples.append(duration)
+
+    def quantile(self, q):
+        """最近樣本的分位數（nearest-rank）"""
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))
+        return ordered[index]
+
+
+class TraceRegistry:
+    """跨 Session 共用的耗時彙總（Streamlit 伺服器行程內）"""
+
+    def __init__(self, sample_limit=None):
+        self.sample_limit = sample_limit or Config.TRACE_SAMPLE_LIMIT
+        self._stats = {}
+        self._lock = threading.Lock()
+        self._last_export = None
+
+    def record(self, page, name, duration):
+        with self._lock:
+            stats = self._stats.get((page, name))
+            if stats is None:
+                stats = self._stats[(page, name)] = SpanStats(self.sample_limit)
+            stats.add(duration)
+
+    def snapshot(self):
+        """
+        取得目前統計
+
+        Returns:
+            dict: {(page, span): {'count', 'sum', 'p50', 'p95', 'p99'}}（秒）
+        """
+        with self._lock:
+            return {
+                key: {
+                    'count': stats.count,
+                    'sum': stats.total,
+                    'p50': stats.quantile(0.5),
+                    'p95': stats.quantile(0.95),
+                    'p99': stats.quantile(0.99)
+                }
+                for key, stats in self._stats.items()
+            }
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+    def export_prometheus(self, path=None):
+        """
+        以 Prometheus 文字格式（summary）寫入檔案
+
+        Args:
+            path: 輸出路徑（預設 Config.TRACE_EXPORT_PATH）
+
+        Returns:
+            str: 輸出路徑
+        """
+        path = path or Config.TRACE_EXPORT_PATH
+        metric = 'campus_help_span_duration_seconds'
+        lines = [
+            f"# HELP {metric} Streamlit 頁面各階段耗時",
+            f"# TYPE {metric} summary"
+        ]
+        for (page, name), stats in sorted(self.snapshot().items()):
+            labels = f'page="{page}",span="{name}"'
+            for q in QUANTILES:
+                lines.append(f'{metric}{{{labels},quantile="{q}"}} {stats[f"p{int(q * 100)}"]:.6f}')
+            lines.append(f"{metric}_sum{{{labels}}} {stats['sum']:.6f}")
+            lines.append(f"{metric}_count{{{labels}}} {stats['count']}")
+
+        # 先寫暫存檔再取代，讀取端不會看到寫到一半的檔案；
+        # 每次使用不同的暫存檔，多個 Session 同時輸出不會互相覆蓋
+        directory, name = os.path.split(os.path.abspath(path))
+        with tempfile.NamedTemporaryFile('w', encoding='utf-8', dir=directory, prefix=f".{name}.",
+                                         suffix='.tmp', delete=False) as f:
+            f.write('\n'.join(lines) + '\n')
+        try:
+            os.replace(f.name, path)
+        except OSError:
+            os.unlink(f.name)
+            raise
+        return path
+
+    def export_if_due(self, path=None, interval=None):
+        """
+        距離上次輸出超過間隔才輸出（每次頁面渲染都會呼叫，避免每次都重寫檔案）
+
+        Args:
+            path: 輸出路徑（預設 Config.TRACE_EXPORT_PATH）
+            interval: 最短間隔秒數（預設 Config.TRACE_EXPORT_INTERVAL）
+
+        Returns:
+            bool: 是否有輸出
+        """
+        interval = Config.TRACE_EXPORT_INTERVAL if interval is None else interval
+        now = time.monotonic()
+        with self._lock:
+            if self._last_export is not None and now - self._last_export < interval:
+                return False
+            self._last_export = now
+        self.export_prometheus(path)
+        return True
+
+
+registry = TraceRegistry()
+
+
+class _PageTrace:
+    """進行中的頁面追蹤"""
+
+    def __init__(self, page):
+        self.page = page
+        self.started_at = time.perf_counter()
+        self.child_time = 0.0
+        self.depth = 0
+
+
+# ========== 追蹤 API ==========
+
+def start_page(page):
+    """開始追蹤一次頁面渲染"""
+    if not Config.TRACING:
+        return
+    _current_page.set(_PageTrace(page))
+
+
+@contextmanager
+def span(name):
+    """
+    追蹤頁面內的一個階段
+
+    Args:
+        name: 階段名稱，例如 data_fetch、matching、ai_call、plotly_build
+    """
+    trace = _current_page.get()
+    if trace is None:
+        yield
+        return
+
+    trace.depth += 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - start
+        trace.depth -= 1
+        registry.record(trace.page, name, duration)
+        # 巢狀的子階段已包含在外層，只累計最外層
+        if trace.depth == 0:
+            trace.child_time += duration
+
+
+def end_page(export=True):
+    """
+    結束頁面追蹤，記錄總耗時與元件渲染耗時
+
+    Args:
+        export: 是否輸出 Prometheus 檔案（距離上次輸出未滿 TRACE_EXPORT_INTERVAL 秒時略過）
+    """
+    trace = _current_page.get()
+    if trace is None:
+        return
+    _current_page.set(None)
+
+    total = time.perf_counter() - trace.started_at
+    registry.record(trace.page, PAGE_SPAN, total)
+    registry.record(trace.page, SELF_SPAN, max(0.0, total - trace.child_time))
+
+    if export:
+        try:
+            registry.export_if_due()
+        except OSError as e:
+            print(f"輸出追蹤資料失敗: {e}")